@@ -7,3 +7,7 @@ cython -o gevent.ares.c src\gevent\ares.pyx
 move gevent.ares.* src\gevent
 cython -o gevent._semaphore.c src\gevent\_semaphore.py
 move gevent._semaphore.* src\gevent
+cython -o gevent._wsgiparser.c src\gevent\_wsgiparser.py
+move gevent._wsgiparser.* src\gevent
+cython -o gevent._websocket.c src\gevent\_websocket.py
+move gevent._websocket.* src\gevent
@@ -7,3 +7,5 @@ $PYTHON -mtimeit -r 6 -s'from gevent import get_hub; from gevent.hub import xran
 $PYTHON -mtimeit -r 6 -s'from gevent import wait,get_hub; from gevent.hub import xrange; run_cb = get_hub().loop.run_callback; f = lambda : 5' 'for _ in xrange(100): run_cb(f)' 'wait()'
 $PYTHON -mtimeit -r 6 -s'from gevent import get_hub; from gevent.hub import xrange; run_cb = get_hub().loop.run_callback; f = lambda : 5' 'for _ in xrange(10000): run_cb(f)'
 $PYTHON -mtimeit -r 6 -s'from gevent import wait,get_hub; from gevent.hub import xrange; run_cb = get_hub().loop.run_callback; f = lambda : 5' 'for _ in xrange(10000): run_cb(f)' 'wait()'
+$PYTHON -mtimeit -r 6 -s'from gevent import wait,get_hub; from gevent.hub import xrange; run_cb = get_hub().loop.run_callback; f = lambda : 5' 'for _ in xrange(10000): run_cb(f).stop()' 'wait()'
+$PYTHON -mtimeit -r 6 -s'from gevent import sleep' 'sleep(0)'
@@ -0,0 +1,29 @@
+#!/usr/bin/python
+"""WebSocket echo server example
+
+Try it from a browser's console with
+
+    ws = new WebSocket('ws://localhost:8088/');
+    ws.onmessage = function (e) { console.log(e.data); };
+    ws.send('hello');
+"""
+from __future__ import print_function
+from gevent.pywsgi import WSGIServer
+
+
+def application(env, start_response):
+    ws = env.get('wsgi.websocket')
+    if ws is None:
+        start_response('400 Bad Request', [('Content-Type', 'text/plain')])
+        return [b'Expected a WebSocket request']
+    while True:
+        message = ws.receive()
+        if message is None:
+            break
+        ws.send(message)
+    return []
+
+
+if __name__ == '__main__':
+    print('Serving on 8088...')
+    WSGIServer(('', 8088), application, websocket=True).serve_forever()
@@ -57,10 +57,18 @@ from _setupares import ARES
 SEMAPHORE = Extension(name="gevent._semaphore",
                       sources=["src/gevent/gevent._semaphore.c"])
 
+WSGIPARSER = Extension(name="gevent._wsgiparser",
+                       sources=["src/gevent/gevent._wsgiparser.c"])
+
+WEBSOCKET = Extension(name="gevent._websocket",
+                      sources=["src/gevent/gevent._websocket.c"])
+
 EXT_MODULES = [
     CORE,
     ARES,
     SEMAPHORE,
+    WSGIPARSER,
+    WEBSOCKET,
 ]
 
 cffi_modules = ['src/gevent/libev/_corecffi_build.py:ffi']
@@ -70,6 +78,8 @@ if PYPY:
     setup_requires = []
     EXT_MODULES.remove(CORE)
     EXT_MODULES.remove(SEMAPHORE)
+    EXT_MODULES.remove(WSGIPARSER)
+    EXT_MODULES.remove(WEBSOCKET)
     # By building the semaphore with Cython under PyPy, we get
     # atomic operations (specifically, exiting/releasing), at the
     # cost of some speed (one trivial semaphore micro-benchmark put the pure-python version
@@ -144,6 +154,10 @@ def run_setup(ext_modules, run_make):
         ext_modules=ext_modules,
         cmdclass=dict(build_ext=ConfiguringBuildExt, sdist=MakeSdist),
         install_requires=install_requires,
+        extras_require={
+            # For WSGIServer(http2=True)
+            'http2': ['h2 >= 3.0'],
+        },
         setup_requires=setup_requires,
         # It's always safe to pass the CFFI keyword, even if
         # cffi is not installed: it's just ignored in that case.
@@ -0,0 +1,537 @@
+# Copyright (c) 2016 gevent contributors. See LICENSE for details.
+"""
+HTTP/2 (:rfc:`7540`) for :mod:`gevent.pywsgi`, used when a
+:class:`~gevent.pywsgi.WSGIServer` is created with ``http2=True``.
+
+The framing, HPACK and flow control bookkeeping are done by the `h2
+<https://python-hyper.org/h2/>`_ package, which must be installed;
+this module connects it to gevent sockets and runs each stream's
+request in its own greenlet with a
+:class:`~gevent.pywsgi.WSGIHandler`. If the server has a pool, those
+greenlets come from it, and a stream that arrives while the pool is
+full (or the server is stopping) is refused.
+"""
+from __future__ import absolute_import
+
+import errno
+import sys
+from collections import deque
+from functools import partial
+
+from gevent import socket
+from gevent.event import Event
+from gevent.lock import Semaphore
+from gevent.pool import Group
+from gevent.pywsgi import WSGIHandler
+from gevent.pywsgi import unquote_latin1
+from gevent._compat import PY3
+
+try:
+    from h2.config import H2Configuration
+    from h2.connection import H2Connection
+    from h2.errors import ErrorCodes
+    from h2.exceptions import ProtocolError
+    from h2.settings import SettingCodes
+    import h2.events
+except ImportError:
+    H2Configuration = None
+
+__all__ = [
+    'HTTP2Connection',
+]
+
+# The start of the client preface, which an HTTP/1 handler reads as a
+# request line.
+PREFACE_LINE = 'PRI * HTTP/2.0\r\n'
+
+# Not allowed in HTTP/2 responses (RFC 7540 8.1.2.2)
+_CONNECTION_HEADERS = frozenset((b'connection', b'keep-alive', b'proxy-connection',
+                                 b'transfer-encoding', b'upgrade'))
+
+_READ_SIZE = 65536
+
+
+def available():
+    """Is the h2 package installed?"""
+    return H2Configuration is not None
+
+
+def _stream_reset():
+    # Writing to a stream the client has reset is like writing to a
+    # closed connection, and WSGIHandler quietly gives up in that case.
+    return socket.error(errno.ECONNRESET, 'HTTP/2 stream reset')
+
+
+class _StreamInput(object):
+    # wsgi.input for one stream: the DATA frames the connection
+    # receives, given back to the client's flow control window as the
+    # application reads them.
+
+    def __init__(self, connection, stream_id):
+        self._connection = connection
+        self._stream_id = stream_id
+        self._chunks = deque()
+        self._event = Event()
+        self._ended = False
+        self._reset = False
+        self._discarded = False
+
+    def _feed(self, data):
+        if self._discarded:
+            self._connection.acknowledge(self._stream_id, len(data))
+            return
+        self._chunks.append(data)
+        self._event.set()
+
+    def _end(self, reset=False):
+        self._ended = True
+        self._reset = reset
+        self._event.set()
+
+    def _wait(self):
+        # Wait until there is data or the body has ended
+        while not self._chunks and not self._ended:
+            self._event.clear()
+            self._event.wait()
+        if self._reset:
+            raise IOError("HTTP/2 stream reset while reading request")
+
+    def _take(self, size):
+        # Return up to *size* (or all, if None) bytes from the first chunk
+        chunk = self._chunks[0]
+        if size is None or size >= len(chunk):
+            self._chunks.popleft()
+        else:
+            self._chunks[0] = chunk[size:]
+            chunk = chunk[:size]
+        self._connection.acknowledge(self._stream_id, len(chunk))
+        return chunk
+
+    def read(self, length=None):
+        if length is not None and length < 0:
+            length = None
+        result = []
+        while length is None or length > 0:
+            self._wait()
+            if not self._chunks:
+                break
+            data = self._take(length)
+            result.append(data)
+            if length is not None:
+                length -= len(data)
+        return b''.join(result)
+
+    def readinto(self, buf):
+        view = memoryview(buf)
+        total = 0
+        while total < len(view):
+            self._wait()
+            if not self._chunks:
+                break
+            data = self._take(len(view) - total)
+            view[total:total + len(data)] = data
+            total += len(data)
+        return total
+
+    def readline(self, size=None):
+        if size is not None and size < 0:
+            size = None
+        result = []
+        while size is None or size > 0:
+            self._wait()
+            if not self._chunks:
+                break
+            end = self._chunks[0].find(b'\n') + 1
+            if end and (size is None or end <= size):
+                result.append(self._take(end))
+                break
+            data = self._take(size)
+            result.append(data)
+            if size is not None:
+                size -= len(data)
+        return b''.join(result)
+
+    def readlines(self, hint=None):
+        # pylint:disable=unused-argument
+        return list(self)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+    __next__ = next
+
+    def _discard(self):
+        # The application is done; give back what it didn't read, and
+        # anything that arrives later.
+        self._discarded = True
+        unread = sum(len(chunk) for chunk in self._chunks)
+        self._chunks.clear()
+        if unread:
+            self._connection.acknowledge(self._stream_id, unread)
+
+
+class _StreamHandler(WSGIHandler):
+    # Handles the request on one stream. The response is sent as
+    # HEADERS and DATA frames instead of HTTP/1.1 text.
+
+    request_version = 'HTTP/2.0'
+
+    def __init__(self, connection, stream_id, environ):
+        # pylint:disable=super-init-not-called
+        self.connection = connection
+        self.stream_id = stream_id
+        self.socket = connection.socket
+        self.client_address = connection.client_address
+        self.server = connection.server
+        self.environ = environ
+        self.application = self.server.application
+        self.wsgi_input = environ['wsgi.input']
+        self.command = environ['REQUEST_METHOD']
+        self.path = environ['PATH_INFO']
+        if environ.get('QUERY_STRING'):
+            self.path += '?' + environ['QUERY_STRING']
+        self.requestline = '%s %s HTTP/2.0' % (self.command, self.path)
+        self.window = Event()
+        self.reset = False
+
+    def finalize_headers(self):
+        if self.provided_date is None:
+            self.response_headers.append((b'Date', self.server._http_date()))
+        if (self.code not in (304, 204) and self.provided_content_length is None
+                and hasattr(self.result, '__len__')):
+            total_len = str(sum(len(chunk) for chunk in self.result))
+            self.response_headers.append((b'Content-Length', total_len.encode('latin-1')))
+
+    def _write_with_headers(self, data):
+        self.headers_sent = True
+        self.finalize_headers()
+        headers = [(b':status', self.status[:3])]
+        for name, value in self.response_headers:
+            name = name.lower()
+            if name not in _CONNECTION_HEADERS:
+                headers.append((name, value))
+        self.connection.send_headers(self, headers)
+        self._write(data)
+
+    def _write(self, data, headers=None):
+        if data:
+            self.connection.send_data(self, data)
+            self.response_length += len(data)
+
+    def _sendall(self, data):
+        # Only used for the final chunk of chunked responses, which we
+        # never use.
+        raise AssertionError("Not used with HTTP/2")
+
+    def _sendfile_result(self):
+        return False
+
+    def _send_error_response_if_possible(self, error_code):
+        if self.headers_sent:
+            # Too late for an error response; reset the stream.
+            self.close_connection = True
+        else:
+            WSGIHandler._send_error_response_if_possible(self, error_code)
+
+    def run(self):
+        try:
+            self.handle_one_response()
+            self.connection.end_stream(self)
+        except socket.error:
+            if not PY3:
+                sys.exc_clear()
+        finally:
+            self.connection.streams.pop(self.stream_id, None)
+            self.connection._stream_finished()
+
+
+class HTTP2Connection(object):
+    """
+    Speaks HTTP/2 on the connection of a :class:`~gevent.pywsgi.WSGIHandler`.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.server = handler.server
+        self.socket = handler.socket
+        self.client_address = handler.client_address
+        self.conn = H2Connection(config=H2Configuration(client_side=False,
+                                                        header_encoding=None))
+        #: Stream ID to _StreamHandler
+        self.streams = {}
+        # Only one greenlet at a time may send; taking the data from
+        # the H2Connection while holding this keeps the frames in order.
+        self._send_lock = Semaphore()
+        # Without a pool, the greenlets running streams
+        self._group = Group() if self.server.pool is None else None
+        # Streams started but not finished, and an Event set when the
+        # last one finishes while run() waits for them.
+        self._running = 0
+        self._finished = None
+
+    def _reader(self):
+        # Return (buffered data, function to read more)
+        rfile = self.handler.rfile
+        read1 = getattr(rfile, 'read1', None)
+        if read1 is not None:
+            return b'', partial(read1, _READ_SIZE)
+        # Python 2's socket._fileobject: take what it has buffered,
+        # then read the socket directly.
+        rbuf = rfile._rbuf
+        data = rbuf.getvalue()
+        rbuf.seek(0)
+        rbuf.truncate()
+        return data, partial(self.socket.recv, _READ_SIZE)
+
+    def run(self, preface=b'', upgrade=None):
+        """
+        Handle streams until the connection closes.
+
+        :param bytes preface: Data already read from the connection.
+        :param upgrade: For an ``Upgrade: h2c`` request, the value of
+            its ``HTTP2-Settings`` header and its WSGI environment,
+            which becomes stream 1.
+        """
+        conn = self.conn
+        if upgrade is not None:
+            conn.initiate_upgrade_connection(upgrade[0])
+        conn.initiate_connection()
+        conn.update_settings({SettingCodes.MAX_CONCURRENT_STREAMS:
+                              self.server.http2_max_concurrent_streams})
+        self.flush()
+        if upgrade is not None:
+            environ = upgrade[1]
+            environ['wsgi.input'] = _StreamInput(self, 1)
+            environ['wsgi.input']._end()
+            self._start_stream(1, environ)
+
+        buffered, read = self._reader()
+        data = preface + buffered
+        try:
+            while True:
+                if data:
+                    try:
+                        events = conn.receive_data(data)
+                    except ProtocolError:
+                        # h2 has queued a GOAWAY
+                        if not PY3:
+                            sys.exc_clear()
+                        self.flush()
+                        break
+                    if not self._handle_events(events):
+                        self.flush()
+                        break
+                    self.flush()
+                data = read()
+                if not data:
+                    break
+        except socket.error:
+            if not PY3:
+                sys.exc_clear()
+        finally:
+            # Wake the streams; the ones still running will fail when
+            # they next read or write. Our caller closes the socket, so
+            # wait for them to finish.
+            for handler in list(self.streams.values()):
+                handler.reset = True
+                handler.window.set()
+                handler.wsgi_input._end(reset=True)
+            if self._running:
+                self._finished = Event()
+                self._finished.wait()
+
+    def _handle_events(self, events):
+        # Return False when the client has closed the connection.
+        streams = self.streams
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                self._start_stream(event.stream_id,
+                                   self._environ(event.stream_id, event.headers))
+            elif isinstance(event, h2.events.DataReceived):
+                handler = streams.get(event.stream_id)
+                if handler is None:
+                    self.acknowledge(event.stream_id, event.flow_controlled_length)
+                    continue
+                padding = event.flow_controlled_length - len(event.data)
+                if padding:
+                    self.acknowledge(event.stream_id, padding)
+                handler.wsgi_input._feed(event.data)
+            elif isinstance(event, h2.events.StreamEnded):
+                handler = streams.get(event.stream_id)
+                if handler is not None:
+                    handler.wsgi_input._end()
+            elif isinstance(event, h2.events.StreamReset):
+                handler = streams.get(event.stream_id)
+                if handler is not None:
+                    handler.reset = True
+                    handler.window.set()
+                    handler.wsgi_input._end(reset=True)
+            elif isinstance(event, (h2.events.WindowUpdated, h2.events.RemoteSettingsChanged)):
+                stream_id = getattr(event, 'stream_id', 0)
+                if stream_id:
+                    handler = streams.get(stream_id)
+                    if handler is not None:
+                        handler.window.set()
+                else:
+                    # The connection window, or the initial window
+                    # of every stream, changed.
+                    for handler in streams.values():
+                        handler.window.set()
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                return False
+        return True
+
+    def _environ(self, stream_id, headers):
+        server = self.server
+        env = server.get_environ()
+        pseudo = {}
+        fields = {}
+        for name, value in headers:
+            if PY3:
+                name = name.decode('latin-1')
+                value = value.decode('latin-1')
+            if name.startswith(':'):
+                pseudo[name] = value
+                continue
+            if name == 'content-type':
+                key = 'CONTENT_TYPE'
+            elif name == 'content-length':
+                key = 'CONTENT_LENGTH'
+            else:
+                key = 'HTTP_' + name.upper().replace('-', '_')
+            if key in fields:
+                # HTTP/2 clients split cookies into separate fields
+                value = fields[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+            fields[key] = value
+        env.update(fields)
+        if 'HTTP_HOST' not in env and ':authority' in pseudo:
+            env['HTTP_HOST'] = pseudo[':authority']
+
+        path = pseudo.get(':path', '')
+        if '?' in path:
+            path, query = path.split('?', 1)
+        else:
+            query = ''
+        env['REQUEST_METHOD'] = pseudo.get(':method', '')
+        env['SCRIPT_NAME'] = ''
+        env['PATH_INFO'] = unquote_latin1(path)
+        env['QUERY_STRING'] = query
+        env['SERVER_PROTOCOL'] = 'HTTP/2.0'
+        client_address = self.client_address
+        if isinstance(client_address, tuple):
+            env['REMOTE_ADDR'] = str(client_address[0])
+            env['REMOTE_PORT'] = str(client_address[1])
+        env['wsgi.input'] = _StreamInput(self, stream_id)
+        return env
+
+    def _start_stream(self, stream_id, environ):
+        server = self.server
+        pool = server.pool
+        if server.draining or (pool is not None and pool.full()):
+            # The client may retry it elsewhere (RFC 7540 8.1.4)
+            self.reset_stream(stream_id, ErrorCodes.REFUSED_STREAM)
+            return
+        handler = _StreamHandler(self, stream_id, environ)
+        self.streams[stream_id] = handler
+        self._running += 1
+        try:
+            if pool is not None:
+                pool.spawn(handler.run)
+            else:
+                self._group.spawn(handler.run)
+        except: # pylint:disable=bare-except
+            self.streams.pop(stream_id, None)
+            self._stream_finished()
+            raise
+
+    def _stream_finished(self):
+        self._running -= 1
+        if not self._running and self._finished is not None:
+            self._finished.set()
+
+    def flush(self):
+        with self._send_lock:
+            data = self.conn.data_to_send()
+            if data:
+                self.socket.sendall(data)
+
+    def acknowledge(self, stream_id, length):
+        # The application has read *length* bytes from the stream;
+        # h2 sends a WINDOW_UPDATE once enough have been.
+        try:
+            self.conn.acknowledge_received_data(length, stream_id)
+        except ProtocolError:
+            # The stream or connection is closed
+            if not PY3:
+                sys.exc_clear()
+            return
+        try:
+            self.flush()
+        except socket.error:
+            if not PY3:
+                sys.exc_clear()
+
+    def reset_stream(self, stream_id, error_code):
+        try:
+            self.conn.reset_stream(stream_id, error_code)
+            self.flush()
+        except (ProtocolError, socket.error):
+            if not PY3:
+                sys.exc_clear()
+
+    def send_headers(self, handler, headers):
+        if handler.reset:
+            raise _stream_reset()
+        try:
+            self.conn.send_headers(handler.stream_id, headers)
+        except ProtocolError:
+            raise _stream_reset()
+        self.flush()
+
+    def send_data(self, handler, data):
+        # Send as much as the flow control windows allow, then wait
+        # for the client to open them.
+        conn = self.conn
+        stream_id = handler.stream_id
+        while data:
+            handler.window.clear()
+            if handler.reset:
+                raise _stream_reset()
+            try:
+                window = conn.local_flow_control_window(stream_id)
+            except ProtocolError:
+                raise _stream_reset()
+            if window <= 0:
+                handler.window.wait()
+                continue
+            size = min(window, conn.max_outbound_frame_size, len(data))
+            try:
+                conn.send_data(stream_id, data[:size])
+            except ProtocolError:
+                raise _stream_reset()
+            data = data[size:]
+            self.flush()
+
+    def end_stream(self, handler):
+        if handler.close_connection:
+            # The response was cut short
+            self.reset_stream(handler.stream_id, ErrorCodes.INTERNAL_ERROR)
+            return
+        if handler.reset:
+            return
+        try:
+            self.conn.end_stream(handler.stream_id)
+        except ProtocolError:
+            if not PY3:
+                sys.exc_clear()
+            return
+        self.flush()
+        if not handler.wsgi_input._ended:
+            # The client is still sending a body nobody will read
+            # (RFC 7540 8.1).
+            self.reset_stream(handler.stream_id, ErrorCodes.NO_ERROR)
@@ -0,0 +1,227 @@
+# Copyright (c) 2016 gevent contributors. See LICENSE for details.
+"""
+Batched datagram I/O with :manpage:`recvmmsg(2)` and
+:manpage:`sendmmsg(2)`, called through :mod:`ctypes`, for
+:class:`gevent.server.DatagramServer`.
+
+Only Linux is supported; elsewhere (or if the C library is too old)
+:data:`available` is false and the server falls back to one system
+call for each datagram.
+
+internal gevent utilities, not for external use.
+"""
+from __future__ import absolute_import
+
+import ctypes
+import errno
+import os
+import struct
+import sys
+import _socket
+
+__all__ = [
+    'available',
+    'Receiver',
+    'send',
+]
+
+_recvmmsg = None
+_sendmmsg = None
+
+if sys.platform.startswith('linux'):
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _recvmmsg = _libc.recvmmsg
+        _sendmmsg = _libc.sendmmsg
+    except (AttributeError, OSError):
+        _recvmmsg = _sendmmsg = None
+
+#: Whether :class:`Receiver` and :func:`send` can be used.
+available = _recvmmsg is not None and _sendmmsg is not None
+
+MSG_DONTWAIT = 0x40 # Linux
+
+# Big enough for any address (it's sizeof(struct sockaddr_storage))
+_SOCKADDR_SIZE = 128
+
+_FAMILY = struct.Struct('=H') # sa_family_t, in host order
+_PORT = struct.Struct('!H')
+_FLOWINFO = struct.Struct('!I')
+_SCOPE_ID = struct.Struct('=I')
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.c_void_p),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+if available:
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint,
+                          ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint,
+                          ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+
+
+# Encoded addresses (struct sockaddr) <-> Python address tuples. A
+# server usually hears from and answers the same peers again and
+# again, but the number of peers isn't bounded, so neither is the
+# size of the caches: once full they're simply not added to.
+_ADDRESSES = {}
+_SOCKADDRS = {}
+_MAX_CACHED_ADDRESSES = 1024
+
+
+def _decode_address(name):
+    family = _FAMILY.unpack_from(name)[0]
+    if family == _socket.AF_INET:
+        return (_socket.inet_ntop(_socket.AF_INET, name[4:8]),
+                _PORT.unpack_from(name, 2)[0])
+    if family == _socket.AF_INET6:
+        return (_socket.inet_ntop(_socket.AF_INET6, name[8:24]),
+                _PORT.unpack_from(name, 2)[0],
+                _FLOWINFO.unpack_from(name, 4)[0],
+                _SCOPE_ID.unpack_from(name, 24)[0])
+    return name
+
+
+def _encode_address(address):
+    # Raises ValueError (or socket.error) for anything but the numeric
+    # addresses recvfrom returns.
+    if len(address) == 2:
+        return (_FAMILY.pack(_socket.AF_INET) + _PORT.pack(address[1])
+                + _socket.inet_pton(_socket.AF_INET, address[0]) + b'\0' * 8)
+    if len(address) == 4:
+        host, port, flowinfo, scope_id = address
+        return (_FAMILY.pack(_socket.AF_INET6) + _PORT.pack(port)
+                + _FLOWINFO.pack(flowinfo)
+                + _socket.inet_pton(_socket.AF_INET6, host)
+                + _SCOPE_ID.pack(scope_id))
+    raise ValueError(address)
+
+
+def _error():
+    err = ctypes.get_errno()
+    if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+        return None
+    return _socket.error(err, os.strerror(err))
+
+
+class Receiver(object):
+    """
+    Receives up to *count* datagrams of up to *size* bytes each with
+    one system call, into buffers allocated once.
+    """
+
+    def __init__(self, count, size):
+        self.count = count
+        self.size = size
+        self._data = ctypes.create_string_buffer(count * size)
+        self._names = ctypes.create_string_buffer(count * _SOCKADDR_SIZE)
+        self._iovecs = (_iovec * count)()
+        self._msgs = (_mmsghdr * count)()
+        # How many msg_namelen the kernel changed last time.
+        self._used = 0
+        data = ctypes.addressof(self._data)
+        names = ctypes.addressof(self._names)
+        iovecs = ctypes.addressof(self._iovecs)
+        for i in range(count):
+            iovec = self._iovecs[i]
+            iovec.iov_base = data + i * size
+            iovec.iov_len = size
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = names + i * _SOCKADDR_SIZE
+            hdr.msg_namelen = _SOCKADDR_SIZE
+            hdr.msg_iov = iovecs + i * ctypes.sizeof(_iovec)
+            hdr.msg_iovlen = 1
+
+    def receive(self, fileno):
+        """
+        Return a list of the ``(data, address)`` pairs waiting on the
+        socket *fileno*, which is empty if there are none.
+        """
+        msgs = self._msgs
+        for i in range(self._used):
+            msgs[i].msg_hdr.msg_namelen = _SOCKADDR_SIZE
+        count = _recvmmsg(fileno, msgs, self.count, MSG_DONTWAIT, None)
+        if count < 0:
+            self._used = 0
+            ex = _error()
+            if ex is None:
+                return []
+            raise ex
+        self._used = count
+        data = ctypes.addressof(self._data)
+        names = ctypes.addressof(self._names)
+        size = self.size
+        string_at = ctypes.string_at
+        addresses = _ADDRESSES
+        result = []
+        for i in range(count):
+            msg = msgs[i]
+            name = string_at(names + i * _SOCKADDR_SIZE, msg.msg_hdr.msg_namelen)
+            address = addresses.get(name)
+            if address is None:
+                address = _decode_address(name)
+                if len(addresses) < _MAX_CACHED_ADDRESSES:
+                    addresses[name] = address
+            result.append((string_at(data + i * size, msg.msg_len), address))
+        return result
+
+
+def send(fileno, packets):
+    """
+    Send as many of the ``(data, address)`` pairs in *packets* as the
+    socket *fileno* takes without blocking, with one system call.
+    Returns how many were sent; sending stops early at an address that
+    isn't numeric.
+    """
+    msgs = (_mmsghdr * len(packets))()
+    iovecs = (_iovec * len(packets))()
+    keep = [] # the buffers must live until the call returns
+    count = 0
+    for data, address in packets:
+        name = _SOCKADDRS.get(address)
+        if name is None:
+            try:
+                name = _encode_address(address)
+            except (ValueError, TypeError, _socket.error):
+                break
+            if len(_SOCKADDRS) < _MAX_CACHED_ADDRESSES:
+                _SOCKADDRS[address] = name
+        data_p = ctypes.c_char_p(data)
+        name_p = ctypes.c_char_p(name)
+        keep.append((data_p, name_p))
+        iovec = iovecs[count]
+        iovec.iov_base = ctypes.cast(data_p, ctypes.c_void_p).value
+        iovec.iov_len = len(data)
+        hdr = msgs[count].msg_hdr
+        hdr.msg_name = ctypes.cast(name_p, ctypes.c_void_p).value
+        hdr.msg_namelen = len(name)
+        hdr.msg_iov = ctypes.addressof(iovec)
+        hdr.msg_iovlen = 1
+        count += 1
+    if not count:
+        return 0
+    sent = _sendmmsg(fileno, msgs, count, MSG_DONTWAIT)
+    if sent < 0:
+        ex = _error()
+        if ex is None:
+            return 0
+        raise ex
+    return sent
@@ -0,0 +1,176 @@
+# Copyright (c) 2016 gevent contributors. See LICENSE for details.
+"""
+Watching the event loop of a :class:`gevent.hub.Hub` for lag and for
+greenlets that block it.
+
+Use :meth:`gevent.hub.Hub.start_monitor` (or set the
+``GEVENT_MONITOR_THRESHOLD`` environment variable) rather than
+creating a :class:`HubMonitor` directly.
+
+internal gevent utilities, not for external use.
+"""
+from __future__ import absolute_import
+
+import sys
+import traceback
+from time import time
+
+__all__ = [
+    'HubMonitor',
+]
+
+
+class HubMonitor(object):
+    """
+    Measures how long each iteration of the *hub*'s loop spends
+    running callbacks and watchers, and, from a native thread, reports
+    the stack of whatever keeps the hub from getting back to the loop
+    for more than *threshold* seconds.
+
+    A check watcher with the highest priority runs first thing after
+    the loop wakes up from polling, and a prepare watcher with the
+    lowest priority runs last thing before it polls again (after the
+    loop has run its callbacks); the time between the two is the lag
+    that every waiting event saw in that iteration. The thread only
+    has to look at when the current iteration began.
+
+    If *report* is given, it is called in the hub every
+    *report_interval* seconds with the result of :meth:`stats`.
+    """
+
+    #: How often the thread looks at the loop, as a fraction of the
+    #: threshold.
+    resolution = 0.25
+
+    def __init__(self, hub, threshold=0.1, report=None, report_interval=10.0):
+        from gevent._threading import get_ident
+        self.hub = hub
+        self.threshold = threshold
+        self.report = report
+        self.report_interval = report_interval
+        #: How many times the hub was found blocked in total.
+        self.blocked_count = 0
+        self.iterations = 0
+        self.max_lag = 0.0
+        self._since = time()
+        self._callbacks_since = getattr(hub.loop, 'callbacks_run', 0)
+        self._blocked_since = 0
+        # (iteration, start time) of the current iteration, or None
+        # while the loop is polling. One tuple, so the thread always
+        # sees a consistent pair.
+        self._busy = None
+        self._reported = None
+        self._ident = get_ident()
+        # A new object each time we start, so a thread left over from
+        # before a stop() can tell it's no longer wanted.
+        self._running = None
+        self._check = None
+        self._prepare = None
+        self._timer = None
+
+    def start(self):
+        from gevent._threading import start_new_thread
+        if self._running is not None:
+            return
+        loop = self.hub.loop
+        self._check = loop.check(ref=False, priority=loop.MAXPRI)
+        self._check.start(self._iteration_started)
+        self._prepare = loop.prepare(ref=False, priority=loop.MINPRI)
+        self._prepare.start(self._iteration_finished)
+        if self.report is not None and self.report_interval:
+            self._timer = loop.timer(self.report_interval, self.report_interval, ref=False)
+            self._timer.start(self._report)
+        self._running = token = object()
+        start_new_thread(self._watch, (token,))
+
+    def stop(self):
+        """
+        Stop watching. The thread exits the next time it wakes up.
+        """
+        self._running = None
+        for watcher in (self._check, self._prepare, self._timer):
+            if watcher is not None:
+                watcher.stop()
+        self._check = self._prepare = self._timer = None
+        self._busy = None
+
+    def stats(self):
+        """
+        Return a dict describing the loop since the previous call (or
+        since the monitor was created), and start counting afresh:
+
+        - ``iterations_per_second``
+        - ``max_lag``: the longest time, in seconds, one iteration
+          spent between polls.
+        - ``callbacks_run``: how many callbacks the loop ran.
+        - ``blocked``: how many times the hub was found blocked for
+          longer than the threshold.
+        """
+        now = time()
+        elapsed = now - self._since
+        callbacks_run = getattr(self.hub.loop, 'callbacks_run', 0)
+        result = {
+            'iterations_per_second': self.iterations / elapsed if elapsed > 0 else 0.0,
+            'max_lag': self.max_lag,
+            'callbacks_run': callbacks_run - self._callbacks_since,
+            'blocked': self.blocked_count - self._blocked_since,
+        }
+        self._since = now
+        self._callbacks_since = callbacks_run
+        self._blocked_since = self.blocked_count
+        self.iterations = 0
+        self.max_lag = 0.0
+        return result
+
+    def report_blocked(self, elapsed, frame):
+        """
+        Called in the monitoring thread when the hub has been kept from
+        its loop for *elapsed* seconds; *frame* is the frame running in
+        the hub's thread, or None. Writes the stack to the hub's
+        :attr:`~gevent.hub.Hub.exception_stream`.
+
+        This runs in a different thread than the hub, so it must not use
+        gevent objects belonging to the hub.
+        """
+        stream = self.hub.exception_stream
+        stream.write('The hub has been blocked for %.3f seconds (threshold %s):\n'
+                     % (elapsed, self.threshold))
+        if frame is not None:
+            stream.write(''.join(traceback.format_stack(frame)))
+        stream.write('\n')
+
+    def _iteration_started(self):
+        self.iterations += 1
+        self._busy = (self.iterations, time())
+
+    def _iteration_finished(self):
+        busy = self._busy
+        self._busy = None
+        if busy is not None:
+            lag = time() - busy[1]
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+    def _report(self):
+        self.report(self.stats())
+
+    def _watch(self, token):
+        from gevent.monkey import get_original
+        sleep = get_original('time', 'sleep')
+        while self._running is token:
+            sleep(self.threshold * self.resolution)
+            busy = self._busy
+            if busy is None or busy is self._reported:
+                continue
+            elapsed = time() - busy[1]
+            if elapsed < self.threshold:
+                continue
+            self._reported = busy
+            self.blocked_count += 1
+            frame = sys._current_frames().get(self._ident)
+            try:
+                self.report_blocked(elapsed, frame)
+            except: # pylint:disable=bare-except
+                traceback.print_exc()
+            finally:
+                del frame
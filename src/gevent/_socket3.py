@@ -40,6 +40,22 @@ def _get_memory(data):
 
 timeout_default = object()
 
+# The most buffers one sendmsg() call will accept
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 16 # The POSIX minimum
+if _IOV_MAX <= 0:
+    _IOV_MAX = 16
+
+
+# Raised by _sendfile_use_sendfile to make sendfile() fall back to
+# send(). The standard library only defines this in 3.5 and later.
+_GiveupOnSendfile = getattr(__socket__, '_GiveupOnSendfile', None)
+if _GiveupOnSendfile is None:
+    class _GiveupOnSendfile(Exception):
+        pass
+
 
 class _wrefsocket(_socket.socket):
     # Plain stdlib socket.socket objects subclass _socket.socket
@@ -51,6 +67,29 @@ class _wrefsocket(_socket.socket):
     __slots__ = ("__weakref__", )
 
 
+class _closedwatcher(object):
+    # Stands in for an io watcher of a closed socket once the watcher
+    # has been given back to the loop for reuse, so that nothing done
+    # to the socket afterwards can reach it.
+
+    __slots__ = ('ref',)
+
+    callback = None
+    active = False
+
+    def __init__(self, ref):
+        self.ref = ref
+
+    def start(self, *args, **kwargs):
+        # pylint:disable=unused-argument
+        raise error(EBADF, strerror(EBADF))
+
+    def stop(self):
+        pass
+
+    close = stop
+
+
 class socket(object):
     """
     gevent `socket.socket <https://docs.python.org/3/library/socket.html#socket-objects>`_
@@ -235,12 +274,25 @@ class socket(object):
         if self._closed:
             self.close()
 
-    def _real_close(self, _ss=_socket.socket, cancel_wait_ex=cancel_wait_ex):
+    def _real_close(self, _ss=_socket.socket, cancel_wait_ex=cancel_wait_ex,
+                    _closedwatcher=_closedwatcher):
         # This function should not reference any globals. See Python issue #808164.
         self.hub.cancel_wait(self._read_event, cancel_wait_ex)
         self.hub.cancel_wait(self._write_event, cancel_wait_ex)
         _ss.close(self._sock)
 
+        # Let a loop that pools watchers reuse the ones nobody is
+        # waiting on. They are closed from a callback so that any
+        # cancel_wait already scheduled for them runs first and finds
+        # them idle. Other loops gain nothing from this.
+        loop = self.hub.loop
+        if loop is not None and hasattr(loop, 'watcher_pool_size'):
+            for name in ('_read_event', '_write_event'):
+                watcher = getattr(self, name)
+                if watcher.callback is None and not isinstance(watcher, _closedwatcher):
+                    setattr(self, name, _closedwatcher(watcher.ref))
+                    loop.run_callback(watcher.close)
+
         # Break any references to the underlying socket object. Tested
         # by test__refcount. (Why does this matter?). Be sure to
         # preserve our same family/type/proto if possible (if we
@@ -411,6 +463,77 @@ class socket(object):
                 if timeleft <= 0:
                     raise timeout('timed out')
 
+    if hasattr(_socket.socket, 'sendmsg'):
+        # Only on Unix
+
+        def sendall_vectored(self, buffers, flags=0):
+            """
+            Send all the data in the sequence of bytes-like objects
+            *buffers*, as if by ``sendall(b''.join(buffers))``, but
+            without concatenating them first.
+
+            This uses ``sendmsg`` to gather up to ``IOV_MAX`` buffers
+            into each system call; buffers that are only partly sent are
+            sliced, not copied. The socket's timeout, if any, applies to
+            the whole operation as it does for :meth:`sendall`.
+
+            This is a gevent extension.
+
+            .. versionadded:: 1.2a1
+            """
+            views = []
+            for data in buffers:
+                view = _get_memory(data)
+                if isinstance(view, memoryview) and (view.ndim != 1 or view.itemsize != 1):
+                    # sendmsg counts bytes, so we must too
+                    view = view.cast('B')
+                if len(view):
+                    views.append(view)
+            if not views:
+                return
+
+            timeleft = self.timeout
+            end = time.time() + timeleft if timeleft is not None else None
+            start = 0
+            count = len(views)
+            while start < count:
+                try:
+                    sent = _socket.socket.sendmsg(self._sock, views[start:start + _IOV_MAX], (), flags)
+                except error as ex:
+                    if ex.args[0] != EWOULDBLOCK or self.timeout == 0.0:
+                        raise
+                    self._wait(self._write_event)
+                    if end is not None and time.time() >= end:
+                        raise timeout('timed out')
+                    continue
+                # Skip the buffers that went out entirely, and trim the
+                # one that was cut short.
+                while sent:
+                    view = views[start]
+                    if sent >= len(view):
+                        sent -= len(view)
+                        start += 1
+                    else:
+                        views[start] = view[sent:]
+                        sent = 0
+                if end is not None and start < count and time.time() >= end:
+                    raise timeout('timed out')
+
+    else:
+
+        def sendall_vectored(self, buffers, flags=0):
+            """
+            Send all the data in the sequence of bytes-like objects *buffers*.
+
+            This platform does not support ``sendmsg``, so the buffers are
+            joined and sent with :meth:`sendall`.
+
+            This is a gevent extension.
+
+            .. versionadded:: 1.2a1
+            """
+            return self.sendall(b''.join(buffers), flags)
+
     def sendto(self, *args):
         try:
             return _socket.socket.sendto(self._sock, *args)
@@ -477,11 +600,64 @@ class socket(object):
         self._sock.shutdown(how)
 
     # sendfile: new in 3.5. But there's no real reason to not
-    # support it everywhere. Note that we can't use os.sendfile()
-    # because it's not cooperative.
-    def _sendfile_use_sendfile(self, file, offset=0, count=None):
-        # This is called directly by tests
-        raise __socket__._GiveupOnSendfile() # pylint:disable=no-member
+    # support it everywhere. os.sendfile() is only cooperative because
+    # our file descriptor is non-blocking and we wait on the write
+    # watcher when it would block.
+    if hasattr(os, 'sendfile'):
+        def _sendfile_use_sendfile(self, file, offset=0, count=None):
+            # This is called directly by tests
+            self._check_sendfile_params(file, offset, count)
+            sockno = self.fileno()
+            try:
+                fileno = file.fileno()
+            except (AttributeError, io.UnsupportedOperation) as err:
+                raise _GiveupOnSendfile(err)  # not a regular file
+            try:
+                fsize = os.fstat(fileno).st_size
+            except OSError as err:
+                raise _GiveupOnSendfile(err)  # not a regular file
+            if not fsize:
+                return 0  # empty file
+            blocksize = fsize if not count else count
+            if self.gettimeout() == 0:
+                raise ValueError("non-blocking sockets are not supported")
+
+            total_sent = 0
+            # localize variable access to minimize overhead
+            os_sendfile = os.sendfile
+            try:
+                while True:
+                    if count:
+                        blocksize = count - total_sent
+                        if blocksize <= 0:
+                            break
+                    try:
+                        sent = os_sendfile(sockno, fileno, offset, blocksize)
+                    except BlockingIOError:
+                        self._wait(self._write_event)
+                        continue
+                    except OSError as err:
+                        if total_sent == 0:
+                            # We can get here for different reasons, the main
+                            # one being 'file' is not a regular mmap(2)-like
+                            # file, in which case we'll fall back on using
+                            # plain send().
+                            raise _GiveupOnSendfile(err)
+                        raise
+                    else:
+                        if sent == 0:
+                            break  # EOF
+                        offset += sent
+                        total_sent += sent
+                return total_sent
+            finally:
+                if total_sent > 0 and hasattr(file, 'seek'):
+                    file.seek(offset)
+    else:
+        def _sendfile_use_sendfile(self, file, offset=0, count=None):
+            # This is called directly by tests
+            raise _GiveupOnSendfile(
+                "os.sendfile() not available on this platform")
 
     def _sendfile_use_send(self, file, offset=0, count=None):
         self._check_sendfile_params(file, offset, count)
@@ -553,8 +729,14 @@ class socket(object):
         .. versionadded:: 1.1rc4
            Added in Python 3.5, but available under all Python 3 versions in
            gevent.
+        .. versionchanged:: 1.2a1
+           Use :func:`os.sendfile` (cooperatively) when it is available
+           instead of always falling back to :meth:`send`.
         """
-        return self._sendfile_use_send(file, offset, count)
+        try:
+            return self._sendfile_use_sendfile(file, offset, count)
+        except _GiveupOnSendfile:
+            return self._sendfile_use_send(file, offset, count)
 
     # get/set_inheritable new in 3.4
     if hasattr(os, 'get_inheritable') or hasattr(os, 'get_handle_inheritable'):
@@ -655,6 +837,260 @@ def _do_reuse_or_drop(sock, methname):
     else:
         method()
 
+class _BufferPool(object):
+    # Free bytearrays of one size, for _PooledBufferedReader. Readers
+    # take one when they have data to hold and put it back as soon as
+    # they're empty. Each pool belongs to one server (and so to one
+    # hub); even so, a single list.pop or append is all that touches
+    # the shared list.
+
+    __slots__ = ('size', 'max_free', '_free')
+
+    def __init__(self, size=io.DEFAULT_BUFFER_SIZE, max_free=256):
+        self.size = size
+        self.max_free = max_free
+        self._free = []
+
+    def acquire(self):
+        try:
+            return self._free.pop()
+        except IndexError:
+            return bytearray(self.size)
+
+    def release(self, buf):
+        if len(self._free) < self.max_free:
+            self._free.append(buf)
+
+    def makefile(self, sock):
+        """
+        Return a binary reader for *sock* (like ``sock.makefile('rb')``)
+        that takes its buffer from this pool.
+        """
+        raw = SocketIO(sock, 'rb')
+        sock._io_refs += 1
+        return _PooledBufferedReader(raw, sock, self)
+
+
+class _PooledBufferedReader(io.BufferedIOBase):
+    """
+    A binary reader for a socket, made by :meth:`_BufferPool.makefile`.
+
+    Like :class:`io.BufferedReader`, except that the buffer comes from a
+    :class:`_BufferPool` and is only held while it contains data: a
+    reader waiting for its socket to become readable, such as an idle
+    keep-alive HTTP connection, holds none. It is written in Python, so
+    each call costs more than with :class:`io.BufferedReader`; only
+    :mod:`gevent.pywsgi` uses it, and only when asked to.
+    """
+    # pylint:disable=attribute-defined-outside-init
+
+    def __init__(self, raw, sock, pool):
+        io.BufferedIOBase.__init__(self)
+        self.raw = raw
+        self._sock = sock
+        self._pool = pool
+        self._buf = None
+        self._view = None # memoryview of _buf, for slicing without a copy
+        self._pos = 0
+        self._end = 0
+
+    # File-like properties
+
+    def _get_raw(self):
+        raw = self.raw
+        if raw is None:
+            raise ValueError("raw stream has been detached")
+        return raw
+
+    @property
+    def closed(self):
+        return self._get_raw().closed
+
+    @property
+    def name(self):
+        return self._get_raw().name
+
+    @property
+    def mode(self):
+        return self._get_raw().mode
+
+    def fileno(self):
+        return self._get_raw().fileno()
+
+    def isatty(self):
+        return False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        if self.raw is not None and not self.raw.closed:
+            try:
+                self.raw.close()
+            finally:
+                self._release()
+
+    def detach(self):
+        raw = self._get_raw()
+        self.raw = None
+        self._release()
+        return raw
+
+    def __repr__(self):
+        return '<%s name=%r>' % (type(self).__name__, getattr(self.raw, 'name', None))
+
+    # Buffer management
+
+    def _release(self):
+        buf = self._buf
+        if buf is not None:
+            self._buf = self._view = None
+            self._pos = self._end = 0
+            self._pool.release(buf)
+
+    def _consume(self, n):
+        # Return the next *n* buffered bytes
+        pos = self._pos
+        data = self._view[pos:pos + n].tobytes()
+        self._pos = pos + n
+        if self._pos == self._end:
+            self._release()
+        return data
+
+    def _fill(self):
+        # Read once from the socket into the (empty) buffer. Return
+        # the number of bytes read, 0 at EOF, or None if the socket is
+        # non-blocking and has nothing. Wait for data before taking a
+        # buffer from the pool.
+        if self._get_raw().closed:
+            raise ValueError("I/O operation on closed file.")
+        sock = self._sock
+        if (sock.timeout != 0.0
+                and not (hasattr(sock, 'pending') and sock.pending())):
+            sock._wait(sock._read_event)
+        buf = self._pool.acquire()
+        try:
+            n = self.raw.readinto(buf)
+        except:
+            self._pool.release(buf)
+            raise
+        if not n:
+            self._pool.release(buf)
+            return n
+        self._buf = buf
+        self._view = memoryview(buf)
+        self._pos = 0
+        self._end = n
+        return n
+
+    # Reading
+
+    def peek(self, size=0):
+        if self._buf is None:
+            self._fill()
+            if self._buf is None:
+                return b''
+        return self._view[self._pos:self._end].tobytes()
+
+    def read1(self, size=-1):
+        if self._buf is None:
+            if self._fill() is None:
+                return None
+            if self._buf is None:
+                return b''
+        available = self._end - self._pos
+        if size is None or size < 0 or size > available:
+            size = available
+        return self._consume(size)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunks = []
+            if self._buf is not None:
+                chunks.append(self._consume(self._end - self._pos))
+            data = self.raw.readall()
+            if data is None and not chunks:
+                return None
+            chunks.append(data or b'')
+            return b''.join(chunks)
+        if self._buf is not None and self._end - self._pos >= size:
+            return self._consume(size)
+        result = bytearray(size)
+        n = self.readinto(result)
+        if n is None:
+            return None
+        del result[n:]
+        return bytes(result)
+
+    def readinto(self, b):
+        # Everything is read with raw.readinto, either into the pooled
+        # buffer or, for big reads, straight into *b*, and copied at
+        # most once more.
+        view = memoryview(b)
+        if view.format != 'B' or view.ndim != 1:
+            view = view.cast('B')
+        size = len(view)
+        total = 0
+        if self._buf is not None:
+            total = min(size, self._end - self._pos)
+            pos = self._pos
+            view[:total] = self._view[pos:pos + total]
+            self._pos = pos + total
+            if self._pos == self._end:
+                self._release()
+        while total < size:
+            if size - total >= self._pool.size:
+                n = self.raw.readinto(view[total:])
+            else:
+                n = self._fill()
+                if n:
+                    n = min(n, size - total)
+                    view[total:total + n] = self._view[:n]
+                    self._pos = n
+                    if self._pos == self._end:
+                        self._release()
+            if n is None:
+                return total or None
+            if not n:
+                break
+            total += n
+        return total
+
+    readinto1 = readinto
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+        buf = self._buf
+        if buf is not None and size < 0:
+            # The common case: the whole line is already here.
+            nl = buf.find(b'\n', self._pos, self._end)
+            if nl >= 0:
+                return self._consume(nl + 1 - self._pos)
+        chunks = []
+        length = 0
+        while size < 0 or length < size:
+            if self._buf is None and not self._fill():
+                break
+            buf = self._buf
+            pos = self._pos
+            end = self._end
+            if size >= 0:
+                end = min(end, pos + size - length)
+            nl = buf.find(b'\n', pos, end)
+            if nl >= 0:
+                chunks.append(self._consume(nl + 1 - pos))
+                break
+            chunks.append(self._consume(end - pos))
+            length += end - pos
+        if len(chunks) == 1:
+            return chunks[0]
+        return b''.join(chunks)
+
+
 from io import BytesIO
 
 
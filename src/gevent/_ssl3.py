@@ -309,7 +309,21 @@ class SSLSocket(socket):
                 return None
             return self._sslobj.version()
 
-        # We inherit sendfile from super(); it always uses `send`
+    def sendall_vectored(self, buffers, flags=0):
+        if self._sslobj is None:
+            return socket.sendall_vectored(self, buffers, flags)
+        # Each SSL record is encrypted separately anyway.
+        return self.sendall(b''.join(buffers), flags)
+
+    # os.sendfile() would bypass the encryption.
+    def sendfile(self, file, offset=0, count=None):
+        """Send a file, possibly by using os.sendfile() if this is a
+        clear-text socket.  Return the total number of bytes sent.
+        """
+        if self._sslobj is None:
+            # os.sendfile() works with plain sockets only
+            return socket.sendfile(self, file, offset, count)
+        return self._sendfile_use_send(file, offset, count)
 
     def cipher(self):
         self._checkClosed()
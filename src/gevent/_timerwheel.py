@@ -0,0 +1,270 @@
+# Copyright (c) 2016 gevent contributors. See LICENSE for details.
+"""
+A hierarchical timer wheel that multiplexes many timeouts onto one
+libev timer, for :meth:`gevent.hub.Hub.timer`.
+
+internal gevent utilities, not for external use.
+"""
+from __future__ import absolute_import
+
+import sys
+
+from gevent._compat import PY3
+from gevent._compat import xrange
+
+__all__ = [
+    'TimerWheel',
+]
+
+# The first level has 256 slots of one tick each; every level after
+# that has 64 slots, each as long as a whole turn of the level below.
+# Five levels cover 2**32 ticks (about 50 days at 1ms); later deadlines
+# are parked in the last level and put back each time it turns.
+_LEVEL0_BITS = 8
+_LEVEL_BITS = 6
+_LEVELS = 5
+_LEVEL0_MASK = (1 << _LEVEL0_BITS) - 1
+_LEVEL_MASK = (1 << _LEVEL_BITS) - 1
+_SHIFTS = [0] + [_LEVEL0_BITS + _LEVEL_BITS * i for i in range(_LEVELS - 1)]
+_MAX_DELTA = (1 << (_LEVEL0_BITS + _LEVEL_BITS * (_LEVELS - 1))) - 1
+
+# A repeat of 0 would stop the libev timer instead of starting it.
+_MIN_DELAY = 1e-9
+
+
+class _WheelTimer(object):
+    # Mimics the parts of the API of loop.timer() that hub.wait() and
+    # Timeout use.
+
+    __slots__ = ('wheel', 'seconds', 'ref', 'callback', 'args',
+                 '_deadline', '_level', '_slot')
+
+    # We run callbacks as soon as they're due, so there's never a
+    # window where a timer has expired but not been run.
+    pending = False
+
+    def __init__(self, wheel, seconds, ref):
+        self.wheel = wheel
+        self.seconds = seconds
+        self.ref = ref
+        self.callback = None
+        self.args = None
+        self._deadline = 0
+        self._level = 0
+        self._slot = None
+
+    @property
+    def active(self):
+        return self._slot is not None
+
+    def start(self, callback, *args, **kwargs):
+        # pylint:disable=unused-argument
+        if callback is None:
+            raise TypeError('callback must be callable, not None')
+        if self._slot is not None:
+            self.wheel._remove(self)
+        self.callback = callback
+        self.args = args
+        self.wheel._add(self)
+
+    def stop(self):
+        if self._slot is not None:
+            self.wheel._remove(self)
+        self.callback = None
+        self.args = None
+
+    close = stop
+
+    def __repr__(self):
+        result = '<%s at 0x%x seconds=%s' % (type(self).__name__, id(self), self.seconds)
+        if self.active:
+            result += ' active'
+        if self.callback is not None:
+            result += ' callback=%r' % (self.callback, )
+        return result + '>'
+
+
+class TimerWheel(object):
+    """
+    Keeps timers created with :meth:`timer` in a hierarchy of wheels of
+    slots, *resolution* seconds apart at the lowest level, and runs them
+    from a single libev timer of the *hub*'s loop that is only started
+    for the next slot that has anything in it. Starting and stopping a
+    timer is O(1) and allocates nothing native.
+
+    Timers are rounded up to a whole number of *resolution*, and
+    all run at the wheel's *priority* (by default that of
+    :class:`gevent.Timeout`).
+    """
+
+    def __init__(self, hub, resolution=0.001, priority=-1):
+        self.hub = hub
+        self.loop = hub.loop
+        self.resolution = resolution
+        # slot (a dict used as an ordered-enough set) for each index
+        # of each level
+        self._wheels = [[{} for _ in xrange(1 << (_LEVEL0_BITS if level == 0 else _LEVEL_BITS))]
+                        for level in xrange(_LEVELS)]
+        self._counts = [0] * _LEVELS
+        # Every timer due at or before this tick has been run.
+        self._tick = self._now()
+        self._scheduled = None
+        self._running = False
+        self._timer = self.loop.timer(0, ref=False, priority=priority)
+
+    def _now(self):
+        # Use the loop's clock, the same one its timers run on, so
+        # that we agree with the libev timer about when a tick is due.
+        self.loop.update()
+        return int(self.loop.now() / self.resolution)
+
+    def timer(self, seconds, ref=True):
+        """
+        Return a new, stopped, one-shot timer for *seconds*. If *ref* is
+        true, it keeps the loop running while it's started.
+        """
+        return _WheelTimer(self, seconds, ref)
+
+    def __len__(self):
+        return sum(self._counts)
+
+    def _add(self, timer):
+        loop = self.loop
+        loop.update()
+        now = loop.now()
+        if not self._running and not any(self._counts):
+            # Nothing to run in the meantime, so catch up.
+            self._tick = int(now / self.resolution)
+        # Round up, so timers never run early.
+        deadline = -int(-(now + timer.seconds) // self.resolution)
+        timer._deadline = deadline
+        self._insert(timer)
+        if timer.ref:
+            self.loop.ref()
+        if not self._running and (self._scheduled is None or deadline < self._scheduled):
+            self._schedule()
+
+    def _insert(self, timer):
+        tick = self._tick
+        delta = timer._deadline - tick
+        if delta <= 0:
+            level = 0
+            index = (tick + 1) & _LEVEL0_MASK
+        elif delta <= _LEVEL0_MASK:
+            level = 0
+            index = timer._deadline & _LEVEL0_MASK
+        else:
+            if delta > _MAX_DELTA:
+                delta = _MAX_DELTA
+            level = 1
+            while level < _LEVELS - 1 and delta >> (_SHIFTS[level] + _LEVEL_BITS):
+                level += 1
+            index = ((tick + delta) >> _SHIFTS[level]) & _LEVEL_MASK
+        slot = self._wheels[level][index]
+        slot[timer] = None
+        timer._slot = slot
+        timer._level = level
+        self._counts[level] += 1
+
+    def _remove(self, timer):
+        del timer._slot[timer]
+        timer._slot = None
+        self._counts[timer._level] -= 1
+        if timer.ref:
+            self.loop.unref()
+
+    def _next_boundary(self):
+        # The next tick at which a level above the first that has
+        # timers moves some of them down.
+        for level in xrange(1, _LEVELS):
+            if self._counts[level]:
+                shift = _SHIFTS[level]
+                return ((self._tick >> shift) + 1) << shift
+        return None
+
+    def _next_tick(self):
+        if self._counts[0]:
+            tick = self._tick
+            level0 = self._wheels[0]
+            end = tick | _LEVEL0_MASK
+            for t in xrange(tick + 1, end + 1):
+                if level0[t & _LEVEL0_MASK]:
+                    return t
+            # The rest are in the next turn.
+            return end + 1
+        return self._next_boundary()
+
+    def _schedule(self):
+        tick = self._next_tick()
+        self._scheduled = tick
+        if tick is None:
+            self._timer.stop()
+            return
+        # again() (re)starts the timer to fire after its repeat; it
+        # keeps repeating until we set it up again when it fires.
+        self._timer.repeat = max(tick * self.resolution - self.loop.now(), _MIN_DELAY)
+        self._timer.again(self._run)
+
+    def _cascade(self, level, tick):
+        index = (tick >> _SHIFTS[level]) & _LEVEL_MASK
+        slot = self._wheels[level][index]
+        if slot:
+            self._wheels[level][index] = {}
+            self._counts[level] -= len(slot)
+            for timer in slot:
+                self._insert(timer)
+        if not index and level + 1 < _LEVELS:
+            self._cascade(level + 1, tick)
+
+    def _run(self):
+        self._running = True
+        try:
+            self._advance(self._now())
+        finally:
+            self._running = False
+            self._schedule()
+
+    def _advance(self, target):
+        counts = self._counts
+        level0 = self._wheels[0]
+        while self._tick < target:
+            if not counts[0]:
+                boundary = self._next_boundary()
+                if boundary is None or boundary > target:
+                    self._tick = target
+                    break
+                self._tick = boundary - 1
+            tick = self._tick = self._tick + 1
+            if not tick & _LEVEL0_MASK:
+                self._cascade(1, tick)
+            slot = level0[tick & _LEVEL0_MASK]
+            while slot:
+                timer = slot.popitem()[0]
+                counts[0] -= 1
+                timer._slot = None
+                callback = timer.callback
+                args = timer.args
+                timer.callback = timer.args = None
+                if timer.ref:
+                    self.loop.unref()
+                try:
+                    callback(*args)
+                except: # pylint:disable=bare-except
+                    self.hub.handle_error(timer, *sys.exc_info())
+                    if not PY3:
+                        sys.exc_clear()
+
+    def close(self):
+        """
+        Stop the libev timer and forget all timers.
+        """
+        self._timer.stop()
+        for level in xrange(_LEVELS):
+            for slot in self._wheels[level]:
+                for timer in slot:
+                    timer._slot = None
+                    if timer.ref:
+                        self.loop.unref()
+                slot.clear()
+            self._counts[level] = 0
+        self._scheduled = None
@@ -0,0 +1,9 @@
+cimport cython
+
+@cython.locals(result=bytearray, key=bytearray, length=Py_ssize_t, i=Py_ssize_t)
+cpdef bytes _mask_loop(data, mask)
+
+cdef _read_exactly(read, Py_ssize_t length)
+
+@cython.locals(first=int, second=int, length=object)
+cpdef read_frame(read, max_size)
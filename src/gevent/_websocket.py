@@ -0,0 +1,144 @@
+# Copyright (c) 2016 gevent contributors. See LICENSE for details.
+"""
+Reading and writing WebSocket (:rfc:`6455`) frames, for
+:class:`gevent.pywsgi.WebSocket`.
+
+Like :mod:`gevent._wsgiparser`, this is pure Python that Cython
+compiles (with ``_websocket.pxd``); the compiled module unmasks
+payloads with a C loop.
+"""
+from __future__ import absolute_import
+
+import struct
+import sys
+import types
+
+__all__ = [
+    'WebSocketError',
+    'apply_mask',
+    'frame_header',
+    'read_frame',
+]
+
+PY3 = sys.version_info[0] >= 3
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_ABNORMAL = 1006 # never sent; the connection was lost
+CLOSE_INVALID_DATA = 1007
+CLOSE_TOO_BIG = 1009
+CLOSE_INTERNAL_ERROR = 1011
+
+_H = struct.Struct('!H')
+_Q = struct.Struct('!Q')
+
+
+class WebSocketError(Exception):
+    """
+    The WebSocket connection failed. :attr:`code` is the close code
+    that was (or would have been) sent.
+    """
+
+    def __init__(self, code, reason):
+        Exception.__init__(self, code, reason)
+        self.code = code
+        self.reason = reason
+
+
+def _mask_loop(data, mask):
+    result = bytearray(data)
+    key = bytearray(mask)
+    length = len(result)
+    for i in range(length):
+        result[i] ^= key[i & 3]
+    return bytes(result)
+
+
+def _mask_int(data, mask):
+    # Python 3 XORs the whole payload as one (big) integer much faster
+    # than it runs the loop.
+    length = len(data)
+    if not length:
+        return b''
+    key = (mask * (length // 4 + 1))[:length]
+    value = int.from_bytes(data, 'little') ^ int.from_bytes(key, 'little')
+    return value.to_bytes(length, 'little')
+
+#: apply_mask(data, mask) -> bytes
+#: XOR *data* with the four byte *mask*, masking or unmasking it.
+if PY3 and isinstance(_mask_loop, types.FunctionType):
+    # Not compiled
+    apply_mask = _mask_int
+else:
+    apply_mask = _mask_loop
+
+
+def frame_header(opcode, length, fin=True, rsv1=False):
+    """
+    Return the header of an unmasked (server) frame with a payload of
+    *length* bytes.
+    """
+    first = opcode
+    if fin:
+        first |= 0x80
+    if rsv1:
+        first |= 0x40
+    if length < 126:
+        return struct.pack('!BB', first, length)
+    if length < 0x10000:
+        return struct.pack('!BBH', first, 126, length)
+    return struct.pack('!BBQ', first, 127, length)
+
+
+def _read_exactly(read, length):
+    data = read(length)
+    if len(data) < length:
+        raise WebSocketError(CLOSE_ABNORMAL, 'Connection closed')
+    return data
+
+
+def read_frame(read, max_size):
+    """
+    Read one frame sent by a client with the file method *read*.
+
+    Returns ``(fin, rsv1, opcode, payload)`` with the payload unmasked.
+    Raises :class:`WebSocketError` if the connection is closed or the
+    frame is invalid or longer than *max_size*.
+    """
+    head = bytearray(_read_exactly(read, 2))
+    first = head[0]
+    second = head[1]
+    if first & 0x30:
+        raise WebSocketError(CLOSE_PROTOCOL_ERROR, 'Reserved bits set')
+    fin = bool(first & 0x80)
+    rsv1 = bool(first & 0x40)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if not second & 0x80:
+        # RFC 6455 5.1
+        raise WebSocketError(CLOSE_PROTOCOL_ERROR, 'Unmasked frame from client')
+    if opcode & 0x08:
+        if opcode > OP_PONG:
+            raise WebSocketError(CLOSE_PROTOCOL_ERROR, 'Unknown opcode')
+        if not fin or length > 125:
+            raise WebSocketError(CLOSE_PROTOCOL_ERROR, 'Invalid control frame')
+    elif opcode > OP_BINARY:
+        raise WebSocketError(CLOSE_PROTOCOL_ERROR, 'Unknown opcode')
+    if length == 126:
+        length = _H.unpack(_read_exactly(read, 2))[0]
+    elif length == 127:
+        length = _Q.unpack(_read_exactly(read, 8))[0]
+    if length > max_size:
+        raise WebSocketError(CLOSE_TOO_BIG, 'Frame too large')
+    mask = _read_exactly(read, 4)
+    if not length:
+        return fin, rsv1, opcode, b''
+    return fin, rsv1, opcode, apply_mask(_read_exactly(read, length), mask)
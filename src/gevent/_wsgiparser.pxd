@@ -0,0 +1,2 @@
+cdef _header_key(name)
+cpdef parse_headers(rfile, int max_line=*, int max_headers=*)
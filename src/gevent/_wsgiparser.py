@@ -0,0 +1,181 @@
+# Copyright (c) 2016 gevent contributors. See LICENSE for details.
+"""
+A one-pass parser for HTTP request headers, used by :mod:`gevent.pywsgi`
+when a :class:`~gevent.pywsgi.WSGIServer` is created with ``parser='fast'``.
+
+This is pure Python, but it is written so that Cython can compile it
+(with ``_wsgiparser.pxd``); when built, the extension module is imported
+in preference to this file.
+"""
+from __future__ import absolute_import
+
+import sys
+
+__all__ = [
+    'Headers',
+    'parse_headers',
+]
+
+PY3 = sys.version_info[0] >= 3
+
+#: The most header lines we accept in one request.
+MAX_HEADERS = 100
+
+# Header names are taken from the client, so limit how many we remember
+# translations for.
+_MAX_CACHED_KEYS = 1000
+
+# Map a header name exactly as received ('Content-Type') to
+# (lower-case name, CGI environment key).
+_KEY_CACHE = {}
+
+
+def _header_key(name):
+    try:
+        return _KEY_CACHE[name]
+    except KeyError:
+        pass
+    lower = name.lower()
+    if lower == 'content-type':
+        cgi = 'CONTENT_TYPE'
+    elif lower == 'content-length':
+        cgi = 'CONTENT_LENGTH'
+    else:
+        cgi = 'HTTP_' + name.upper().replace('-', '_')
+    result = (lower, cgi)
+    if len(_KEY_CACHE) < _MAX_CACHED_KEYS:
+        _KEY_CACHE[name] = result
+    return result
+
+
+class Headers(object):
+    """
+    The headers of one request.
+
+    This provides the subset of the :class:`mimetools.Message` API that
+    :class:`gevent.pywsgi.WSGIHandler` (and well-known subclasses) use,
+    plus :attr:`environ`, the headers already translated into WSGI
+    environment keys.
+    """
+
+    #: Empty, or a description of why the headers could not be parsed.
+    status = ''
+
+    def __init__(self):
+        #: ``(name, value)`` pairs in the order received.
+        self.items_list = []
+        #: The first value for each lower-cased name.
+        self.dict = {}
+        #: ``HTTP_*``, ``CONTENT_TYPE`` and ``CONTENT_LENGTH`` keys
+        #: for the WSGI environment. Repeated headers are joined with
+        #: a comma (``; `` for cookies), as :mod:`gevent.pywsgi` always has.
+        self.environ = {}
+
+    def get(self, name, default=None):
+        return self.dict.get(name.lower(), default)
+
+    getheader = get
+
+    def __getitem__(self, name):
+        return self.dict[name.lower()]
+
+    def __contains__(self, name):
+        return name.lower() in self.dict
+
+    def __delitem__(self, name):
+        lower, cgi = _header_key(name)
+        del self.dict[lower]
+        self.environ.pop(cgi, None)
+        self.items_list = [item for item in self.items_list if item[0].lower() != lower]
+
+    def __len__(self):
+        return len(self.items_list)
+
+    def keys(self):
+        return [name for name, _ in self.items_list]
+
+    def items(self):
+        return list(self.items_list)
+
+    @property
+    def typeheader(self):
+        return self.dict.get('content-type')
+
+    @property
+    def headers(self):
+        # The raw header lines
+        return ['%s: %s\r\n' % item for item in self.items_list]
+
+
+def parse_headers(rfile, max_line=65536, max_headers=MAX_HEADERS):
+    """
+    Read header lines from *rfile* through the blank line that ends them
+    and return a :class:`Headers`.
+
+    Errors are reported in :attr:`Headers.status`, like the standard
+    library parsers do, not by raising.
+    """
+    # pylint:disable=too-many-branches
+    result = Headers()
+    items = result.items_list
+    first = result.dict
+    environ = result.environ
+    readline = rfile.readline
+    name = lower = cgi = None
+    # Whether the last header was the first with its name, and whether
+    # its value was added to the environ.
+    last_first = last_joined = False
+    while True:
+        line = readline(max_line + 1)
+        if len(line) > max_line:
+            result.status = 'Line too long'
+            break
+        if PY3:
+            line = line.decode('latin-1')
+        if not line or line in ('\r\n', '\n'):
+            break
+        if line[0] in ' \t':
+            # An obsolete continuation (RFC 7230 3.2.4) of the previous
+            # value; replace the fold with a space.
+            if name is None:
+                result.status = 'Unexpected continuation line'
+                break
+            folded = ' ' + line.strip()
+            items[-1] = (name, items[-1][1] + folded)
+            if last_first:
+                first[lower] += folded
+            if last_joined:
+                environ[cgi] += folded
+            continue
+        if len(items) >= max_headers:
+            result.status = 'Too many headers'
+            break
+        colon = line.find(':')
+        if colon <= 0:
+            result.status = 'Invalid header line'
+            break
+        name = line[:colon]
+        if name != name.strip():
+            # RFC 7230 3.2.4: No whitespace around the name
+            result.status = 'Invalid header name'
+            break
+        value = line[colon + 1:].strip()
+        lower, cgi = _header_key(name)
+        items.append((name, value))
+        last_first = last_joined = lower not in first
+        if last_first:
+            first[lower] = value
+            environ[cgi] = value
+        elif cgi == 'CONTENT_LENGTH':
+            if value != first[lower]:
+                # Differing lengths let a proxy and us disagree
+                # about where the request ends.
+                result.status = 'Conflicting Content-Length'
+                break
+        elif 'COOKIE' in cgi:
+            environ[cgi] += '; ' + value
+            last_joined = True
+        elif cgi != 'CONTENT_TYPE':
+            environ[cgi] += ',' + value
+            last_joined = True
+    return result
@@ -7,7 +7,8 @@ The :class:`BackdoorServer` provides a REPL inside a running process. As
 long as the process is monkey-patched, the ``BackdoorServer`` can coexist
 with other elements of the process.
 
-.. seealso:: :class:`code.InteractiveConsole`
+.. seealso:: :class:`code.InteractiveConsole`, and :mod:`gevent.tracer`
+   for finding out which greenlets of the process use the most time.
 """
 from __future__ import print_function, absolute_import
 import sys
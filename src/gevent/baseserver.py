@@ -3,10 +3,11 @@
 import sys
 import _socket
 import errno
+from collections import deque
 from gevent.greenlet import Greenlet
 from gevent.event import Event
 from gevent.hub import get_hub
-from gevent._compat import string_types, integer_types, xrange
+from gevent._compat import string_types, integer_types
 
 
 __all__ = ['BaseServer']
@@ -60,6 +61,9 @@ class BaseServer(object):
         - ``None`` -- ``handle`` will be executed right away, in the :class:`Hub` greenlet.
           ``handle`` cannot use any blocking functions as it would mean switching to the :class:`Hub`.
         - an integer -- a shortcut for ``gevent.pool.Pool(integer)``
+        - a :class:`gevent.pool.WorkerPool` instance -- like a ``Pool``
+          of the same size, but ``handle`` runs in one of a fixed set of
+          reused greenlets, which costs less for very short handlers.
 
     .. versionchanged:: 1.1a1
        When the *handle* function returns from processing a connection,
@@ -83,11 +87,87 @@ class BaseServer(object):
     #: to 1 when environ["wsgi.multiprocess"] is true)
     max_accept = 100
 
+    #: The number of connections that will be accepted on the next
+    #: wake up. This adapts to the observed depth of the listen
+    #: backlog, between 1 and :attr:`max_accept`: it doubles each time
+    #: a wake up ends with connections still waiting to be accepted,
+    #: and halves when the backlog is emptied with room to spare. It is
+    #: also never allowed to exceed the free space in the :attr:`pool`.
+    accept_batch = max_accept
+
+    #: Counters describing the accept loop, useful to tune :attr:`max_accept`.
+    #: ``accept_count`` is the total number of connections accepted,
+    #: ``accept_wakeups`` the number of times the listening socket was
+    #: reported readable, and ``accept_saturated`` the number of those
+    #: wake ups that stopped at :attr:`accept_batch` without emptying the
+    #: backlog. The ratio of the first two is the mean batch size.
+    accept_count = 0
+    accept_wakeups = 0
+    accept_saturated = 0
+
+    #: If not None, a server whose :attr:`pool` is full keeps accepting
+    #: connections, as many as the pool holds, and they wait in the
+    #: server (not in the kernel's listen backlog, where clients can
+    #: only time out) for room in the pool. One that has waited this
+    #: many seconds since it was accepted is shed (see :meth:`do_shed`)
+    #: instead. Requires a pool with a size.
+    #:
+    #: .. versionadded:: 1.2a1
+    max_queue_time = None
+
+    #: If not None, connections accepted while :attr:`loop_lag` is more
+    #: than this many seconds are shed (see :meth:`do_shed`): a process
+    #: that is that far behind won't serve them in time anyway.
+    #:
+    #: .. versionadded:: 1.2a1
+    max_loop_lag = None
+
+    #: How late, in seconds, the event loop ran a timer due to run
+    #: recently: the time greenlets spend between switches to the hub.
+    #: Only measured (every :attr:`overload_interval` seconds) while the
+    #: server is started with :attr:`max_queue_time` or
+    #: :attr:`max_loop_lag` set.
+    #:
+    #: .. versionadded:: 1.2a1
+    loop_lag = 0
+
+    #: How often, in seconds, to measure :attr:`loop_lag` and shed the
+    #: connections that have waited longer than :attr:`max_queue_time`.
+    #:
+    #: .. versionadded:: 1.2a1
+    overload_interval = 0.05
+
+    #: Counters of the connections that were shed: ``shed_count`` is the
+    #: total, ``shed_queue_timeouts`` those that waited longer than
+    #: :attr:`max_queue_time`, and ``shed_lagging`` those accepted while
+    #: :attr:`loop_lag` exceeded :attr:`max_loop_lag`.
+    #:
+    #: .. versionadded:: 1.2a1
+    shed_count = 0
+    shed_queue_timeouts = 0
+    shed_lagging = 0
+
+    # (args, loop.now() when accepted) of the connections waiting for
+    # room in the pool; None unless max_queue_time applies.
+    _queue = None
+    # The repeating timer for loop_lag and max_queue_time, and when it
+    # should run next.
+    _overload_timer = None
+    _overload_due = 0
+
     _spawn = Greenlet.spawn
 
     #: the default timeout that we wait for the client connections to close in stop()
     stop_timeout = 1
 
+    #: True once :meth:`stop` has been called (until the server is
+    #: started again): the server no longer accepts connections, and
+    #: handlers should finish what they are doing and return rather
+    #: than wait for more work from their clients.
+    #:
+    #: .. versionadded:: 1.2a1
+    draining = False
+
     fatal_errors = (errno.EBADF, errno.EINVAL, errno.ENOTSOCK)
 
     def __init__(self, listener, handle=None, spawn='default'):
@@ -108,6 +188,7 @@ class BaseServer(object):
             self.loop = get_hub().loop
             if self.max_accept < 1:
                 raise ValueError('max_accept must be positive int: %r' % (self.max_accept, ))
+            self.accept_batch = self.max_accept
         except:
             self.close()
             raise
@@ -150,6 +231,8 @@ class BaseServer(object):
             raise TypeError("'handle' must be provided")
 
     def _start_accepting_if_started(self, _event=None):
+        if self._queue:
+            self._admit_queued()
         if self.started:
             self.start_accepting()
 
@@ -184,43 +267,180 @@ class BaseServer(object):
     def do_close(self, *args):
         pass
 
+    def do_shed(self, *args):
+        """
+        Refuse the connection described by *args* (as returned by
+        :meth:`do_read`), because the server is overloaded. This is
+        called in the hub, so it must not block. The default closes it.
+
+        .. versionadded:: 1.2a1
+        """
+        self.do_close(*args)
+
     def do_read(self):
         raise NotImplementedError()
 
     def _do_read(self):
-        for _ in xrange(self.max_accept):
-            if self.full():
-                self.stop_accepting()
-                return
-            try:
-                args = self.do_read()
-                self.delay = self.min_delay
-                if not args:
-                    return
-            except:
-                self.loop.handle_error(self, *sys.exc_info())
-                ex = sys.exc_info()[1]
-                if self.is_fatal_error(ex):
-                    self.close()
-                    sys.stderr.write('ERROR: %s failed with %s\n' % (self, str(ex) or repr(ex)))
+        # pylint:disable=too-many-branches
+        # Called by the watcher when the listening socket is readable.
+        # Drain the backlog, up to accept_batch connections, in one loop
+        # with as little per-connection work as possible.
+        self.accept_wakeups += 1
+        limit = min(self.accept_batch, self.max_accept)
+        free_count = self._free_count()
+        pool_limited = free_count is not None and free_count < limit
+        if pool_limited:
+            limit = free_count
+        # A pool that can tell us how much room it has is accounted for
+        # in *limit*; anything else has to be asked on every iteration.
+        full = self.full if free_count is None else None
+        do_read = self.do_read
+        do_handle = self.do_handle
+        admit = self._admit if self._overload_timer is not None else None
+        accepted = 0
+        drained = False
+        try:
+            while accepted < limit:
+                if full is not None and full():
+                    break
+                try:
+                    args = do_read()
+                except:
+                    self.loop.handle_error(self, *sys.exc_info())
+                    ex = sys.exc_info()[1]
+                    if self.is_fatal_error(ex):
+                        self.close()
+                        sys.stderr.write('ERROR: %s failed with %s\n' % (self, str(ex) or repr(ex)))
+                    else:
+                        if accepted:
+                            self.delay = self.min_delay
+                        self._delay_accepting()
                     return
-                if self.delay >= 0:
-                    self.stop_accepting()
-                    self._timer = self.loop.timer(self.delay)
-                    self._timer.start(self._start_accepting_if_started)
-                    self.delay = min(self.max_delay, self.delay * 2)
-                break
-            else:
+                if not args:
+                    drained = True
+                    break
+                accepted += 1
+                if admit is not None and not admit(args):
+                    continue
                 try:
-                    self.do_handle(*args)
+                    do_handle(*args)
                 except:
                     self.loop.handle_error((args[1:], self), *sys.exc_info())
-                    if self.delay >= 0:
-                        self.stop_accepting()
-                        self._timer = self.loop.timer(self.delay)
-                        self._timer.start(self._start_accepting_if_started)
-                        self.delay = min(self.max_delay, self.delay * 2)
-                    break
+                    # The accept itself succeeded.
+                    self.delay = self.min_delay
+                    self._delay_accepting()
+                    return
+        finally:
+            self.accept_count += accepted
+            self._adapt_accept_batch(accepted, drained, pool_limited)
+
+        if accepted or drained:
+            self.delay = self.min_delay
+        if self.full() and (self._queue is None or len(self._queue) >= self.pool.size):
+            self.stop_accepting()
+
+    def _free_count(self):
+        # The number of connections the pool (and the queue for it)
+        # can still take, or None if that's unlimited or unknown.
+        pool = self.pool
+        if pool is None or getattr(pool, 'size', None) is None:
+            return None
+        free_count = getattr(pool, 'free_count', None)
+        if free_count is None:
+            return None
+        queue = self._queue
+        if queue is not None:
+            return free_count() + pool.size - len(queue)
+        return free_count()
+
+    def _admit(self, args):
+        # Return whether the connection just accepted should be handled
+        # now; if not, it's been queued or shed.
+        if self.max_loop_lag is not None and self.loop_lag > self.max_loop_lag:
+            self.shed_lagging += 1
+            self._shed(args)
+            return False
+        queue = self._queue
+        if queue is not None and (queue or self.full()):
+            queue.append((args, self.loop.now()))
+            return False
+        return True
+
+    def _admit_queued(self):
+        # Hand the queued connections to the pool while it has room.
+        queue = self._queue
+        while queue and not self.full():
+            args, _ = queue.popleft()
+            try:
+                self.do_handle(*args)
+            except:
+                self.loop.handle_error((args[1:], self), *sys.exc_info())
+
+    def _shed(self, args):
+        self.shed_count += 1
+        try:
+            self.do_shed(*args)
+        except:
+            self.loop.handle_error((args[1:], self), *sys.exc_info())
+
+    def _start_overload_timer(self):
+        if self.max_queue_time is None and self.max_loop_lag is None:
+            return
+        if self.max_queue_time is not None and getattr(self.pool, 'size', None) is not None:
+            self._queue = deque()
+        interval = self.overload_interval
+        self._overload_due = self.loop.now() + interval
+        self._overload_timer = self.loop.timer(interval, interval, ref=False)
+        self._overload_timer.start(self._check_overload)
+
+    def _stop_overload_timer(self):
+        if self._overload_timer is not None:
+            self._overload_timer.stop()
+            self._overload_timer = None
+        queue = self._queue
+        self._queue = None
+        while queue:
+            args, _ = queue.popleft()
+            try:
+                self.do_close(*args)
+            except:
+                self.loop.handle_error((args[1:], self), *sys.exc_info())
+
+    def _check_overload(self):
+        # The overload timer. If the loop was busy when it was due, it
+        # runs late.
+        now = self.loop.now()
+        self.loop_lag = max(0, now - self._overload_due)
+        # As libev reschedules it
+        self._overload_due = max(now, self._overload_due + self.overload_interval)
+        queue = self._queue
+        if queue:
+            deadline = now - self.max_queue_time
+            while queue and queue[0][1] < deadline:
+                args, _ = queue.popleft()
+                self.shed_queue_timeouts += 1
+                self._shed(args)
+            # There may be room to accept again
+            self._start_accepting_if_started()
+
+    def _adapt_accept_batch(self, accepted, drained, pool_limited=False):
+        batch = self.accept_batch
+        if drained:
+            batch = max(batch // 2, accepted * 2)
+        elif not pool_limited and accepted >= batch:
+            # More connections were waiting than we were willing to take.
+            self.accept_saturated += 1
+            batch *= 2
+        self.accept_batch = max(1, min(batch, self.max_accept))
+
+    def _delay_accepting(self):
+        # Stop accepting for self.delay seconds, doubling the delay for
+        # the next consecutive error.
+        if self.delay >= 0:
+            self.stop_accepting()
+            self._timer = self.loop.timer(self.delay)
+            self._timer.start(self._start_accepting_if_started)
+            self.delay = min(self.max_delay, self.delay * 2)
 
     def full(self):
         # copied from self.pool
@@ -301,8 +521,10 @@ class BaseServer(object):
         bind it and put it into the listening mode.
         """
         self.init_socket()
+        self.draining = False
         self._stop_event.clear()
         try:
+            self._start_overload_timer()
             self.start_accepting()
         except:
             self.close()
@@ -313,6 +535,7 @@ class BaseServer(object):
         self._stop_event.set()
         try:
             self.stop_accepting()
+            self._stop_overload_timer()
         finally:
             try:
                 self.socket.close()
@@ -344,14 +567,32 @@ class BaseServer(object):
         If the server does not use a pool, then this merely stops accepting connections;
         any spawned greenlets that are handling requests continue running until
         they naturally complete.
+
+        .. versionchanged:: 1.2a1
+           Set :attr:`draining` and call :meth:`drain` before waiting
+           for the pool.
         """
+        self.draining = True
         self.close()
         if timeout is None:
             timeout = self.stop_timeout
+        self.drain(timeout)
         if self.pool:
             self.pool.join(timeout=timeout)
             self.pool.kill(block=True, timeout=1)
 
+    def drain(self, timeout):
+        """
+        Called by :meth:`stop` once the listening socket is closed, to
+        help the handlers finish sooner, waiting up to *timeout*
+        seconds. Subclasses that can tell connections waiting for a
+        request from those in the middle of one close the waiting ones
+        here. The default does nothing.
+
+        .. versionadded:: 1.2a1
+        """
+        pass
+
     def serve_forever(self, stop_timeout=None):
         """Start the server if it hasn't been already started and wait until it's stopped."""
         # add test that serve_forever exists on stop()
@@ -106,6 +106,10 @@ class Greenlet(greenlet):
     args = ()
     _kwargs = None
 
+    # The gevent.tracer.GreenletTracer recording where greenlets are
+    # spawned, if any.
+    _tracer = None
+
     def __init__(self, run=None, *args, **kwargs):
         """
         Greenlet constructor.
@@ -144,6 +148,9 @@ class Greenlet(greenlet):
         if kwargs:
             self._kwargs = kwargs
 
+        if self._tracer is not None:
+            self._tracer._spawned(self)
+
     @property
     def kwargs(self):
         return self._kwargs or {}
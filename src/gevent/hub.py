@@ -166,7 +166,11 @@ def sleep(seconds=0, ref=True):
         loop.run_callback(waiter.switch)
         waiter.get()
     else:
-        hub.wait(loop.timer(seconds, ref=ref))
+        timer = hub.timer(seconds, ref=ref)
+        try:
+            hub.wait(timer)
+        finally:
+            timer.close()
 
 
 def idle(priority=0):
@@ -429,6 +433,13 @@ def resolver_config(default, envvar):
     return [_resolvers.get(x, x) for x in result]
 
 
+def float_config(default, envvar):
+    result = os.environ.get(envvar) # pylint: disable=no-member
+    if result:
+        return float(result)
+    return default
+
+
 _resolvers = {'ares': 'gevent.resolver_ares.Resolver',
               'thread': 'gevent.resolver_thread.Resolver',
               'block': 'gevent.socket.BlockingResolver'}
@@ -484,6 +495,30 @@ class Hub(RawGreenlet):
     backend = config(None, 'GEVENT_BACKEND')
     threadpool_size = 10
 
+    #: If not None, each hub starts a monitor (see :meth:`start_monitor`)
+    #: with this threshold, in seconds, when it is created. Configured by
+    #: the ``GEVENT_MONITOR_THRESHOLD`` environment variable.
+    #:
+    #: .. versionadded:: 1.2a1
+    monitor_threshold = float_config(None, 'GEVENT_MONITOR_THRESHOLD')
+
+    #: If not 0, the resolution, in seconds, of the timers returned by
+    #: :meth:`timer` (and so of :func:`sleep` and :class:`gevent.Timeout`,
+    #: including socket timeouts), which then share one libev timer
+    #: through a timer wheel. Such timers are rounded up to a whole
+    #: number of this, run at priority -1 and only support ``start``,
+    #: ``stop`` and ``active``. The default, 0, gives each of them its
+    #: own libev timer, as before. Configured by the
+    #: ``GEVENT_TIMER_RESOLUTION`` environment variable.
+    #:
+    #: .. versionadded:: 1.2a1
+    timer_resolution = float_config(0, 'GEVENT_TIMER_RESOLUTION')
+
+    #: The monitor started by :meth:`start_monitor`, or None.
+    #:
+    #: .. versionadded:: 1.2a1
+    monitor = None
+
     # using pprint.pformat can override custom __repr__ methods on dict/list
     # subclasses, which can be a security concern
     format_context = 'pprint.saferepr'
@@ -509,7 +544,10 @@ class Hub(RawGreenlet):
             self.loop = loop_class(flags=loop, default=default)
         self._resolver = None
         self._threadpool = None
+        self._timer_wheel = None
         self.format_context = _import(self.format_context)
+        if self.monitor_threshold is not None:
+            self.start_monitor(self.monitor_threshold)
 
     def __repr__(self):
         if self.loop is None:
@@ -709,7 +747,78 @@ class Hub(RawGreenlet):
                 timeout.stop()
         return False
 
+    def start_monitor(self, threshold=0.1, report=None, report_interval=10.0):
+        """
+        Start watching this hub's event loop, and return the
+        :class:`gevent._monitor.HubMonitor` doing it (also available as
+        :attr:`monitor`).
+
+        Whenever one iteration of the loop keeps running (that is, some
+        greenlet or callback doesn't give control back to the hub) for
+        more than *threshold* seconds, a native thread writes the stack
+        that is running to :attr:`exception_stream`. The monitor's
+        ``stats()`` method returns the loop's iterations per second,
+        the longest time one iteration took (the *lag*), the number of
+        callbacks run and the number of times the hub was blocked; if
+        *report* is given, it is called with those stats every
+        *report_interval* seconds.
+
+        Calling this when a monitor is already running returns it
+        unchanged.
+
+        .. versionadded:: 1.2a1
+        """
+        if self.monitor is None:
+            from gevent._monitor import HubMonitor
+            self.monitor = HubMonitor(self, threshold, report, report_interval)
+            self.monitor.start()
+        return self.monitor
+
+    def stop_monitor(self):
+        """
+        Stop the monitor started by :meth:`start_monitor`, if any.
+
+        .. versionadded:: 1.2a1
+        """
+        if self.monitor is not None:
+            self.monitor.stop()
+            self.monitor = None
+
+    def timer(self, seconds, ref=True, priority=None):
+        """
+        Return a new, stopped, one-shot timer that runs the callback it's
+        started with after *seconds*.
+
+        This is ``loop.timer(seconds, ref=ref, priority=priority)``
+        unless :attr:`timer_resolution` has been set and no *priority*
+        other than -1 (that of :class:`gevent.Timeout`) is given. Then
+        it is a lightweight timer from :attr:`timer_wheel`, which
+        supports ``start(callback, *args)``, ``stop()`` and ``active``.
+
+        .. versionadded:: 1.2a1
+        """
+        if not self.timer_resolution or (priority is not None and priority != -1):
+            return self.loop.timer(seconds, ref=ref, priority=priority)
+        return self.timer_wheel.timer(seconds, ref)
+
+    @property
+    def timer_wheel(self):
+        """
+        The :class:`gevent._timerwheel.TimerWheel` backing :meth:`timer`,
+        created when first needed.
+
+        .. versionadded:: 1.2a1
+        """
+        if self._timer_wheel is None:
+            from gevent._timerwheel import TimerWheel
+            self._timer_wheel = TimerWheel(self, self.timer_resolution)
+        return self._timer_wheel
+
     def destroy(self, destroy_loop=None):
+        self.stop_monitor()
+        if self._timer_wheel is not None:
+            self._timer_wheel.close()
+            self._timer_wheel = None
         if self._resolver is not None:
             self._resolver.close()
             del self._resolver
@@ -75,6 +75,7 @@ struct ev_io {
 };
 struct ev_timer {
     double at;
+    double repeat;
     void* data;
     GEVENT_STRUCT_DONE _;
 };
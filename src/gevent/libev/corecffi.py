@@ -4,6 +4,7 @@ import sys
 import os
 import traceback
 import signal as signalmodule
+from collections import deque
 
 
 __all__ = [
@@ -332,9 +333,36 @@ class loop(object):
 
     error_handler = None
 
+    #: The number of callbacks run by this loop so far.
+    callbacks_run = 0
+
+    #: The number of callbacks scheduled with :meth:`run_callback`
+    #: that have neither run nor been stopped.
+    callbacks_pending = 0
+
+    #: The most callbacks run in one iteration of the loop. If more
+    #: are pending, the loop polls for events (without blocking) before
+    #: running the rest.
+    callbacks_per_iteration = 1000
+
+    #: How many native structures of closed io watchers, and how many
+    #: of closed timer watchers, are kept for :meth:`io` and
+    #: :meth:`timer` to reuse.
+    watcher_pool_size = 256
+
     def __init__(self, flags=None, default=None):
         self._in_callback = False
-        self._callbacks = []
+        # Callbacks that are stopped stay here until they're reached,
+        # so that stopping is O(1); they no longer count as pending or
+        # keep the loop alive.
+        self._callbacks = deque()
+
+        # The native structures of watchers given back by
+        # watcher.close(), for new watchers to reuse instead of
+        # allocating their own. The closed watcher objects themselves
+        # are never reused, so stale references to them stay inert.
+        self._io_pool = []
+        self._timer_pool = []
 
         # self._check is a watcher that runs in each iteration of the
         # mainloop, just after the blocking call
@@ -403,54 +431,56 @@ class loop(object):
         pass
 
     def _run_callbacks(self, _evloop, _, _revents):
-        count = 1000
-        libev.ev_timer_stop(self._ptr, self._timer0)
-        while self._callbacks and count > 0:
-            callbacks = self._callbacks
-            self._callbacks = []
-            for cb in callbacks:
-                self.unref()
-                callback = cb.callback
-                args = cb.args
-                if callback is None or args is None:
-                    # it's been stopped
-                    continue
-
-                cb.callback = None
+        count = self.callbacks_per_iteration
+        callbacks = self._callbacks
+        while callbacks and count > 0:
+            cb = callbacks.popleft()
+            callback = cb.callback
+            args = cb.args
+            if callback is None or args is None:
+                # it's been stopped
+                continue
+
+            self.unref()
+            self.callbacks_pending -= 1
+            cb.callback = None
 
+            try:
+                callback(*args)
+            except: # pylint:disable=bare-except
+                # If we allow an exception to escape this method (while we are running the ev callback),
+                # then CFFI will print the error and libev will continue executing.
+                # There are two problems with this. The first is that the code after
+                # the loop won't run. The second is that any remaining callbacks scheduled
+                # for this loop iteration will be silently dropped; they won't run, but they'll
+                # also not be *stopped* (which is not a huge deal unless you're looking for
+                # consistency or checking the boolean/pending status; the loop doesn't keep
+                # a reference to them like it does to watchers...*UNLESS* the callback itself had
+                # a reference to a watcher; then I don't know what would happen, it depends on
+                # the state of the watcher---a leak or crash is not totally inconceivable).
+                # The Cython implementation in core.ppyx uses gevent_call from callbacks.c
+                # to run the callback, which uses gevent_handle_error to handle any errors the
+                # Python callback raises...it unconditionally simply prints any error raised
+                # by loop.handle_error and clears it, so callback handling continues.
+                # We take a similar approach (but are extra careful about printing)
                 try:
-                    callback(*args)
+                    self.handle_error(cb, *sys.exc_info())
                 except: # pylint:disable=bare-except
-                    # If we allow an exception to escape this method (while we are running the ev callback),
-                    # then CFFI will print the error and libev will continue executing.
-                    # There are two problems with this. The first is that the code after
-                    # the loop won't run. The second is that any remaining callbacks scheduled
-                    # for this loop iteration will be silently dropped; they won't run, but they'll
-                    # also not be *stopped* (which is not a huge deal unless you're looking for
-                    # consistency or checking the boolean/pending status; the loop doesn't keep
-                    # a reference to them like it does to watchers...*UNLESS* the callback itself had
-                    # a reference to a watcher; then I don't know what would happen, it depends on
-                    # the state of the watcher---a leak or crash is not totally inconceivable).
-                    # The Cython implementation in core.ppyx uses gevent_call from callbacks.c
-                    # to run the callback, which uses gevent_handle_error to handle any errors the
-                    # Python callback raises...it unconditionally simply prints any error raised
-                    # by loop.handle_error and clears it, so callback handling continues.
-                    # We take a similar approach (but are extra careful about printing)
                     try:
-                        self.handle_error(cb, *sys.exc_info())
+                        print("Exception while handling another error", file=sys.stderr)
+                        traceback.print_exc()
                     except: # pylint:disable=bare-except
-                        try:
-                            print("Exception while handling another error", file=sys.stderr)
-                            traceback.print_exc()
-                        except: # pylint:disable=bare-except
-                            pass # Nothing we can do here
-                finally:
-                    # NOTE: this must be reset here, because cb.args is used as a flag in
-                    # the callback class so that bool(cb) of a callback that has been run
-                    # becomes False
-                    cb.args = None
-                    count -= 1
-        if self._callbacks:
+                        pass # Nothing we can do here
+            finally:
+                # NOTE: this must be reset here, because cb.args is used as a flag in
+                # the callback class so that bool(cb) of a callback that has been run
+                # becomes False
+                cb.args = None
+                count -= 1
+        self.callbacks_run += self.callbacks_per_iteration - count
+        # _timer0 fires (and so stops) whenever the loop polls, so
+        # there's no need to stop it each time we're called.
+        if self.callbacks_pending and not libev.ev_is_active(self._timer0):
             libev.ev_timer_start(self._ptr, self._timer0)
 
     def _stop_aux_watchers(self):
@@ -471,6 +501,8 @@ class loop(object):
                 _default_loop_destroyed = True
             libev.ev_loop_destroy(self._ptr)
             self._ptr = ffi.NULL
+            del self._io_pool[:]
+            del self._timer_pool[:]
 
     @property
     def ptr(self):
@@ -615,12 +647,19 @@ class loop(object):
         return callback(self, priority)
 
     def run_callback(self, func, *args):
-        cb = callback(func, args)
+        cb = callback(func, args, self)
         self._callbacks.append(cb)
+        self.callbacks_pending += 1
         self.ref()
 
         return cb
 
+    def _callback_stopped(self):
+        # A pending callback was stopped.
+        self.callbacks_pending -= 1
+        if self._ptr:
+            self.unref()
+
     def _format(self):
         if not self._ptr:
             return 'destroyed'
@@ -666,15 +705,20 @@ _NOARGS = ()
 
 class callback(object):
 
-    __slots__ = ('callback', 'args')
+    __slots__ = ('callback', 'args', 'loop')
 
-    def __init__(self, callback, args):
+    def __init__(self, callback, args, loop=None):
         self.callback = callback
         self.args = args or _NOARGS
+        # The loop this is scheduled in with run_callback, if any.
+        self.loop = loop
 
     def stop(self):
+        if self.callback is not None and self.loop is not None:
+            self.loop._callback_stopped()
         self.callback = None
         self.args = None
+        self.loop = None
 
     # Note that __nonzero__ and pending are different
     # bool() is used in contexts where we need to know whether to schedule another callback,
@@ -711,23 +755,52 @@ class callback(object):
 
 class watcher(object):
 
+    # The name of the list in the loop that close() gives the native
+    # structures of watchers of exactly this class back to, if any.
+    _pool_name = None
+
     def __init__(self, _loop, ref=True, priority=None, args=_NOARGS):
         self.loop = _loop
+        self._handle = ffi.new_handle(self)
+        # Not subclasses, which may have state of their own.
+        pool_name = type(self).__dict__.get('_pool_name')
+        pool = getattr(_loop, pool_name) if pool_name is not None else None
+        if pool:
+            self._watcher = pool.pop()
+        else:
+            self._watcher = ffi.new(self._watcher_struct_pointer_type)
+        self._watcher.data = self._handle
         if ref:
             self._flags = 0
         else:
             self._flags = 4
         self._args = None
         self._callback = None
-        self._handle = ffi.new_handle(self)
-
-        self._watcher = ffi.new(self._watcher_struct_pointer_type)
-        self._watcher.data = self._handle
-        if priority is not None:
-            libev.ev_set_priority(self._watcher, priority)
         self._watcher_init(self._watcher,
                            self._watcher_callback,
                            *args)
+        # This must come after the init, which resets the priority.
+        if priority is not None:
+            libev.ev_set_priority(self._watcher, priority)
+
+    def close(self):
+        """
+        Stop this watcher, and let its loop reuse its native structure
+        for a new watcher. After this, it can't be started again and
+        stopping or closing it does nothing.
+        """
+        if self._flags & 8:
+            return
+        self.stop()
+        self._flags |= 8
+        pool_name = type(self).__dict__.get('_pool_name')
+        loop = self.loop
+        if pool_name is not None and loop._ptr:
+            pool = getattr(loop, pool_name)
+            if len(pool) < loop.watcher_pool_size:
+                pool.append(self._watcher)
+                # Someone else owns the structure now.
+                self._watcher = self._closed_watcher
 
     # A string identifying the type of libev object we watch, e.g., 'ev_io'
     # This should be a class attribute.
@@ -744,6 +817,11 @@ class watcher(object):
     # A cffi ctype object identifying the struct pointer we create.
     # This is a class attribute set based on the _watcher_type
     _watcher_struct_pointer_type = None
+    # An inactive structure that watchers whose own structure went
+    # back to the loop's pool point to instead, so that looking at
+    # them is harmless. This is a class attribute set based on the
+    # _watcher_type in _init_subclasses.
+    _closed_watcher = None
     # The attribute of the libev object identifying the custom
     # callback function for this type of watcher. This is a class
     # attribute set based on the _watcher_type in _init_subclasses.
@@ -754,6 +832,7 @@ class watcher(object):
         for subclass in cls.__subclasses__(): # pylint:disable=no-member
             watcher_type = subclass._watcher_type
             subclass._watcher_struct_pointer_type = ffi.typeof('struct ' + watcher_type + '*')
+            subclass._closed_watcher = ffi.new(subclass._watcher_struct_pointer_type)
             subclass._watcher_callback = ffi.addressof(libev,
                                                        '_gevent_generic_callback')
             for name in 'start', 'stop', 'init':
@@ -831,6 +910,8 @@ class watcher(object):
     def start(self, callback, *args):
         if callback is None:
             raise TypeError('callback must be callable, not None')
+        if self._flags & 8:
+            raise ValueError('operation on closed watcher')
         self.callback = callback
         self.args = args or _NOARGS
         self._libev_unref()
@@ -838,6 +919,8 @@ class watcher(object):
         self._watcher_start(self.loop._ptr, self._watcher)
 
     def stop(self):
+        if self._flags & 8:
+            return
         if self._flags & 2:
             self.loop.ref()
             self._flags &= ~2
@@ -857,6 +940,8 @@ class watcher(object):
     priority = property(_get_priority, _set_priority)
 
     def feed(self, revents, callback, *args):
+        if self._flags & 8:
+            raise ValueError('operation on closed watcher')
         self.callback = callback
         self.args = args or _NOARGS
         if self._flags & 6 == 4:
@@ -878,15 +963,20 @@ class watcher(object):
 
 class io(watcher):
     _watcher_type = 'ev_io'
+    _pool_name = '_io_pool'
 
     def __init__(self, loop, fd, events, ref=True, priority=None):
         # XXX: Win32: Need to vfd_open the fd and free the old one?
         # XXX: Win32: Need a destructor to free the old fd?
+        self._check_args(fd, events)
+        watcher.__init__(self, loop, ref=ref, priority=priority, args=(fd, events))
+
+    @staticmethod
+    def _check_args(fd, events):
         if fd < 0:
             raise ValueError('fd must be non-negative: %r' % fd)
         if events & ~(libev.EV__IOFDSET | libev.EV_READ | libev.EV_WRITE):
             raise ValueError('illegal event mask: %r' % events)
-        watcher.__init__(self, loop, ref=ref, priority=priority, args=(fd, events))
 
     def start(self, callback, *args, **kwargs):
         args = args or _NOARGS
@@ -926,6 +1016,7 @@ class io(watcher):
 
 class timer(watcher):
     _watcher_type = 'ev_timer'
+    _pool_name = '_timer_pool'
 
     def __init__(self, loop, after=0.0, repeat=0.0, ref=True, priority=None):
         if repeat < 0.0:
@@ -949,6 +1040,18 @@ class timer(watcher):
     def at(self):
         return self._watcher.at
 
+    def _get_repeat(self):
+        return self._watcher.repeat
+
+    def _set_repeat(self, repeat):
+        if repeat < 0.0:
+            raise ValueError("repeat must be positive or zero: %r" % repeat)
+        self._watcher.repeat = repeat
+
+    # As in libev, this can be changed at any time; it takes effect
+    # the next time the timer fires or again() is called.
+    repeat = property(_get_repeat, _set_repeat)
+
     def again(self, callback, *args, **kw):
         # Exactly the same as start(), just with a different initializer
         # function
@@ -93,6 +93,7 @@ cdef extern from "libev.h":
 
     struct ev_timer:
         double at
+        double repeat
 
     struct ev_signal:
         pass
@@ -12,22 +12,29 @@ The :class:`Pool` class, which is a subclass of :class:`Group`,
 provides a way to limit concurrency: its :meth:`spawn <Pool.spawn>`
 method blocks if the number of greenlets in the pool has already
 reached the limit, until there is a free slot.
+
+The :class:`WorkerPool` class limits concurrency the same way, but
+runs the functions it is given in a fixed set of reused greenlets.
 """
 
+import sys
 from bisect import insort_right
+from collections import deque
 try:
     from itertools import izip
 except ImportError:
     # Python 3
     izip = zip
 
-from gevent.hub import GreenletExit, getcurrent, kill as _kill
+from gevent.hub import GreenletExit, getcurrent, get_hub, kill as _kill
+from gevent.hub import RawGreenlet
 from gevent.greenlet import joinall, Greenlet
 from gevent.timeout import Timeout
 from gevent.event import Event
 from gevent.lock import Semaphore, DummySemaphore
+from gevent._compat import PY3
 
-__all__ = ['Group', 'Pool']
+__all__ = ['Group', 'Pool', 'WorkerPool']
 
 
 class IMapUnordered(Greenlet):
@@ -733,6 +740,158 @@ class Pool(Group):
         self._semaphore.release()
 
 
+class WorkerPool(object):
+    """
+    Runs the functions given to :meth:`spawn` in up to *size* long-lived
+    greenlets, each taking the next function when it finishes one.
+
+    For a server whose handlers are short (a stateless reply to a
+    datagram, a health check), creating, starting and linking a
+    :class:`~gevent.Greenlet` for each connection can cost more than
+    handling it. Passing one of these as the server's *spawn* instead of
+    a :class:`Pool` of the same *size* keeps the same limit (at most
+    *size* functions run at once, and :meth:`spawn` blocks while that
+    many are queued or running) without that cost: the functions wait
+    in a :class:`collections.deque` for a greenlet that has been created
+    once and is reused.
+
+    Unlike :meth:`Pool.spawn`, :meth:`spawn` returns nothing, so a
+    single function can't be joined or killed. An exception a function
+    raises is reported, like one from a greenlet, and its greenlet goes
+    on to the next function; so does a :exc:`~gevent.GreenletExit`
+    thrown into it (other than by :meth:`kill`). Functions must not
+    depend on having a greenlet to themselves, for example by leaving
+    values in greenlet-local storage.
+
+    .. versionadded:: 1.2a1
+    """
+
+    def __init__(self, size):
+        if size is None or size < 1:
+            raise ValueError('size must be a positive integer: %r' % (size, ))
+        self.size = size
+        self.hub = get_hub()
+        self._semaphore = Semaphore(size)
+        self._work = deque() # (function, args) waiting for a worker
+        self._workers = set()
+        self._idle = [] # workers waiting for work
+        self._killing = False
+        self._empty_event = Event()
+        self._empty_event.set()
+        self._dead_event = Event()
+        self._dead_event.set()
+
+    def __repr__(self):
+        return '<%s at 0x%x size=%s running=%s>' % (self.__class__.__name__, id(self),
+                                                    self.size, len(self))
+
+    def __len__(self):
+        """
+        Answer how many functions are queued or running. If there are
+        none, we are False in a boolean context.
+        """
+        return self.size - self._semaphore.counter
+
+    def spawn(self, func, *args):
+        """
+        Run ``func(*args)`` in one of the workers, blocking until
+        fewer than *size* functions are queued or running.
+        """
+        self._semaphore.acquire()
+        self._work.append((func, args))
+        self._empty_event.clear()
+        if self._idle:
+            self.hub.loop.run_callback(self._idle.pop().switch)
+        elif len(self._workers) < self.size:
+            worker = RawGreenlet(self._run, self.hub)
+            self._workers.add(worker)
+            self._dead_event.clear()
+            self.hub.loop.run_callback(worker.switch)
+
+    def _run(self):
+        current = getcurrent()
+        work = self._work
+        try:
+            while not self._killing:
+                if not work:
+                    self._idle.append(current)
+                    try:
+                        self.hub.switch()
+                    finally:
+                        if current in self._idle:
+                            self._idle.remove(current)
+                    continue
+                func, args = work.popleft()
+                try:
+                    func(*args)
+                except GreenletExit:
+                    if self._killing:
+                        raise
+                    if not PY3:
+                        sys.exc_clear()
+                except: # pylint:disable=bare-except
+                    self.hub.handle_error(func, *sys.exc_info())
+                    if not PY3:
+                        sys.exc_clear()
+                finally:
+                    self._done()
+        finally:
+            self._workers.discard(current)
+            if not self._workers:
+                self._killing = False
+                self._dead_event.set()
+
+    def _done(self):
+        self._semaphore.release()
+        if self._semaphore.counter >= self.size:
+            self._empty_event.set()
+
+    def join(self, timeout=None):
+        """
+        Wait until no functions are queued or running.
+
+        :return bool: Whether that happened before *timeout* expired.
+        """
+        return self._empty_event.wait(timeout=timeout)
+
+    def kill(self, exception=GreenletExit, block=True, timeout=None):
+        """
+        Drop the functions that are queued, and kill the workers
+        (interrupting the functions they are running) with
+        *exception*. New workers are created as needed by later calls to
+        :meth:`spawn`.
+        """
+        while self._work:
+            self._work.popleft()
+            self._done()
+        if not self._workers:
+            return
+        self._killing = True
+        for worker in list(self._workers):
+            _kill(worker, exception)
+        if block:
+            self._dead_event.wait(timeout=timeout)
+
+    def full(self):
+        """
+        Return whether :meth:`spawn` would block.
+        """
+        return self._semaphore.counter <= 0
+
+    def free_count(self):
+        """
+        Return how many more functions can be given to :meth:`spawn`
+        without blocking.
+        """
+        return max(0, self._semaphore.counter)
+
+    def wait_available(self, timeout=None):
+        """
+        Wait until it's possible to :meth:`spawn` without blocking.
+        """
+        return self._semaphore.wait(timeout=timeout)
+
+
 class pass_value(object):
     __slots__ = ['callback']
 
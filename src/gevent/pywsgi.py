@@ -13,11 +13,18 @@ different subclasses of :class:`WSGIHandler`.
 # pylint:disable=too-many-lines
 
 import errno
+import json
+from base64 import b64encode
+from hashlib import sha1
 from io import BytesIO
+import os
+import stat
 import string
 import sys
 import time
 import traceback
+import zlib
+from collections import OrderedDict
 from datetime import datetime
 
 try:
@@ -29,7 +36,17 @@ from gevent import socket
 import gevent
 from gevent.server import StreamServer
 from gevent.hub import GreenletExit
-from gevent._compat import PY3, reraise
+from gevent.hub import getcurrent
+from gevent.hub import get_hub
+from gevent.hub import spawn_raw
+from gevent.event import AsyncResult
+from gevent.event import Event
+from gevent.lock import Semaphore
+from gevent.timeout import Timeout
+from gevent._wsgiparser import parse_headers as _fast_parse_headers
+from gevent import _websocket
+from gevent._websocket import WebSocketError
+from gevent._compat import PY3, reraise, text_type
 
 from functools import partial
 if PY3:
@@ -43,6 +60,11 @@ __all__ = [
     'WSGIServer',
     'WSGIHandler',
     'LoggingLogAdapter',
+    'AccessLog',
+    'FileWrapper',
+    'LazyEnviron',
+    'WebSocket',
+    'WebSocketError',
     'Environ',
     'SecureEnviron',
     'WSGISecureEnviron',
@@ -79,6 +101,11 @@ _ERRORS[400] = (_BAD_REQUEST_STATUS, _BAD_REQUEST_HEADERS, _BAD_REQUEST_BODY)
 _REQUEST_TOO_LONG_RESPONSE = b"HTTP/1.1 414 Request URI Too Long\r\nConnection: close\r\nContent-length: 0\r\n\r\n"
 _BAD_REQUEST_RESPONSE = b"HTTP/1.1 400 Bad Request\r\nConnection: close\r\nContent-length: 0\r\n\r\n"
 _CONTINUE_RESPONSE = b"HTTP/1.1 100 Continue\r\n\r\n"
+_SERVICE_UNAVAILABLE_RESPONSE = b"HTTP/1.1 503 Service Unavailable\r\nConnection: close\r\nContent-length: 0\r\n\r\n"
+_H2C_UPGRADE_RESPONSE = b"HTTP/1.1 101 Switching Protocols\r\nConnection: Upgrade\r\nUpgrade: h2c\r\n\r\n"
+_WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+# The end of each permessage-deflate message (RFC 7692 7.2.1)
+_DEFLATE_TAIL = b'\x00\x00\xff\xff'
 
 
 def format_date_time(timestamp):
@@ -92,6 +119,173 @@ def format_date_time(timestamp):
     return value
 
 
+class _DateCache(object):
+    # The value for the Date header, formatted at most once a second.
+    # The time comes from the loop, which caches it for each iteration.
+
+    __slots__ = ('loop', 'second', 'value')
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.second = None
+        self.value = None
+
+    def __call__(self):
+        second = int(self.loop.now())
+        if second != self.second:
+            self.value = format_date_time(second)
+            self.second = second
+        return self.value
+
+
+def _join_buffers(buffers):
+    # b''.join(buffers) for sockets that can't gather them. Python 2's
+    # str.join only takes str, but applications may give us a
+    # bytearray or memoryview.
+    if PY3:
+        return b''.join(buffers)
+    return b''.join([data if isinstance(data, bytes) else memoryview(data).tobytes()
+                     for data in buffers])
+
+
+# Validated and encoded values from start_response, keyed by the native
+# strings the application passed: status -> (encoded status, code), and
+# header name -> (encoded name, lower-case name). Applications mostly
+# send the same few of each. Header values are never cached: many are
+# different for each response (cookies, locations, lengths), and
+# may be secrets. The size is limited all the same.
+_STATUS_CACHE = {}
+_HEADER_NAME_CACHE = {}
+_MAX_CACHED_HEADERS = 1024
+
+
+def _encode_status(status):
+    if not isinstance(status, str):
+        raise UnicodeError("The status string must be a native string")
+    if '\r' in status or '\n' in status:
+        raise ValueError("carriage return or newline in status", status)
+    # don't assign to anything until the validation is complete, including parsing the
+    # code
+    code = int(status.split(' ', 1)[0])
+    return (status if not PY3 else status.encode("latin-1")), code
+
+
+def _encode_header_value(header, value):
+    # Check and encode *value*, once *header* is known to be good.
+    if not isinstance(value, str):
+        raise UnicodeError("The value must be a native string", header, value)
+    if '\r' in value or '\n' in value:
+        raise ValueError('carriage return or newline in header value', value)
+    if not PY3:
+        return value
+    try:
+        return value.encode("latin-1")
+    except UnicodeEncodeError:
+        raise UnicodeError("Non-latin1 header", repr(header), repr(value))
+
+
+def _encode_header(header, value):
+    if not isinstance(header, str):
+        raise UnicodeError("The header must be a native string", header, value)
+    if not isinstance(value, str):
+        raise UnicodeError("The value must be a native string", header, value)
+    if '\r' in header or '\n' in header:
+        raise ValueError('carriage return or newline in header name', header)
+    if '\r' in value or '\n' in value:
+        raise ValueError('carriage return or newline in header value', value)
+    # Either we're on Python 2, in which case bytes is correct, or
+    # we're on Python 3 and the user screwed up (because it should be a native
+    # string). In either case, make sure that this is latin-1 compatible. Under
+    # Python 2, bytes.encode() will take a round-trip through the system encoding,
+    # which may be ascii, which is not really what we want. However, the latin-1 encoding
+    # can encode everything except control characters and the block from 0x7F to 0x9F, so
+    # explicitly round-tripping bytes through the encoding is unlikely to be of much
+    # benefit, so we go for speed (the WSGI spec specifically calls out allowing the range
+    # from 0x00 to 0xFF, although the HTTP spec forbids the control characters).
+    # Note: Some Python 2 implementations, like Jython, may allow non-octet (above 255) values
+    # in their str implementation; this is mentioned in the WSGI spec, but we don't
+    # run on any platform like that so we can assume that a str value is pure bytes.
+    try:
+        encoded = (header if not PY3 else header.encode("latin-1"),
+                   value if not PY3 else value.encode("latin-1"))
+    except UnicodeEncodeError:
+        raise UnicodeError("Non-latin1 header", repr(header), repr(value))
+    return encoded, header.lower()
+
+
+# Accept-Encoding header value -> the content coding we use for it
+# (see WSGIServer.compression), limited like the caches above.
+_ACCEPT_ENCODING_CACHE = {}
+
+
+def _choose_encoding(accept_encoding):
+    # Return b'gzip', b'deflate' or None for an Accept-Encoding
+    # header, preferring gzip.
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        coding, _, params = coding.partition(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip().lower()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding] = quality
+    default = qualities.get('*', 0.0)
+    for coding in ('gzip', 'deflate'):
+        if qualities.get(coding, default) > 0:
+            return coding.encode('ascii')
+    return None
+
+
+def _compressobj(encoding, level):
+    # gzip is the zlib stream in a gzip wrapper; "deflate" is
+    # (despite its name) the zlib format.
+    wbits = zlib.MAX_WBITS | 16 if encoding == b'gzip' else zlib.MAX_WBITS
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+def _compress_all(compressor, data):
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compress_sync(compressor, data):
+    # Everything so far, decodable by the client without waiting
+    # for more.
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class _CompressedResult(object):
+    # Iterates an application's result, compressing each chunk.
+
+    __slots__ = ('result', 'compressor', 'threadpool', 'threadpool_size')
+
+    def __init__(self, result, compressor, threadpool, threadpool_size):
+        self.result = result
+        self.compressor = compressor
+        self.threadpool = threadpool
+        self.threadpool_size = threadpool_size
+
+    def __iter__(self):
+        compressor = self.compressor
+        for data in self.result:
+            if not data:
+                continue
+            if len(data) >= self.threadpool_size:
+                # zlib releases the GIL, so other greenlets run meanwhile
+                yield self.threadpool.apply(_compress_sync, (compressor, data))
+            else:
+                yield _compress_sync(compressor, data)
+        yield compressor.flush()
+
+    def close(self):
+        close = getattr(self.result, 'close', None)
+        if close is not None:
+            close()
+
+
 class _InvalidClientInput(IOError):
     # Internal exception raised by Input indicating that the client
     # sent invalid data at the lowest level of the stream. The result
@@ -194,6 +388,34 @@ class Input(object):
 
         return read
 
+    def _fill(self, view):
+        # Read into all of *view* unless the input ends first, returning
+        # the number of bytes read. Files that can, read straight into
+        # it; Python 2's socket._fileobject can't.
+        rfile = self.rfile
+        readinto = getattr(rfile, 'readinto', None)
+        if readinto is not None:
+            return readinto(view) or 0
+        data = rfile.read(len(view))
+        count = len(data)
+        view[:count] = data
+        return count
+
+    def _do_readinto(self, view):
+        content_length = self.content_length
+        if content_length is None:
+            return 0
+
+        self._send_100_continue()
+        length = min(len(view), content_length - self.position)
+        if length <= 0:
+            return 0
+        count = self._fill(view[:length])
+        self.position += count
+        if count < length:
+            raise IOError("unexpected end of file while reading request at position %s" % (self.position,))
+        return count
+
     def __read_chunk_length(self, rfile):
         # Read and return the next integer chunk length. If no
         # chunk length can be read, raises _InvalidClientInput.
@@ -300,20 +522,65 @@ class Input(object):
                 if use_readline and data[-1] == b"\n"[0]:
                     break
             else:
-                # We're at the beginning of a chunk, so we need to
-                # determine the next size to read
-                self.chunk_length = self.__read_chunk_length(rfile)
-                self.position = 0
-                if self.chunk_length == 0:
-                    # Last chunk. Terminates with a CRLF.
-                    rfile.readline()
+                self._next_chunk(rfile)
         return b''.join(response)
 
+    def _next_chunk(self, rfile):
+        # We're at the beginning of a chunk, so we need to
+        # determine the next size to read
+        self.chunk_length = self.__read_chunk_length(rfile)
+        self.position = 0
+        if self.chunk_length == 0:
+            # Last chunk. Terminates with a CRLF.
+            rfile.readline()
+
+    def _chunked_readinto(self, view):
+        # Decode the chunks straight into *view*, without joining them
+        # first.
+        rfile = self.rfile
+        self._send_100_continue()
+
+        size = len(view)
+        total = 0
+        while total < size and self.chunk_length != 0:
+            maxreadlen = self.chunk_length - self.position
+            if maxreadlen > 0:
+                end = total + min(maxreadlen, size - total)
+                count = self._fill(view[total:end])
+                if not count:
+                    self.chunk_length = 0
+                    self._chunked_input_error = True
+                    raise IOError("unexpected end of file while parsing chunked data")
+                total += count
+                self.position += count
+                if self.chunk_length == self.position:
+                    rfile.readline()
+            else:
+                self._next_chunk(rfile)
+        return total
+
     def read(self, length=None):
         if self.chunked_input:
             return self._chunked_read(length)
         return self._do_read(length)
 
+    def readinto(self, buf):
+        """
+        Read up to ``len(buf)`` bytes of the body into the writable
+        buffer *buf* (such as a :class:`bytearray` or a
+        :class:`memoryview` of one) and return how many were read.
+        Fewer are read only at the end of the body, when this returns
+        0. The data, including decoded chunks, is read into *buf*
+        directly, so an application can copy a large upload to a file
+        through one reusable buffer.
+
+        .. versionadded:: 1.2a1
+        """
+        view = memoryview(buf)
+        if self.chunked_input:
+            return self._chunked_readinto(view)
+        return self._do_readinto(view)
+
     def readline(self, size=None):
         if self.chunked_input:
             return self._chunked_read(size, True)
@@ -368,6 +635,347 @@ except ImportError:
         return ret
 
 
+class FileWrapper(object):
+    """
+    The ``wsgi.file_wrapper`` provided in the WSGI environment
+    (:pep:`3333#optional-platform-specific-file-handling`).
+
+    Applications can return an instance of this class wrapping a
+    file-like object opened in binary mode::
+
+        def application(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'application/octet-stream')])
+            return environ['wsgi.file_wrapper'](open(path, 'rb'))
+
+    When the wrapped object is a regular file and the socket supports
+    it, :class:`WSGIHandler` sends the file using
+    :meth:`socket.sendfile <gevent.socket.socket.sendfile>` (and hence
+    :func:`os.sendfile` where available), with a ``Content-Length``
+    computed from the size of the file, instead of reading it into
+    memory. Otherwise, this is simply an iterable that reads
+    *blksize* bytes at a time.
+
+    .. versionadded:: 1.2a1
+    """
+
+    __slots__ = ('filelike', 'blksize')
+
+    def __init__(self, filelike, blksize=8192):
+        self.filelike = filelike
+        self.blksize = blksize
+
+    def close(self):
+        close = getattr(self.filelike, 'close', None)
+        if close is not None:
+            close()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        data = self.filelike.read(self.blksize)
+        if data:
+            return data
+        raise StopIteration
+    __next__ = next
+
+
+class WebSocket(object):
+    """
+    A WebSocket (:rfc:`6455`) connection, the value of
+    ``environ['wsgi.websocket']`` when a :class:`WSGIServer` created
+    with ``websocket=True`` receives a valid upgrade request.
+
+    The application may look at the :attr:`protocols` the client asked
+    for and :meth:`accept` the connection (the first :meth:`receive` or
+    :meth:`send` accepts it with the defaults), then exchange messages
+    until :meth:`receive` returns None. If the application returns
+    without accepting, its response is sent as usual. Once it has
+    accepted, its return value is ignored and the connection is closed
+    when it returns.
+
+    Messages compressed with the permessage-deflate extension
+    (:rfc:`7692`) are supported, and pings are answered
+    automatically. Frames are unmasked by the compiled
+    ``gevent._websocket`` module where it is available.
+
+    .. versionadded:: 1.2a1
+    """
+
+    #: The largest message, in bytes after decompression, that
+    #: :meth:`receive` accepts; the connection is closed with code 1009
+    #: if the client sends a larger one.
+    max_message_size = 16 * 1024 * 1024
+
+    #: The zlib compression level for permessage-deflate.
+    compression_level = 6
+
+    #: Has the handshake response been sent?
+    accepted = False
+    #: Has the connection been closed (or failed)?
+    closed = False
+    #: The subprotocol passed to :meth:`accept`.
+    protocol = None
+    #: The close code received from the client, or of the error that
+    #: closed the connection.
+    close_code = None
+    #: The reason received with :attr:`close_code`.
+    close_reason = None
+
+    _compressor = None
+    _decompressor = None
+    _window_bits = 15
+    _no_context_takeover = False
+
+    def __init__(self, handler, key):
+        self.handler = handler
+        self._key = key
+        self._socket = handler.socket
+        self._rfile = handler.rfile
+        self._send_lock = Semaphore()
+
+    @property
+    def protocols(self):
+        """The subprotocols the client offered, in its order of preference."""
+        value = self.handler.headers.get('Sec-WebSocket-Protocol') or ''
+        return [p.strip() for p in value.split(',') if p.strip()]
+
+    def accept(self, protocol=None, headers=(), compress=True):
+        """
+        Send the handshake response. Does nothing if it has already
+        been sent.
+
+        :keyword str protocol: The subprotocol to use, one of
+            :attr:`protocols`.
+        :keyword headers: Other ``(name, value)`` response headers.
+        :keyword bool compress: If false, messages aren't compressed
+            even if the client offers permessage-deflate.
+        """
+        if self.accepted:
+            return
+        if self.closed:
+            raise WebSocketError(_websocket.CLOSE_ABNORMAL, 'WebSocket is closed')
+        handler = self.handler
+        digest = sha1(self._key.encode('latin-1') + _WEBSOCKET_GUID).digest()
+        response = ['HTTP/1.1 101 Switching Protocols',
+                    'Upgrade: websocket',
+                    'Connection: Upgrade',
+                    'Sec-WebSocket-Accept: ' + b64encode(digest).decode('ascii')]
+        if protocol:
+            self.protocol = protocol
+            response.append('Sec-WebSocket-Protocol: ' + protocol)
+        if compress:
+            extension = self._negotiate_deflate()
+            if extension:
+                response.append('Sec-WebSocket-Extensions: ' + extension)
+        for name, value in headers:
+            response.append('%s: %s' % (name, value))
+        response.append('\r\n')
+
+        handler.code = 101
+        handler.status = b'101 Switching Protocols'
+        handler._orig_status = '101 Switching Protocols'
+        handler.close_connection = True
+        handler._flush_corked()
+        handler._sendall('\r\n'.join(response).encode('latin-1'))
+        handler.headers_sent = True
+        self.accepted = True
+
+    def _negotiate_deflate(self):
+        # Accept the first permessage-deflate offer that we can and
+        # return its response parameters.
+        offers = self.handler.headers.get('Sec-WebSocket-Extensions') or ''
+        for offer in offers.split(','):
+            params = [param.strip() for param in offer.split(';')]
+            if params[0] != 'permessage-deflate':
+                continue
+            response = [params[0]]
+            window_bits = 15
+            no_context_takeover = False
+            for param in params[1:]:
+                name, _, value = param.partition('=')
+                name = name.strip()
+                value = value.strip().strip('"')
+                if name == 'server_no_context_takeover':
+                    no_context_takeover = True
+                    response.append(name)
+                elif name == 'server_max_window_bits':
+                    # zlib can't produce 8 bit windows
+                    if not value.isdigit() or not 9 <= int(value) <= 15:
+                        break
+                    window_bits = int(value)
+                    response.append(param)
+                elif name not in ('client_no_context_takeover', 'client_max_window_bits'):
+                    # Our decompressor handles any window and context
+                    # takeover, so those need no answer.
+                    break
+            else:
+                self._window_bits = window_bits
+                self._no_context_takeover = no_context_takeover
+                self._compressor = self._new_compressor()
+                self._decompressor = zlib.decompressobj(-15)
+                return '; '.join(response)
+        return None
+
+    def _new_compressor(self):
+        return zlib.compressobj(self.compression_level, zlib.DEFLATED, -self._window_bits)
+
+    def send(self, message, binary=None):
+        """
+        Send *message*. A text (unicode) message is sent as text,
+        encoded in UTF-8, and anything else (bytes) as binary, unless
+        *binary* says otherwise.
+        """
+        if not self.accepted:
+            # Before deciding whether to compress
+            self.accept()
+        if isinstance(message, text_type):
+            message = message.encode('utf-8')
+            if binary is None:
+                binary = False
+        elif binary is None:
+            binary = True
+        self._send_frame(_websocket.OP_BINARY if binary else _websocket.OP_TEXT,
+                         message, self._compressor is not None)
+
+    def ping(self, data=b''):
+        """
+        Send a ping. The client's pong is not reported.
+        """
+        self._send_frame(_websocket.OP_PING, data)
+
+    def _send_frame(self, opcode, payload, compress=False):
+        if not self.accepted:
+            self.accept()
+        if self.closed:
+            raise WebSocketError(_websocket.CLOSE_ABNORMAL, 'WebSocket is closed')
+        rsv1 = False
+        if compress and payload:
+            compressor = self._compressor
+            payload = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if payload.endswith(_DEFLATE_TAIL):
+                payload = payload[:-4]
+            if self._no_context_takeover:
+                self._compressor = self._new_compressor()
+            rsv1 = True
+        header = _websocket.frame_header(opcode, len(payload), True, rsv1)
+        # Frames sent from different greenlets mustn't interleave.
+        with self._send_lock:
+            self.handler._sendall_vectored([header, payload])
+
+    def receive(self):
+        """
+        Wait for and return the next message: text as a unicode string,
+        binary as bytes. Returns None once the connection has closed,
+        either normally or because of an error (see :attr:`close_code`).
+        """
+        if not self.accepted:
+            self.accept()
+        if self.closed:
+            return None
+        try:
+            return self._receive()
+        except WebSocketError as ex:
+            self.close_code = ex.code
+            self.close_reason = ex.reason
+            if ex.code == _websocket.CLOSE_ABNORMAL:
+                self.closed = True
+            else:
+                self.close(ex.code)
+        except socket.error:
+            self.close_code = _websocket.CLOSE_ABNORMAL
+            self.closed = True
+        if not PY3:
+            sys.exc_clear()
+        return None
+
+    def _receive(self):
+        # pylint:disable=too-many-branches
+        read = self._rfile.read
+        max_size = self.max_message_size
+        fragments = []
+        size = 0
+        message_opcode = None
+        compressed = False
+        while True:
+            fin, rsv1, opcode, payload = _websocket.read_frame(read, max_size)
+            if opcode >= _websocket.OP_CLOSE:
+                if opcode == _websocket.OP_PING:
+                    self._send_frame(_websocket.OP_PONG, payload)
+                elif opcode == _websocket.OP_CLOSE:
+                    self._received_close(payload)
+                    return None
+                continue
+            if opcode == _websocket.OP_CONTINUATION:
+                if message_opcode is None or rsv1:
+                    raise WebSocketError(_websocket.CLOSE_PROTOCOL_ERROR, 'Unexpected continuation frame')
+            else:
+                if message_opcode is not None:
+                    raise WebSocketError(_websocket.CLOSE_PROTOCOL_ERROR, 'Expected a continuation frame')
+                if rsv1 and self._decompressor is None:
+                    raise WebSocketError(_websocket.CLOSE_PROTOCOL_ERROR, 'Reserved bits set')
+                message_opcode = opcode
+                compressed = rsv1
+            size += len(payload)
+            if size > max_size:
+                raise WebSocketError(_websocket.CLOSE_TOO_BIG, 'Message too large')
+            fragments.append(payload)
+            if fin:
+                break
+
+        data = fragments[0] if len(fragments) == 1 else b''.join(fragments)
+        if compressed:
+            data = self._decompressor.decompress(data + _DEFLATE_TAIL, max_size + 1)
+            if len(data) > max_size:
+                raise WebSocketError(_websocket.CLOSE_TOO_BIG, 'Message too large')
+        if message_opcode == _websocket.OP_TEXT:
+            try:
+                return data.decode('utf-8')
+            except UnicodeDecodeError:
+                raise WebSocketError(_websocket.CLOSE_INVALID_DATA, 'Invalid UTF-8')
+        return data
+
+    def _received_close(self, payload):
+        code = _websocket.CLOSE_NORMAL
+        reason = u''
+        if payload:
+            if len(payload) < 2:
+                raise WebSocketError(_websocket.CLOSE_PROTOCOL_ERROR, 'Invalid close frame')
+            code = bytearray(payload[:2])
+            code = code[0] << 8 | code[1]
+            if code < 1000 or 1004 <= code <= 1006 or 1015 <= code < 3000:
+                raise WebSocketError(_websocket.CLOSE_PROTOCOL_ERROR, 'Invalid close code')
+            try:
+                reason = payload[2:].decode('utf-8')
+            except UnicodeDecodeError:
+                raise WebSocketError(_websocket.CLOSE_INVALID_DATA, 'Invalid UTF-8')
+        if self.close_code is None:
+            self.close_code = code
+            self.close_reason = reason
+        # Echo it, unless we started the closing handshake
+        self.close(code)
+
+    def close(self, code=_websocket.CLOSE_NORMAL, reason=u''):
+        """
+        Send a close frame, if the connection is open. A greenlet
+        waiting in :meth:`receive` returns None when the client
+        answers.
+        """
+        if self.closed:
+            return
+        if not self.accepted:
+            # Rejected; the application sends a response
+            self.closed = True
+            return
+        payload = bytes(bytearray((code >> 8, code & 0xFF))) + reason.encode('utf-8')
+        try:
+            self._send_frame(_websocket.OP_CLOSE, payload)
+        except socket.error:
+            if not PY3:
+                sys.exc_clear()
+        self.closed = True
+
+
 class WSGIHandler(object):
     """
     Handles HTTP requests from a socket, creates the WSGI environment, and
@@ -423,6 +1031,21 @@ class WSGIHandler(object):
     request_version = None # str: 'HTTP 1.1'
     command = None # str: 'GET'
     path = None # str: '/'
+    # Output buffering (see WSGIServer.output_buffer_size)
+    _output = None # list of byte strings yielded but not yet sent
+    _output_len = 0 # sum of the lengths in _output
+    _output_time = 0 # loop.now() when the first chunk was buffered
+    _output_flush = None # AsyncResult for a flush running in another greenlet
+    # Pipelining (see WSGIServer.max_pipeline)
+    _corked = None # list of byte strings of responses being held back
+    _corked_requests = 0 # number of responses in _corked
+    _cork_release = False # send _corked after the current response
+    # Keep-alive (see WSGIServer.keepalive_timeout)
+    _request_count = 0 # requests read from this connection
+    _last_request = False # close the connection after this response
+    _idle = False # in the server's _idle_handlers, waiting for a request
+    _websocket = None # WebSocket for an upgrade request (see WSGIServer.websocket)
+    _content_encoding = None # b'gzip' or b'deflate' to compress the result (see WSGIServer.compression)
 
     def __init__(self, sock, address, server, rfile=None):
         # Deprecation: The rfile kwarg was introduced in 1.0a1 as part
@@ -434,7 +1057,12 @@ class WSGIHandler(object):
         self.client_address = address
         self.server = server
         if rfile is None:
-            self.rfile = sock.makefile('rb', -1)
+            buffer_pool = getattr(server, '_read_buffer_pool', None)
+            if buffer_pool is not None and hasattr(sock, '_read_event'):
+                # A gevent socket (see WSGIServer.pool_read_buffers)
+                self.rfile = buffer_pool.makefile(sock)
+            else:
+                self.rfile = sock.makefile('rb', -1)
         else:
             self.rfile = rfile
 
@@ -448,11 +1076,19 @@ class WSGIHandler(object):
         keep-alive).
         """
         try:
+            if self._alpn_http2():
+                self._run_http2()
+                return
             while self.socket is not None:
                 self.time_start = time.time()
                 self.time_finish = 0
 
                 result = self.handle_one_request()
+                if self._corked is not None and (result is not True or self._cork_release):
+                    try:
+                        self._flush_corked()
+                    except socket.error:
+                        break
                 if result is None:
                     break
                 if result is True:
@@ -528,7 +1164,11 @@ class WSGIHandler(object):
         else:
             raise _InvalidClientRequest('Invalid HTTP method: %r', raw_requestline)
 
-        self.headers = self.MessageClass(self.rfile, 0)
+        parser = getattr(self.server, 'parser', None)
+        if parser is None:
+            self.headers = self.MessageClass(self.rfile, 0)
+        else:
+            self.headers = parser(self.rfile)
 
         if self.headers.status:
             raise _InvalidClientRequest('Invalid headers status: %r', self.headers.status)
@@ -631,9 +1271,10 @@ class WSGIHandler(object):
            this is experimental and may change in the future.
         """
         # pylint:disable=too-many-return-statements
-        if self.rfile.closed:
+        if self.rfile.closed or getattr(self.server, 'draining', False):
             return
 
+        timeout = self._begin_idle()
         try:
             self.requestline = self.read_requestline()
             # Account for old subclasses that haven't done this
@@ -642,10 +1283,22 @@ class WSGIHandler(object):
         except socket.error:
             # "Connection reset by peer" or other socket errors aren't interesting here
             return
+        except Timeout as ex:
+            if ex is not timeout:
+                raise
+            # The client kept the connection open without using it
+            return
+        finally:
+            self._end_idle(timeout)
 
         if not self.requestline:
             return
 
+        if self.requestline == 'PRI * HTTP/2.0\r\n' and getattr(self.server, 'http2', False):
+            # HTTP/2 with prior knowledge (RFC 7540 3.4)
+            self._run_http2(b'PRI * HTTP/2.0\r\n')
+            return
+
         self.response_length = 0
 
         if len(self.requestline) >= MAX_REQUEST_LINE:
@@ -664,12 +1317,44 @@ class WSGIHandler(object):
             # Provide a hook for subclasses.
             return self._handle_client_error(ex)
 
+        self._request_count += 1
+        limit = getattr(self.server, 'max_keepalive_requests', None)
+        self._last_request = limit is not None and self._request_count >= limit
+
         self.environ = self.get_environ()
         self.application = self.server.application
 
-        self.handle_one_response()
+        settings = self._h2c_upgrade_settings()
+        if settings is not None:
+            try:
+                self._flush_corked()
+                self.socket.sendall(_H2C_UPGRADE_RESPONSE)
+            except socket.error:
+                return
+            self._run_http2(upgrade=(settings, self.environ))
+            return
+
+        try:
+            self._cork_if_pipelined()
+        except socket.error:
+            # Sending the held responses failed
+            return
+        if self._corked is None:
+            self.handle_one_response()
+        else:
+            # Don't let the held responses wait on an application
+            # that blocks.
+            current = getcurrent()
+            hook = getattr(current, 'switch_out', None) is None
+            if hook:
+                current.switch_out = self._corked_switch_out
+            try:
+                self.handle_one_response()
+            finally:
+                if hook:
+                    del current.switch_out
 
-        if self.close_connection:
+        if self.close_connection or self._last_request or getattr(self.server, 'draining', False):
             return
 
         if self.rfile.closed:
@@ -677,9 +1362,137 @@ class WSGIHandler(object):
 
         return True  # read more requests
 
+    def _alpn_http2(self):
+        # Did a TLS client choose HTTP/2?
+        if not getattr(self.server, 'http2', False):
+            return False
+        selected = getattr(self.socket, 'selected_alpn_protocol', None)
+        return selected is not None and selected() == 'h2'
+
+    def _h2c_upgrade_settings(self):
+        # If the client asked to switch to HTTP/2 (RFC 7540 3.2), and
+        # we can, return its HTTP2-Settings. Requests with a body
+        # are answered with HTTP/1.1.
+        if not getattr(self.server, 'http2', False):
+            return None
+        upgrade = self.headers.get('Upgrade') or ''
+        if 'h2c' not in [token.strip() for token in upgrade.lower().split(',')]:
+            return None
+        settings = self.headers.get('HTTP2-Settings')
+        if (settings is None or self.content_length or self.wsgi_input.chunked_input
+                or getattr(self.socket, '_sslobj', None) is not None):
+            return None
+        return settings.strip()
+
+    def _run_http2(self, preface=b'', upgrade=None):
+        from gevent._http2 import HTTP2Connection
+        HTTP2Connection(self).run(preface, upgrade)
+
+    def _begin_idle(self):
+        # Called before waiting for a request line. Returns an object
+        # with a cancel() method: the Timeout for keepalive_timeout, if
+        # any.
+        server = self.server
+        idle = getattr(server, '_idle_handlers', None)
+        if idle is not None:
+            self._idle = True
+            idle[self] = getcurrent()
+            if self._request_count:
+                # A kept-alive connection
+                server._close_idle_connections()
+        return Timeout._start_new_or_dummy(getattr(server, 'keepalive_timeout', None))
+
+    def _end_idle(self, timeout):
+        timeout.cancel()
+        if self._idle:
+            self._idle = False
+            self.server._idle_handlers.pop(self, None)
+
+    def _request_buffered(self):
+        # Has all of the head of another request already been read
+        # into rfile's buffer, so that reading it can't block? This
+        # must not block, and doesn't need to be exact.
+        rfile = self.rfile
+        rbuf = getattr(rfile, '_rbuf', None)
+        if rbuf is not None:
+            # Python 2 socket._fileobject
+            data = rbuf.getvalue()
+        else:
+            peek = getattr(rfile, 'peek', None)
+            if peek is None:
+                return False
+            # Python 3 BufferedReader. If nothing is buffered, peek reads
+            # from the socket, which returns nothing instead of waiting
+            # when the timeout is 0; otherwise it returns what's buffered.
+            sock = self.socket
+            timeout = sock.gettimeout()
+            sock.settimeout(0.0)
+            try:
+                data = peek(1)
+            except (socket.error, ValueError):
+                if not PY3:
+                    sys.exc_clear()
+                return False
+            finally:
+                sock.settimeout(timeout)
+        return b'\r\n\r\n' in data or b'\n\n' in data
+
+    def _cork_if_pipelined(self):
+        # If the client has already sent all of the next request, hold
+        # on to this response and send it with the next one(s).
+        limit = getattr(self.server, 'max_pipeline', 0)
+        has_body = self.content_length or self.wsgi_input.chunked_input
+        waiting = (limit > 1
+                   and not has_body
+                   and getattr(self.socket, '_sslobj', None) is None
+                   and self._request_buffered())
+        if self._corked is None:
+            if not waiting:
+                return
+            self._corked = []
+            self._corked_requests = 0
+        elif has_body or self.environ.get('HTTP_EXPECT') == '100-continue':
+            # The client may not send the body until it has the held
+            # responses, and the interim response mustn't overtake them.
+            self._flush_corked()
+            return
+        self._corked_requests += 1
+        self._cork_release = not waiting or self._corked_requests >= limit
+
+    def _corked_switch_out(self):
+        # Called by the hub when the application is about to block. We
+        # must not block here, so send what we can without waiting and
+        # keep the rest.
+        corked = self._corked
+        if not corked:
+            return
+        data = corked[0] if len(corked) == 1 else _join_buffers(corked)
+        try:
+            sent = self.socket.send(data, 0, 0.0)
+        except socket.error:
+            # Probably EWOULDBLOCK; a real error will be raised again
+            # by the next blocking send.
+            if not PY3:
+                sys.exc_clear()
+            sent = 0
+        corked[:] = [data[sent:]] if sent < len(data) else []
+
+    def _flush_corked(self):
+        corked = self._corked
+        self._corked = None
+        if not corked:
+            return
+        sendall_vectored = getattr(self.socket, 'sendall_vectored', None)
+        if sendall_vectored is not None:
+            sendall_vectored(corked)
+        else:
+            self.socket.sendall(_join_buffers(corked))
+
     def finalize_headers(self):
         if self.provided_date is None:
-            self.response_headers.append((b'Date', format_date_time(time.time())))
+            http_date = getattr(self.server, '_http_date', None)
+            self.response_headers.append((b'Date', http_date() if http_date is not None
+                                          else format_date_time(time.time())))
 
         if self.code not in (304, 204):
             # the reply will include message-body; make sure we have either Content-Length or chunked
@@ -696,6 +1509,10 @@ class WSGIHandler(object):
                         self.response_headers.append((b'Transfer-Encoding', b'chunked'))
 
     def _sendall(self, data):
+        if self._corked is not None:
+            self._corked.append(data)
+            self.response_length += len(data)
+            return
         try:
             self.socket.sendall(data)
         except socket.error as ex:
@@ -705,22 +1522,45 @@ class WSGIHandler(object):
             raise
         self.response_length += len(data)
 
-    def _write(self, data):
+    def _sendall_vectored(self, buffers):
+        # Like _sendall(b''.join(buffers)), but let the socket gather
+        # the buffers into one system call if it can.
+        sendall_vectored = getattr(self.socket, 'sendall_vectored', None)
+        try:
+            if self._corked is not None:
+                self._corked.extend(buffers)
+            elif sendall_vectored is not None:
+                sendall_vectored(buffers)
+            else:
+                self.socket.sendall(_join_buffers(buffers))
+        except socket.error as ex:
+            self.status = 'socket error: %s' % ex
+            if self.code > 0:
+                self.code = -self.code
+            raise
+        for data in buffers:
+            self.response_length += len(data)
+
+    def _write(self, data, headers=None):
+        # *headers* is the encoded status line and headers, if they
+        # haven't been sent yet; they go out in the same system call as
+        # the first data.
         if not data:
             # The application/middleware are allowed to yield
             # empty bytestrings.
+            if headers:
+                self._sendall(headers)
             return
 
         if self.response_use_chunked:
             ## Write the chunked encoding
             header = ("%x\r\n" % len(data)).encode('ascii')
-            # socket.sendall will slice these small strings, as [0:],
-            # but that's special cased to return the original string.
-            # They're small enough we probably expect them to go down to the network
-            # buffers in one go anyway.
-            self._sendall(header)
-            self._sendall(data)
-            self._sendall(b'\r\n') # trailer
+            if headers:
+                self._sendall_vectored((headers, header, data, b'\r\n'))
+            else:
+                self._sendall_vectored((header, data, b'\r\n')) # trailer
+        elif headers:
+            self._sendall_vectored((headers, data))
         else:
             self._sendall(data)
 
@@ -732,6 +1572,15 @@ class WSGIHandler(object):
         if self.code in (304, 204) and data:
             raise AssertionError('The %s response must have no body' % self.code)
 
+        # Only the result iterable is compressed; once the
+        # application uses this, it's too late.
+        self._content_encoding = None
+
+        if self._output or self._output_flush is not None:
+            # Buffered data was yielded before this; send it first.
+            # The write callable is never buffered itself.
+            self._flush_output()
+
         if self.headers_sent:
             self._write(data)
         else:
@@ -740,26 +1589,17 @@ class WSGIHandler(object):
             self._write_with_headers(data)
 
     def _write_with_headers(self, data):
-        towrite = bytearray()
         self.headers_sent = True
         self.finalize_headers()
 
         # self.response_headers and self.status are already in latin-1, as encoded by self.start_response
-        towrite.extend(b'HTTP/1.1 ')
-        towrite.extend(self.status)
-        towrite.extend(b'\r\n')
-        for header, value in self.response_headers:
-            towrite.extend(header)
-            towrite.extend(b': ')
-            towrite.extend(value)
-            towrite.extend(b"\r\n")
-
-        towrite.extend(b'\r\n')
-        self._sendall(towrite)
-        # No need to copy the data into towrite; we may make an extra syscall
-        # but the copy time could be substantial too, and it reduces the chances
-        # of sendall being able to send everything in one go
-        self._write(data)
+        towrite = [b'HTTP/1.1 ' + self.status]
+        towrite.extend([header + b': ' + value for header, value in self.response_headers])
+        towrite.append(b'\r\n')
+        towrite = b'\r\n'.join(towrite)
+        # No need to copy the data into towrite; the copy time could be
+        # substantial. Instead the socket gathers both into one syscall.
+        self._write(data, towrite)
 
     def start_response(self, status, headers, exc_info=None):
         """
@@ -792,70 +1632,61 @@ class WSGIHandler(object):
         # UnicodeError without any clue which header was wrong.
         # Note that this results in copying the header list at this point, not modifying it,
         # although we are allowed to do so if needed. This slightly increases memory usage.
-        # We also check for HTTP Response Splitting vulnerabilities
+        # We also check for HTTP Response Splitting vulnerabilities.
+        # The results of checking and encoding the status and header
+        # names are cached, so the usual ones cost only a dictionary
+        # lookup. (The exact type check keeps unicode objects on Python
+        # 2, which compare equal to str, from using a cached str entry.)
         response_headers = []
-        header = None
-        value = None
-        try:
-            for header, value in headers:
-                if not isinstance(header, str):
-                    raise UnicodeError("The header must be a native string", header, value)
-                if not isinstance(value, str):
-                    raise UnicodeError("The value must be a native string", header, value)
-                if '\r' in header or '\n' in header:
-                    raise ValueError('carriage return or newline in header name', header)
-                if '\r' in value or '\n' in value:
-                    raise ValueError('carriage return or newline in header value', value)
-                # Either we're on Python 2, in which case bytes is correct, or
-                # we're on Python 3 and the user screwed up (because it should be a native
-                # string). In either case, make sure that this is latin-1 compatible. Under
-                # Python 2, bytes.encode() will take a round-trip through the system encoding,
-                # which may be ascii, which is not really what we want. However, the latin-1 encoding
-                # can encode everything except control characters and the block from 0x7F to 0x9F, so
-                # explicitly round-tripping bytes through the encoding is unlikely to be of much
-                # benefit, so we go for speed (the WSGI spec specifically calls out allowing the range
-                # from 0x00 to 0xFF, although the HTTP spec forbids the control characters).
-                # Note: Some Python 2 implementations, like Jython, may allow non-octet (above 255) values
-                # in their str implementation; this is mentioned in the WSGI spec, but we don't
-                # run on any platform like that so we can assume that a str value is pure bytes.
-                response_headers.append((header if not PY3 else header.encode("latin-1"),
-                                         value if not PY3 else value.encode("latin-1")))
-        except UnicodeEncodeError:
-            # If we get here, we're guaranteed to have a header and value
-            raise UnicodeError("Non-latin1 header", repr(header), repr(value))
+        provided_connection = None
+        provided_date = None
+        provided_content_length = None
+        name_cache = _HEADER_NAME_CACHE
+        for header, value in headers:
+            entry = None
+            if header.__class__ is str:
+                entry = name_cache.get(header)
+            if entry is None:
+                encoded, lower = _encode_header(header, value)
+                if header.__class__ is str and len(name_cache) < _MAX_CACHED_HEADERS:
+                    name_cache[header] = (encoded[0], lower)
+            else:
+                encoded = (entry[0], _encode_header_value(header, value))
+                lower = entry[1]
+            response_headers.append(encoded)
+            if lower == 'connection':
+                provided_connection = value
+            elif lower == 'date':
+                provided_date = value
+            elif lower == 'content-length':
+                provided_content_length = value
 
         # Same as above
-        if not isinstance(status, str):
-            raise UnicodeError("The status string must be a native string")
-        if '\r' in status or '\n' in status:
-            raise ValueError("carriage return or newline in status", status)
-        # don't assign to anything until the validation is complete, including parsing the
-        # code
-        code = int(status.split(' ', 1)[0])
-
-        self.status = status if not PY3 else status.encode("latin-1")
+        entry = None
+        if status.__class__ is str:
+            entry = _STATUS_CACHE.get(status)
+        if entry is None:
+            entry = _encode_status(status)
+            if len(_STATUS_CACHE) < _MAX_CACHED_HEADERS:
+                _STATUS_CACHE[status] = entry
+
+        self.status, code = entry
         self._orig_status = status # Preserve the native string for logging
         self.response_headers = response_headers
         self.code = code
 
-        provided_connection = None
-        self.provided_date = None
-        self.provided_content_length = None
-
-        for header, value in headers:
-            header = header.lower()
-            if header == 'connection':
-                provided_connection = value
-            elif header == 'date':
-                self.provided_date = value
-            elif header == 'content-length':
-                self.provided_content_length = value
+        self.provided_date = provided_date
+        self.provided_content_length = provided_content_length
 
         if self.request_version == 'HTTP/1.0' and provided_connection is None:
             response_headers.append((b'Connection', b'close'))
             self.close_connection = True
         elif provided_connection == 'close':
             self.close_connection = True
+        elif provided_connection is None and (self._last_request or getattr(self.server, 'draining', False)):
+            # max_keepalive_requests, or the server is stopping
+            response_headers.append((b'Connection', b'close'))
+            self.close_connection = True
 
         if self.code in (304, 204):
             if self.provided_content_length is not None and self.provided_content_length != '0':
@@ -864,48 +1695,317 @@ class WSGIHandler(object):
                     msg = msg.encode('latin-1')
                 raise AssertionError(msg)
 
+        if getattr(self.server, 'compression', False):
+            self._content_encoding = self._response_encoding(headers)
+
         return self.write
 
+    def _response_encoding(self, headers):
+        # The content coding to compress this response with, if any
+        # (see WSGIServer.compression), given the application's
+        # (native string) headers.
+        server = self.server
+        if self.code < 200 or self.code in (304, 204) or self.command == 'HEAD':
+            return None
+        if self.provided_content_length is not None:
+            try:
+                if int(self.provided_content_length) < server.compression_min_size:
+                    return None
+            except ValueError:
+                return None
+        content_type = None
+        for header, value in headers:
+            header = header.lower()
+            if header == 'content-type':
+                content_type = value.split(';', 1)[0].strip().lower()
+            elif header == 'content-encoding':
+                return None
+            elif header == 'cache-control' and 'no-transform' in value.lower():
+                return None
+        if not content_type or not content_type.startswith(tuple(server.compression_types)):
+            return None
+        accept_encoding = self.environ.get('HTTP_ACCEPT_ENCODING')
+        if not accept_encoding:
+            return None
+        try:
+            return _ACCEPT_ENCODING_CACHE[accept_encoding]
+        except KeyError:
+            pass
+        encoding = _choose_encoding(accept_encoding)
+        if len(_ACCEPT_ENCODING_CACHE) < _MAX_CACHED_HEADERS:
+            _ACCEPT_ENCODING_CACHE[accept_encoding] = encoding
+        return encoding
+
     def log_request(self):
-        self.server.log.write(self.format_request() + '\n')
+        access_log = getattr(self.server, 'access_log', None)
+        if access_log is not None:
+            access_log.add(self.access_record())
+        else:
+            self.server.log.write(self.format_request() + '\n')
 
-    def format_request(self):
-        now = datetime.now().replace(microsecond=0)
-        length = self.response_length or '-'
+    def access_record(self):
+        """
+        Return the tuple that describes this request to an
+        :class:`AccessLog`.
+
+        .. versionadded:: 1.2a1
+        """
+        client_address = self.client_address[0] if isinstance(self.client_address, tuple) else self.client_address
         if self.time_finish:
-            delta = '%.6f' % (self.time_finish - self.time_start)
+            timestamp = self.time_finish
+            duration = self.time_finish - self.time_start
         else:
-            delta = '-'
-        client_address = self.client_address[0] if isinstance(self.client_address, tuple) else self.client_address
-        return '%s - - [%s] "%s" %s %s %s' % (
-            client_address or '-',
-            now,
-            self.requestline or '',
-            # Use the native string version of the status, saved so we don't have to
-            # decode. But fallback to the encoded 'status' in case of subclasses
-            # (Is that really necessary? At least there's no overhead.)
-            (self._orig_status or self.status or '000').split()[0],
-            length,
-            delta)
+            timestamp = time.time()
+            duration = None
+        return (client_address or '-',
+                timestamp,
+                self.requestline or '',
+                # Use the native string version of the status, saved so we don't have to
+                # decode. But fallback to the encoded 'status' in case of subclasses
+                # (Is that really necessary? At least there's no overhead.)
+                self._orig_status or self.status or '000',
+                self.response_length,
+                duration)
+
+    def format_request(self):
+        return format_access_text(self.access_record())
 
     def process_result(self):
-        for data in self.result:
-            if data:
-                self.write(data)
+        if self._content_encoding is not None:
+            self._compress_result()
+        if isinstance(self.result, FileWrapper) and self._sendfile_result():
+            return
+        if getattr(self.server, 'output_buffer_size', 0) > 0:
+            self._process_result_buffered()
+        else:
+            for data in self.result:
+                if data:
+                    self.write(data)
         if self.status and not self.headers_sent:
             # In other words, the application returned an empty
             # result iterable (and did not use the write callable)
             # Trigger the flush of the headers.
             self.write(b'')
         if self.response_use_chunked:
-            self.socket.sendall(b'0\r\n\r\n')
-            self.response_length += 5
+            self._sendall(b'0\r\n\r\n')
+
+    def _compress_result(self):
+        # Replace self.result with its compressed version, changing the
+        # headers to match, unless it's too short to be worth it.
+        encoding = self._content_encoding
+        self._content_encoding = None
+        server = self.server
+        result = self.result
+        threadpool = get_hub().threadpool
+        compressor = _compressobj(encoding, server.compression_level)
+        if hasattr(result, '__len__'):
+            # All here already: compress it in one go, and the
+            # response still gets a Content-Length
+            data = b''.join(result)
+            if len(data) < server.compression_min_size:
+                return
+            if len(data) >= server.compression_threadpool_size:
+                data = threadpool.apply(_compress_all, (compressor, data))
+            else:
+                data = _compress_all(compressor, data)
+            close = getattr(result, 'close', None)
+            if close is not None:
+                close()
+            self.result = [data]
+        else:
+            self.result = _CompressedResult(result, compressor, threadpool,
+                                            server.compression_threadpool_size)
+        self.provided_content_length = None
+        headers = []
+        for header, value in self.response_headers:
+            lower = header.lower()
+            if lower == b'content-length':
+                continue
+            if lower == b'etag' and not value.startswith(b'W/'):
+                # A strong validator names one exact body, and this is
+                # a different one (RFC 7232 2.1); the compressed body
+                # is only equivalent to it, like a weak validator says.
+                value = b'W/' + value
+            headers.append((header, value))
+        headers.append((b'Content-Encoding', encoding))
+        headers.append((b'Vary', b'Accept-Encoding'))
+        self.response_headers = headers
+
+    def _process_result_buffered(self):
+        # Like iterating the result and writing each chunk, but collect
+        # small chunks and send them together: once there are
+        # ``output_buffer_size`` bytes, once the oldest has waited
+        # ``output_buffer_latency`` seconds, when the application
+        # blocks, or when it uses the write callable.
+        server = self.server
+        size = server.output_buffer_size
+        latency = server.output_buffer_latency
+        now = server.loop.now
+        # While the application runs, the hub calls our switch_out if
+        # it blocks, so that what it already produced isn't held back
+        # for however long that takes. Don't replace a switch_out the
+        # greenlet already has; then blocking is noticed at the next
+        # chunk by the latency check instead.
+        current = getcurrent()
+        previous = getattr(current, 'switch_out', None)
+        hook = previous is None or previous == self._corked_switch_out
+        self._output = []
+        self._output_len = 0
+        try:
+            iterator = iter(self.result)
+            while True:
+                if hook:
+                    current.switch_out = self._output_switch_out
+                try:
+                    data = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    if hook:
+                        if previous is None:
+                            del current.switch_out
+                        else:
+                            current.switch_out = previous
+                if not data:
+                    continue
+                if self.code in (304, 204):
+                    raise AssertionError('The %s response must have no body' % self.code)
+                if not self.status:
+                    raise AssertionError("The application did not call start_response()")
+                self._join_output_flush()
+                if not self._output:
+                    self._output_time = now()
+                self._output.append(data)
+                self._output_len += len(data)
+                if self._output_len >= size or now() - self._output_time >= latency:
+                    self._flush_output()
+            self._flush_output(final=True)
+        finally:
+            if self._output_flush is not None:
+                # The application raised; don't let the error response
+                # race the background flush.
+                try:
+                    self._join_output_flush()
+                except socket.error:
+                    if not PY3:
+                        sys.exc_clear()
+            self._output = None
+
+    def _output_switch_out(self):
+        # Called by the hub, in the application greenlet, when the
+        # application is about to block. We must not block here, so
+        # send the buffer from another greenlet.
+        if self._corked is not None:
+            # Writes are only appended to the held responses, which
+            # doesn't block.
+            self._send_output()
+            self._corked_switch_out()
+        elif self._output and self._output_flush is None:
+            self._output_flush = result = AsyncResult()
+            spawn_raw(self._background_flush, result)
+
+    def _background_flush(self, result):
+        try:
+            self._send_output()
+        except: # pylint:disable=bare-except
+            result.set_exception(sys.exc_info()[1], sys.exc_info())
+        else:
+            result.set()
+
+    def _join_output_flush(self):
+        flush = self._output_flush
+        if flush is not None:
+            self._output_flush = None
+            flush.get()
+
+    def _flush_output(self, final=False):
+        self._join_output_flush()
+        self._send_output(final)
+
+    def _send_output(self, final=False):
+        output = self._output
+        if not output:
+            return
+        data = output[0] if len(output) == 1 else _join_buffers(output)
+        # Replace, don't clear: a switch_out while we're sending must
+        # see an empty buffer.
+        self._output = []
+        self._output_len = 0
+        if self.headers_sent:
+            self._write(data)
+            return
+        if final and self.provided_content_length is None:
+            # Everything the application produced fit in the buffer,
+            # so we know the length and can avoid chunking.
+            self.provided_content_length = str(len(data))
+            self.response_headers.append((b'Content-Length',
+                                          self.provided_content_length.encode('latin-1')))
+        self._write_with_headers(data)
+
+    def _sendfile_result(self):
+        # Send the file wrapped by the FileWrapper in self.result using
+        # socket.sendfile. Return False, having sent nothing, if that's not
+        # possible and the result must be iterated instead.
+        sendfile = getattr(self.socket, 'sendfile', None)
+        if sendfile is None or self.headers_sent or not self.status or self.code in (304, 204):
+            return False
+        filelike = self.result.filelike
+        try:
+            fileno = filelike.fileno()
+            st = os.fstat(fileno)
+            offset = filelike.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            # io.UnsupportedOperation is both an OSError and a ValueError.
+            return False
+        if not stat.S_ISREG(st.st_mode):
+            return False
+
+        count = max(0, st.st_size - offset)
+        if self.provided_content_length is not None:
+            try:
+                count = min(count, int(self.provided_content_length))
+            except ValueError:
+                return False
+        else:
+            self.provided_content_length = str(count)
+            self.response_headers.append((b'Content-Length',
+                                          self.provided_content_length.encode('latin-1')))
+
+        self._write_with_headers(b'')
+        if count:
+            try:
+                self._flush_corked()
+                sent = sendfile(filelike, offset, count)
+            except socket.error as ex:
+                self.status = 'socket error: %s' % ex
+                if self.code > 0:
+                    self.code = -self.code
+                raise
+            self.response_length += sent
+            if sent != count:
+                # The file changed under us. We promised the client
+                # Content-Length bytes, so it can't tell where this
+                # response ends; don't let it read the next one as
+                # part of it.
+                self.log_error('sendfile sent %s of %s bytes of %r', sent, count, filelike)
+                self.close_connection = True
+        return True
 
     def run_application(self):
         assert self.result is None
+        websocket = self._websocket
         try:
-            self.result = self.application(self.environ, self.start_response)
-            self.process_result()
+            try:
+                self.result = self.application(self.environ, self.start_response)
+            except: # pylint:disable=bare-except
+                if websocket is not None:
+                    websocket.close(_websocket.CLOSE_INTERNAL_ERROR)
+                raise
+            if websocket is not None and websocket.accepted:
+                # The connection belonged to the WebSocket
+                websocket.close()
+            else:
+                self.process_result()
         finally:
             close = getattr(self.result, 'close', None)
             try:
@@ -921,6 +2021,11 @@ class WSGIHandler(object):
                 self.result = None
 
     def handle_one_response(self):
+        server = self.server
+        # Only a WSGIServer counts the requests in flight for stop().
+        in_flight = getattr(server, 'in_flight', None)
+        if in_flight is not None:
+            server.in_flight = in_flight + 1
         self.time_start = time.time()
         self.status = None
         self.headers_sent = False
@@ -960,6 +2065,11 @@ class WSGIHandler(object):
             self.handle_error(*sys.exc_info())
         finally:
             self.time_finish = time.time()
+            if in_flight is not None:
+                server.in_flight -= 1
+                drained = getattr(server, '_drained', None)
+                if drained is not None and not server.in_flight:
+                    drained.set()
             self.log_request()
 
     def _send_error_response_if_possible(self, error_code):
@@ -1006,21 +2116,7 @@ class WSGIHandler(object):
         return ('400', _BAD_REQUEST_RESPONSE)
 
     def _headers(self):
-        key = None
-        value = None
-        for header in self.headers.headers:
-            if key is not None and header[:1] in " \t":
-                value += header
-                continue
-
-            if key not in (None, 'CONTENT_TYPE', 'CONTENT_LENGTH'):
-                yield 'HTTP_' + key, value.strip()
-
-            key, value = header.split(':', 1)
-            key = key.replace('-', '_').upper()
-
-        if key not in (None, 'CONTENT_TYPE', 'CONTENT_LENGTH'):
-            yield 'HTTP_' + key, value.strip()
+        return _header_items(self.headers)
 
     def get_environ(self):
         """
@@ -1041,17 +2137,16 @@ class WSGIHandler(object):
             path, query = self.path.split('?', 1)
         else:
             path, query = self.path, ''
+        # A LazyEnviron computes PATH_INFO and the header keys
+        # when they're first used.
+        lazy = isinstance(env, LazyEnviron)
         # Note that self.path contains the original str object; if it contains
         # encoded escapes, it will NOT match PATH_INFO.
-        env['PATH_INFO'] = unquote_latin1(path)
+        if lazy:
+            env._lazy_path = path
+        else:
+            env['PATH_INFO'] = unquote_latin1(path)
         env['QUERY_STRING'] = query
-
-        if self.headers.typeheader is not None:
-            env['CONTENT_TYPE'] = self.headers.typeheader
-
-        length = self.headers.getheader('content-length')
-        if length:
-            env['CONTENT_LENGTH'] = length
         env['SERVER_PROTOCOL'] = self.request_version
 
         client_address = self.client_address
@@ -1059,25 +2154,93 @@ class WSGIHandler(object):
             env['REMOTE_ADDR'] = str(client_address[0])
             env['REMOTE_PORT'] = str(client_address[1])
 
-        for key, value in self._headers():
-            if key in env:
-                if 'COOKIE' in key:
-                    env[key] += '; ' + value
-                else:
-                    env[key] += ',' + value
-            else:
-                env[key] = value
+        headers = self.headers
+        if lazy:
+            env._lazy_headers = headers
+            expect = headers.get('Expect')
+            transfer_encoding = headers.get('Transfer-Encoding') or ''
+        else:
+            _add_header_environ(env, headers, self._headers())
+            expect = env.get('HTTP_EXPECT')
+            transfer_encoding = env.get('HTTP_TRANSFER_ENCODING', '')
 
-        if env.get('HTTP_EXPECT') == '100-continue':
+        if expect == '100-continue':
             sock = self.socket
         else:
             sock = None
 
-        chunked = env.get('HTTP_TRANSFER_ENCODING', '').lower() == 'chunked'
+        chunked = transfer_encoding.lower() == 'chunked'
         self.wsgi_input = Input(self.rfile, self.content_length, socket=sock, chunked_input=chunked)
         env['wsgi.input'] = self.wsgi_input
+
+        if getattr(self.server, 'websocket', False):
+            self._websocket = self._get_websocket()
+            if self._websocket is not None:
+                env['wsgi.websocket'] = self._websocket
+                env['wsgi.websocket_version'] = '13'
         return env
 
+    def _get_websocket(self):
+        # Return a WebSocket if this is a valid upgrade request
+        # (RFC 6455 4.2.1).
+        headers = self.headers
+        if self.command != 'GET' or self.request_version != 'HTTP/1.1':
+            return None
+        if (headers.get('Upgrade') or '').lower() != 'websocket':
+            return None
+        if 'upgrade' not in (headers.get('Connection') or '').lower():
+            return None
+        key = headers.get('Sec-WebSocket-Key')
+        if not key or (headers.get('Sec-WebSocket-Version') or '').strip() != '13':
+            return None
+        return WebSocket(self, key.strip())
+
+
+def _header_items(headers):
+    # Yield the ('HTTP_*', value) environ items for the MessageClass
+    # instance *headers*
+    key = None
+    value = None
+    for header in headers.headers:
+        if key is not None and header[:1] in " \t":
+            value += header
+            continue
+
+        if key not in (None, 'CONTENT_TYPE', 'CONTENT_LENGTH'):
+            yield 'HTTP_' + key, value.strip()
+
+        key, value = header.split(':', 1)
+        key = key.replace('-', '_').upper()
+
+    if key not in (None, 'CONTENT_TYPE', 'CONTENT_LENGTH'):
+        yield 'HTTP_' + key, value.strip()
+
+
+def _add_header_environ(env, headers, items):
+    # Add the environ keys for the request *headers* to *env*. *items*
+    # are the HTTP_* items (see _header_items), used unless a parser
+    # selected with WSGIServer(parser=...) has done the work already.
+    header_environ = getattr(headers, 'environ', None)
+    if header_environ is not None:
+        env.update(header_environ)
+        return
+
+    if headers.typeheader is not None:
+        env['CONTENT_TYPE'] = headers.typeheader
+
+    length = headers.getheader('content-length')
+    if length:
+        env['CONTENT_LENGTH'] = length
+
+    for key, value in items:
+        if key in env:
+            if 'COOKIE' in key:
+                env[key] += '; ' + value
+            else:
+                env[key] += ',' + value
+        else:
+            env[key] = value
+
 
 class _NoopLog(object):
     # Does nothing; implements just enough file-like methods
@@ -1159,6 +2322,172 @@ class LoggingLogAdapter(object):
     def __delattr__(self, name):
         delattr(self._logger, name)
 
+def format_access_text(record):
+    """
+    Format an :class:`AccessLog` record as a line in the traditional
+    log format (without the newline).
+    """
+    client_address, timestamp, requestline, status, length, duration = record
+    return '%s - - [%s] "%s" %s %s %s' % (
+        client_address,
+        datetime.fromtimestamp(timestamp).replace(microsecond=0),
+        requestline,
+        status.split()[0],
+        length or '-',
+        '%.6f' % duration if duration is not None else '-')
+
+
+def format_access_json(record):
+    """
+    Format an :class:`AccessLog` record as a JSON object (on one line).
+    """
+    client_address, timestamp, requestline, status, length, duration = record
+    code = status.split()[0]
+    if not isinstance(code, str):
+        code = code.decode('latin-1')
+    return json.dumps({
+        'client': client_address,
+        'time': datetime.fromtimestamp(timestamp).isoformat(),
+        'request': requestline,
+        'status': int(code) if code.isdigit() else code,
+        'length': length,
+        'duration': duration,
+    }, sort_keys=True)
+
+
+class AccessLog(object):
+    """
+    Request (access) logs for a :class:`WSGIServer`, formatted and
+    written in the background.
+
+    Writing each request's line as it finishes means formatting it
+    while the client waits for the connection, and a write that can
+    block the whole process (for a file, or most :mod:`logging`
+    handlers). Instead, pass one of these as the server's
+    ``access_log``: each handler then only adds a tuple describing
+    its request (see :meth:`WSGIHandler.access_record`), and a
+    separate greenlet formats everything that has been added since
+    it last ran and writes it all at once.
+
+    :keyword log: Where to write the lines; accepts the same values as
+        the *log* argument of :class:`WSGIServer`. If not given, the
+        server's :attr:`~WSGIServer.log` is used.
+    :keyword formatter: ``'text'`` (the default) for the traditional
+        format, ``'json'`` for one JSON object per line, or a callable
+        taking a record and returning a line without its newline.
+    :keyword int max_pending: The most records that may be waiting to
+        be written.
+    :keyword overflow: What to do with a record when *max_pending* are
+        already waiting: ``'drop'`` it (the default), counting it in
+        :attr:`dropped`, or ``'block'`` the handler until there's room.
+    :keyword bool threadpool: If true, records are formatted and
+        written in the hub's :attr:`~gevent.hub.Hub.threadpool`, so a
+        blocking write doesn't block other greenlets. Only use this with
+        a *log* that may be used from other threads; that's usually
+        *not* the case for :mod:`logging` in a monkey-patched process.
+
+    .. versionadded:: 1.2a1
+    """
+
+    _formatters = {
+        'text': format_access_text,
+        'json': format_access_json,
+    }
+
+    #: How many records were dropped because too many were waiting.
+    dropped = 0
+
+    def __init__(self, log=None, formatter='text', max_pending=10000,
+                 overflow='drop', threadpool=False):
+        if overflow not in ('drop', 'block'):
+            raise ValueError("overflow must be 'drop' or 'block'", overflow)
+        if not callable(formatter):
+            if formatter not in self._formatters:
+                raise ValueError("Unknown formatter", formatter)
+            formatter = self._formatters[formatter]
+        if log is not None and not hasattr(log, 'write') and hasattr(log, 'log'):
+            log = LoggingLogAdapter(log)
+        self.log = log
+        self.formatter = formatter
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.threadpool = threadpool
+        self._pending = []
+        self._ready = Event()
+        self._room = Event()
+        self._lock = Semaphore()
+        self._writer = None
+
+    def add(self, record):
+        """
+        Queue *record* to be written.
+        """
+        if len(self._pending) >= self.max_pending:
+            if self.overflow == 'drop':
+                self.dropped += 1
+                return
+            while len(self._pending) >= self.max_pending:
+                self._room.clear()
+                self._room.wait()
+        pending = self._pending
+        pending.append(record)
+        if len(pending) == 1:
+            # Otherwise the writer is already due to run
+            if self._writer is None:
+                self._writer = spawn_raw(self._run)
+            self._ready.set()
+
+    def flush(self):
+        """
+        Write the waiting records now, and then flush the log.
+        """
+        self._write_pending()
+        flush = getattr(self.log, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def close(self):
+        """
+        Write the waiting records, flush the log, and let the background
+        greenlet finish. (Adding a record later starts a new one.)
+        :meth:`WSGIServer.stop` calls this.
+        """
+        self._writer = None
+        self._ready.set()
+        self.flush()
+
+    def _run(self):
+        me = getcurrent()
+        while self._writer is me:
+            self._ready.wait()
+            self._ready.clear()
+            try:
+                self._write_pending()
+            except: # pylint:disable=bare-except
+                get_hub().handle_error(self, *sys.exc_info())
+
+    def _write_pending(self):
+        with self._lock:
+            records = self._pending
+            if not records:
+                return
+            self._pending = []
+            self._room.set()
+            if self.threadpool:
+                get_hub().threadpool.apply(self._write, (records,))
+            else:
+                self._write(records)
+
+    def _write(self, records):
+        formatter = self.formatter
+        lines = [formatter(record) + '\n' for record in records]
+        if isinstance(self.log, LoggingLogAdapter):
+            # One message for each
+            self.log.writelines(lines)
+        else:
+            self.log.write(''.join(lines))
+
+
 ####
 ## Environ classes.
 # These subclass dict. They could subclass collections.UserDict on
@@ -1311,6 +2640,132 @@ class WSGISecureEnviron(SecureEnviron):
     default_print_masked_keys = False
 
 
+def _filled(name):
+    # A LazyEnviron method that needs all the keys present
+    method = getattr(dict, name)
+
+    def filled(self, *args, **kwargs):
+        self._fill()
+        return method(self, *args, **kwargs)
+    filled.__name__ = name
+    filled.__doc__ = method.__doc__
+    return filled
+
+
+class LazyEnviron(Environ):
+    """
+    An environment that decodes ``PATH_INFO`` and translates the
+    request headers into ``HTTP_*``, ``CONTENT_TYPE`` and
+    ``CONTENT_LENGTH`` keys only when one of them, or the whole
+    dictionary, is first used. Applications that look at a few keys
+    save most of the work of :meth:`WSGIHandler.get_environ`.
+
+    Provisional API.
+
+    Every dictionary method sees the complete environment, but C code
+    that reads the dictionary's storage directly (for example,
+    ``dict(environ)`` on Python 2) may not see the lazy keys until
+    something else has caused them to be filled in. Use
+    :meth:`copy` to get a complete environment.
+
+    To use this, set :attr:`WSGIServer.environ_class`.
+
+    .. versionadded:: 1.2a1
+    """
+
+    # The raw path and the MessageClass instance still to be added
+    __slots__ = ('_lazy_path', '_lazy_headers')
+
+    def _fill_path(self):
+        path = getattr(self, '_lazy_path', None)
+        if path is None:
+            return False
+        self._lazy_path = None
+        dict.__setitem__(self, 'PATH_INFO', unquote_latin1(path))
+        return True
+
+    def _fill_headers(self):
+        headers = getattr(self, '_lazy_headers', None)
+        if headers is None:
+            return False
+        self._lazy_headers = None
+        _add_header_environ(self, headers, _header_items(headers))
+        return True
+
+    def _fill(self):
+        self._fill_path()
+        self._fill_headers()
+
+    def _fill_key(self, key):
+        # Add *key*, and whatever is computed along with it, if that's
+        # still to be done. Return whether anything was added.
+        if key == 'PATH_INFO':
+            return self._fill_path()
+        if key.__class__ is str and (key.startswith('HTTP_')
+                                     or key == 'CONTENT_TYPE'
+                                     or key == 'CONTENT_LENGTH'):
+            return self._fill_headers()
+        return False
+
+    def __missing__(self, key):
+        if self._fill_key(key):
+            return self[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or (self._fill_key(key) and dict.__contains__(self, key))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        self._fill_key(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._fill_key(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *args):
+        self._fill_key(key)
+        return dict.pop(self, key, *args)
+
+    def setdefault(self, key, default=None):
+        self._fill_key(key)
+        return dict.setdefault(self, key, default)
+
+    def clear(self):
+        self._lazy_path = self._lazy_headers = None
+        dict.clear(self)
+
+    def copy(self):
+        self._fill()
+        # Construct from a plain dict to get the fast C copy
+        return self.__class__(dict.copy(self))
+
+    keys = _filled('keys')
+    values = _filled('values')
+    items = _filled('items')
+    __iter__ = _filled('__iter__')
+    __len__ = _filled('__len__')
+    __eq__ = _filled('__eq__')
+    __ne__ = _filled('__ne__')
+    __repr__ = _filled('__repr__')
+    popitem = _filled('popitem')
+    update = _filled('update')
+    if not PY3:
+        has_key = __contains__
+        iterkeys = _filled('iterkeys')
+        itervalues = _filled('itervalues')
+        iteritems = _filled('iteritems')
+        viewkeys = _filled('viewkeys')
+        viewvalues = _filled('viewvalues')
+        viewitems = _filled('viewitems')
+
+
 class WSGIServer(StreamServer):
     """
     A WSGI server based on :class:`StreamServer` that supports HTTPS.
@@ -1371,11 +2826,19 @@ class WSGIServer(StreamServer):
     #: parameter.
     error_log = None
 
+    #: If not None, an :class:`AccessLog` that request logs go to
+    #: instead of being written to :attr:`log` as each request finishes.
+    #: Initialized from the ``access_log`` constructor parameter.
+    #:
+    #: .. versionadded:: 1.2a1
+    access_log = None
+
     #: The class of environ objects passed to the handlers.
     #: Must be a dict subclass. For compliance with :pep:`3333`
     #: and libraries like WebOb, this is simply :class:`dict`
     #: but this can be customized in a subclass or per-instance
-    #: (probably to :class:`WSGISecureEnviron`).
+    #: (probably to :class:`WSGISecureEnviron`, or to :class:`LazyEnviron`
+    #: to save work for applications that use only some of the keys).
     #:
     #: .. versionadded:: 1.2a1
     environ_class = dict
@@ -1384,23 +2847,243 @@ class WSGIServer(StreamServer):
     # will cast to before passing to the loop.
     secure_environ_class = WSGISecureEnviron
 
+    #: If greater than 0, the chunks a WSGI application yields are
+    #: collected until at least this many bytes are waiting and then
+    #: sent with a single system call (and, for chunked responses, a
+    #: single chunk). This helps applications that yield many small
+    #: strings. Buffered data is also sent after
+    #: :attr:`output_buffer_latency`, as soon as the application blocks,
+    #: and before anything passed to the ``write`` callable, which is
+    #: never buffered. A response that fits entirely in the buffer is
+    #: sent with a ``Content-Length`` instead of chunked. Initialized
+    #: from the ``output_buffer_size`` constructor parameter; the
+    #: default of 0 disables buffering.
+    #:
+    #: .. versionadded:: 1.2a1
+    output_buffer_size = 0
+
+    #: The longest time, in seconds, that a yielded chunk waits in the
+    #: output buffer while the application keeps producing data without
+    #: blocking. This is checked each time a chunk is yielded.
+    #: Initialized from the ``output_buffer_latency`` constructor parameter.
+    #:
+    #: .. versionadded:: 1.2a1
+    output_buffer_latency = 0.05
+
+    #: When a client pipelines requests (sends more before it has the
+    #: response to the first) and, as a request without a body is read,
+    #: all of the next one's head has already arrived, its response is
+    #: held back and sent with the following ones: up to this many
+    #: responses go out in one system call. Requests are still handled
+    #: one at a time, in order. Held responses are sent before reading
+    #: anything that isn't already here, and as soon as an application
+    #: blocks, so neither a slow client nor a slow request delays the
+    #: responses before it. SSL connections don't do this. A value of 1
+    #: or less (the default) disables it.
+    #: Initialized from the ``max_pipeline`` constructor parameter.
+    #:
+    #: .. versionadded:: 1.2a1
+    max_pipeline = 0
+
+    #: A callable taking the request's input file, positioned after the
+    #: request line, and returning the parsed headers as an object like
+    #: those :attr:`WSGIHandler.MessageClass` creates (it may also have
+    #: an ``environ`` dict of the ``HTTP_*``, ``CONTENT_TYPE`` and
+    #: ``CONTENT_LENGTH`` keys); or None (the default) to use
+    #: :attr:`WSGIHandler.MessageClass`, that is, the standard library. Initialized from the ``parser``
+    #: constructor parameter, which also accepts the string ``'fast'``
+    #: for gevent's own parser. That parser reads the headers and builds
+    #: their WSGI environment keys in one pass, is compiled with Cython
+    #: where possible, and is much faster for small requests. It is
+    #: stricter than the standard library, rejecting, for example,
+    #: requests with conflicting ``Content-Length`` headers.
+    #:
+    #: .. versionadded:: 1.2a1
+    parser = None
+
+    #: If true, requests to upgrade to the WebSocket protocol have a
+    #: :class:`WebSocket` in ``environ['wsgi.websocket']``. Initialized
+    #: from the ``websocket`` constructor parameter; the default is
+    #: false, so as not to interfere with handlers that implement
+    #: WebSockets themselves.
+    #:
+    #: .. versionadded:: 1.2a1
+    websocket = False
+
+    #: If true, speak HTTP/2 (:rfc:`7540`) with clients that ask for
+    #: it: over TLS when they choose ``h2`` with ALPN, and otherwise
+    #: when they begin with the HTTP/2 connection preface or send an
+    #: ``Upgrade: h2c`` request. The requests on each connection are
+    #: handled concurrently, each in its own greenlet, with flow
+    #: control applied to request and response bodies. This requires
+    #: the `h2 <https://python-hyper.org/h2/>`_ package. Initialized
+    #: from the ``http2`` constructor parameter.
+    #:
+    #: .. versionadded:: 1.2a1
+    http2 = False
+
+    #: The most requests an HTTP/2 client may have in progress at once
+    #: on one connection.
+    #:
+    #: .. versionadded:: 1.2a1
+    http2_max_concurrent_streams = 100
+
+    #: If true, compress response bodies with gzip (or deflate) for
+    #: clients whose ``Accept-Encoding`` allows it. Only bodies the
+    #: application returns (not those passed to the ``write``
+    #: callable) of at least :attr:`compression_min_size` bytes with a
+    #: ``Content-Type`` in :attr:`compression_types` are compressed,
+    #: and not if they already have a ``Content-Encoding`` or the
+    #: response has ``Cache-Control: no-transform``. A body returned
+    #: as a list is compressed all at once and keeps a
+    #: ``Content-Length``; other iterables are compressed chunk by
+    #: chunk, each chunk being sent as soon as it's compressed, so
+    #: streaming still works. Initialized from the ``compression``
+    #: constructor parameter.
+    #:
+    #: .. versionadded:: 1.2a1
+    compression = False
+
+    #: Bodies shorter than this many bytes aren't worth compressing.
+    #:
+    #: .. versionadded:: 1.2a1
+    compression_min_size = 1024
+
+    #: The ``Content-Type`` prefixes of responses to compress.
+    #:
+    #: .. versionadded:: 1.2a1
+    compression_types = ('text/', 'application/json', 'application/javascript',
+                         'application/xml', 'application/xhtml+xml', 'image/svg+xml')
+
+    #: The :mod:`zlib` compression level.
+    #:
+    #: .. versionadded:: 1.2a1
+    compression_level = 6
+
+    #: Bodies (or chunks of them) of at least this many bytes are
+    #: compressed in the hub's :attr:`~gevent.hub.Hub.threadpool`;
+    #: since :mod:`zlib` releases the GIL, other connections are served
+    #: meanwhile.
+    #:
+    #: .. versionadded:: 1.2a1
+    compression_threadpool_size = 65536
+
+    #: If true, on Python 3, the input of each connection takes its read
+    #: buffer from a pool shared by the server's connections only
+    #: while the buffer holds data, so that idle keep-alive
+    #: connections hold no buffer. This saves memory with many idle
+    #: connections, but reading (especially the request line and
+    #: headers) is slower than with the standard buffered reader.
+    #: Initialized from the ``pool_read_buffers`` constructor parameter.
+    #:
+    #: .. versionadded:: 1.2a1
+    pool_read_buffers = False
+
+    # The gevent._socket3._BufferPool, when pool_read_buffers is used.
+    _read_buffer_pool = None
+
+    #: How long, in seconds, a connection may wait for a request (the
+    #: first one, or the next one on a keep-alive connection) before
+    #: it is closed. None (the default) waits forever. Initialized from
+    #: the ``keepalive_timeout`` constructor parameter.
+    #:
+    #: .. versionadded:: 1.2a1
+    keepalive_timeout = None
+
+    #: If not None, a connection is closed after this many requests;
+    #: the response to the last one has a ``Connection: close``
+    #: header (unless the application set ``Connection`` itself).
+    #: Initialized from the ``max_keepalive_requests`` constructor
+    #: parameter.
+    #:
+    #: .. versionadded:: 1.2a1
+    max_keepalive_requests = None
+
+    #: If not None, at most this many keep-alive connections may be
+    #: idle (waiting for their next request) at once; when another one
+    #: becomes idle, the one that has been idle longest is closed.
+    #: Independently of this, when ``spawn`` is a
+    #: :class:`~gevent.pool.Pool` and it is full, the keep-alive
+    #: connection that has been idle longest is closed when a new
+    #: connection is waiting to be accepted, so that idle clients can't
+    #: keep new ones out. Initialized from the ``max_idle_connections``
+    #: constructor parameter.
+    #:
+    #: .. versionadded:: 1.2a1
+    max_idle_connections = None
+
+    #: The number of requests being handled: those that have been read
+    #: but whose response isn't complete.
+    #:
+    #: .. versionadded:: 1.2a1
+    in_flight = 0
+
+    # The handlers waiting for a request, oldest first, mapped to
+    # their greenlets.
+    _idle_handlers = None
+
+    # While the pool is full and a keep-alive connection is idle, an
+    # io watcher for a connection waiting to be accepted.
+    _backlog_watcher = None
+
+    # While stop() waits for in_flight to reach 0, an Event set when
+    # it does.
+    _drained = None
+
     base_env = {'GATEWAY_INTERFACE': 'CGI/1.1',
                 'SERVER_SOFTWARE': 'gevent/%d.%d Python/%d.%d' % (gevent.version_info[:2] + sys.version_info[:2]),
                 'SCRIPT_NAME': '',
                 'wsgi.version': (1, 0),
                 'wsgi.multithread': False, # XXX: Aren't we really, though?
                 'wsgi.multiprocess': False,
-                'wsgi.run_once': False}
+                'wsgi.run_once': False,
+                # wsgi.input returns EOF at the end of the body, even
+                # when there is no Content-Length
+                'wsgi.input_terminated': True,
+                'wsgi.file_wrapper': FileWrapper}
 
     def __init__(self, listener, application=None, backlog=None, spawn='default',
                  log='default', error_log='default',
                  handler_class=None,
-                 environ=None, **ssl_args):
+                 environ=None, output_buffer_size=None,
+                 output_buffer_latency=None, parser=None,
+                 max_pipeline=None, keepalive_timeout=None,
+                 max_keepalive_requests=None, max_idle_connections=None,
+                 websocket=None, http2=None, access_log=None, compression=None,
+                 pool_read_buffers=None,
+                 **ssl_args):
         StreamServer.__init__(self, listener, backlog=backlog, spawn=spawn, **ssl_args)
+        # The loop belongs to one hub, so only that hub's greenlets
+        # use this.
+        self._http_date = _DateCache(self.loop)
         if application is not None:
             self.application = application
         if handler_class is not None:
             self.handler_class = handler_class
+        if output_buffer_size is not None:
+            self.output_buffer_size = output_buffer_size
+        if output_buffer_latency is not None:
+            self.output_buffer_latency = output_buffer_latency
+        if max_pipeline is not None:
+            self.max_pipeline = max_pipeline
+        if keepalive_timeout is not None:
+            self.keepalive_timeout = keepalive_timeout
+        if max_keepalive_requests is not None:
+            self.max_keepalive_requests = max_keepalive_requests
+        if max_idle_connections is not None:
+            self.max_idle_connections = max_idle_connections
+        if websocket is not None:
+            self.websocket = websocket
+        if http2 is not None:
+            self.http2 = http2
+        if compression is not None:
+            self.compression = compression
+        if pool_read_buffers is not None:
+            self.pool_read_buffers = pool_read_buffers
+        if parser == 'fast':
+            parser = _fast_parse_headers
+        if parser is not None:
+            self.parser = parser
 
         # Note that we can't initialize these as class variables:
         # sys.stderr might get monkey patched at runtime.
@@ -1414,6 +3097,10 @@ class WSGIServer(StreamServer):
             return l
         self.log = _make_log(log)
         self.error_log = _make_log(error_log, 40) # logging.ERROR
+        if access_log is not None:
+            if access_log.log is None:
+                access_log.log = self.log
+            self.access_log = access_log
 
         self.set_environ(environ)
         self.set_max_accept()
@@ -1438,11 +3125,100 @@ class WSGIServer(StreamServer):
             self.max_accept = 1
 
     def get_environ(self):
-        return self.environ_class(self.environ)
+        environ = self.environ
+        if isinstance(environ, LazyEnviron):
+            # Copying one through its methods is slow; the template
+            # has nothing pending, so copy the storage directly.
+            environ = dict.copy(environ)
+        return self.environ_class(environ)
 
     def init_socket(self):
         StreamServer.init_socket(self)
         self.update_environ()
+        self._idle_handlers = OrderedDict()
+        if self.pool_read_buffers and PY3:
+            from gevent._socket3 import _BufferPool
+            self._read_buffer_pool = _BufferPool()
+        if self.http2:
+            from gevent import _http2
+            if not _http2.available():
+                raise ImportError("HTTP/2 requires the h2 package")
+            if self.ssl_args:
+                self._init_alpn()
+
+    def _init_alpn(self):
+        # Wrap sockets as the ssl_args say, but with a context that
+        # offers h2 with ALPN (which gevent.ssl.wrap_socket can't).
+        from gevent import ssl
+        if not hasattr(ssl, 'SSLContext') or not hasattr(ssl.SSLContext, 'set_alpn_protocols'):
+            # Only h2c
+            return
+        args = self.ssl_args
+        context = ssl.SSLContext(args.get('ssl_version', ssl.PROTOCOL_SSLv23))
+        if args.get('certfile'):
+            context.load_cert_chain(args['certfile'], args.get('keyfile'))
+        context.verify_mode = args.get('cert_reqs', ssl.CERT_NONE)
+        if args.get('ca_certs'):
+            context.load_verify_locations(args['ca_certs'])
+        if args.get('ciphers'):
+            context.set_ciphers(args['ciphers'])
+        context.set_alpn_protocols(['h2', 'http/1.1'])
+
+        def wrap_socket(sock, server_side=True, do_handshake_on_connect=True,
+                        suppress_ragged_eofs=True, **_kwargs):
+            return context.wrap_socket(sock, server_side=server_side,
+                                       do_handshake_on_connect=do_handshake_on_connect,
+                                       suppress_ragged_eofs=suppress_ragged_eofs)
+        self.wrap_socket = wrap_socket
+
+    def stop(self, timeout=None):
+        """
+        Stop accepting connections, close those that are waiting for a
+        request, and wait up to *timeout* seconds for the requests in
+        progress to finish. Their responses have a ``Connection:
+        close`` header (unless the application set ``Connection``
+        itself), and their connections are closed afterwards.
+
+        .. versionchanged:: 1.2a1
+           Close idle connections right away and, without a pool,
+           wait for the requests in progress.
+        """
+        StreamServer.stop(self, timeout)
+        if self.access_log is not None:
+            self.access_log.close()
+
+    def do_shed(self, sock, address):
+        """
+        Answer a connection refused because the server is overloaded
+        with a ``503 Service Unavailable`` response (if that can be sent
+        without blocking and the connection isn't TLS), and close it.
+
+        .. versionadded:: 1.2a1
+        """
+        try:
+            if not self.ssl_enabled:
+                # We're in the hub; a new connection's send buffer is
+                # empty, so the real socket takes this at once (or not
+                # at all).
+                sock._sock.send(_SERVICE_UNAVAILABLE_RESPONSE)
+        except socket.error:
+            if not PY3:
+                sys.exc_clear()
+        finally:
+            self.do_close(sock, address)
+
+    def drain(self, timeout):
+        idle = self._idle_handlers
+        while idle:
+            handler, glet = idle.popitem(False)
+            self.loop.run_callback(_close_idle_handler, handler, glet)
+        if self.pool is None and self.in_flight:
+            # (With a pool, stop() waits for it.)
+            self._drained = Event()
+            try:
+                self._drained.wait(timeout)
+            finally:
+                self._drained = None
 
     def update_environ(self):
         """
@@ -1475,6 +3251,75 @@ class WSGIServer(StreamServer):
         handler = self.handler_class(sock, address, self)
         handler.handle()
 
+    def start_accepting(self):
+        self._stop_backlog_watcher()
+        StreamServer.start_accepting(self)
+
+    def stop_accepting(self):
+        StreamServer.stop_accepting(self)
+        self._stop_backlog_watcher()
+        if self.started and self.full():
+            self._start_backlog_watcher()
+
+    def _start_backlog_watcher(self):
+        # The pool is full, so we're not accepting. If a kept-alive
+        # connection is idle, watch for one waiting to be accepted.
+        if self._backlog_watcher is not None or not self.started:
+            return
+        for handler in self._idle_handlers or ():
+            if handler._request_count:
+                break
+        else:
+            return
+        self._backlog_watcher = self.loop.io(self.socket.fileno(), 1)
+        self._backlog_watcher.start(self._make_room)
+
+    def _stop_backlog_watcher(self):
+        if self._backlog_watcher is not None:
+            self._backlog_watcher.stop()
+            self._backlog_watcher = None
+
+    def _make_room(self):
+        # A connection is waiting while the pool is full: close the
+        # kept-alive connection that has been idle longest. (We watch
+        # again, if need be, once the pool is full again or another
+        # connection becomes idle.)
+        self._stop_backlog_watcher()
+        self._close_oldest_idle(1)
+
+    def _close_idle_connections(self):
+        # Called when a kept-alive connection starts waiting for its
+        # next request.
+        limit = self.max_idle_connections
+        if limit is not None and len(self._idle_handlers) > limit:
+            self._close_oldest_idle(len(self._idle_handlers) - limit)
+        if self._watcher is None and self.full():
+            self._start_backlog_watcher()
+
+    def _close_oldest_idle(self, count):
+        # Close the *count* kept-alive connections that have waited
+        # longest for a request. Connections that haven't sent a first
+        # request yet are left alone.
+        idle = self._idle_handlers
+        for handler in list(idle):
+            if not handler._request_count:
+                # A new connection; give it the chance to send its
+                # first request.
+                continue
+            glet = idle.pop(handler)
+            self.loop.run_callback(_close_idle_handler, handler, glet)
+            count -= 1
+            if not count:
+                break
+
+
+def _close_idle_handler(handler, glet):
+    # Runs in the hub. If the handler hasn't been given a request since
+    # it was chosen, it's still blocked reading the request line, and
+    # stops there.
+    if handler._idle and not glet.dead:
+        glet.throw(GreenletExit)
+
 def _main():
     # Provisional main handler, for quick tests, not production
     # usage.
@@ -1,12 +1,20 @@
 # Copyright (c) 2009-2012 Denis Bilenko. See LICENSE for details.
 """TCP/SSL server"""
+from __future__ import absolute_import
+import os
+import signal as signalmodule
 import sys
+import traceback
 import _socket
 from gevent.baseserver import BaseServer
+from gevent.event import Event
+from gevent.greenlet import Greenlet
+from gevent.hub import signal as _signal_handler
+from gevent.hub import wait
 from gevent.socket import EWOULDBLOCK, socket
-from gevent._compat import PYPY, PY3
+from gevent._compat import PYPY, PY3, xrange
 
-__all__ = ['StreamServer', 'DatagramServer']
+__all__ = ['StreamServer', 'DatagramServer', 'PreforkServer']
 
 
 if sys.platform == 'win32':
@@ -134,9 +142,28 @@ class DatagramServer(BaseServer):
 
     reuse_addr = DEFAULT_REUSE_ADDR
 
+    #: The longest datagram received; the rest of a longer one is lost.
+    #:
+    #: .. versionadded:: 1.2a1
+    max_datagram_size = 8192
+
+    #: If not None, the handler is called with one argument, a list of
+    #: up to this many ``(data, address)`` pairs that were waiting,
+    #: instead of once for each datagram with *data* and *address*. On
+    #: Linux, they are received with a single :manpage:`recvmmsg(2)`
+    #: call into buffers allocated once, and :meth:`sendto_many`
+    #: sends replies with :manpage:`sendmmsg(2)`; elsewhere, these
+    #: fall back to a system call for each datagram. Must be set
+    #: before the server is started.
+    #:
+    #: .. versionadded:: 1.2a1
+    batch_size = None
+
     def __init__(self, *args, **kwargs):
         # The raw (non-gevent) socket, if possible
         self._socket = None
+        # A gevent._mmsg.Receiver, in batched mode, if possible
+        self._receiver = None
         BaseServer.__init__(self, *args, **kwargs)
         from gevent.lock import Semaphore
         self._writelock = Semaphore()
@@ -152,20 +179,46 @@ class DatagramServer(BaseServer):
             self._socket = self._socket._sock
         except AttributeError:
             pass
+        if self.batch_size is not None:
+            from gevent import _mmsg
+            if _mmsg.available:
+                self._receiver = _mmsg.Receiver(self.batch_size, self.max_datagram_size)
 
     @classmethod
     def get_listener(cls, address, family=None):
         return _udp_socket(address, reuse_addr=cls.reuse_addr, family=family)
 
     def do_read(self):
+        if self.batch_size is not None:
+            return self._read_batch()
         try:
-            data, address = self._socket.recvfrom(8192)
+            data, address = self._socket.recvfrom(self.max_datagram_size)
         except _socket.error as err:
             if err.args[0] == EWOULDBLOCK:
                 return
             raise
         return data, address
 
+    def _read_batch(self):
+        if self._receiver is not None:
+            batch = self._receiver.receive(self._socket.fileno())
+        else:
+            batch = []
+            recvfrom = self._socket.recvfrom
+            size = self.max_datagram_size
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(recvfrom(size))
+                except _socket.error as err:
+                    if err.args[0] == EWOULDBLOCK or batch:
+                        # (Hand over what we have; a real error
+                        # will happen again next time.)
+                        break
+                    raise
+        if not batch:
+            return
+        return (batch,)
+
     def sendto(self, *args):
         self._writelock.acquire()
         try:
@@ -173,12 +226,268 @@ class DatagramServer(BaseServer):
         finally:
             self._writelock.release()
 
+    def sendto_many(self, packets):
+        """
+        Send each ``(data, address)`` pair in the sequence *packets*.
+        Those the socket takes right away are sent with a single
+        system call where possible (see :attr:`batch_size`).
+
+        .. versionadded:: 1.2a1
+        """
+        self._writelock.acquire()
+        try:
+            sent = 0
+            if self._receiver is not None:
+                from gevent import _mmsg
+                sent = _mmsg.send(self._socket.fileno(), packets)
+            for data, address in packets[sent:]:
+                self.socket.sendto(data, address)
+        finally:
+            self._writelock.release()
+
+
+class PreforkServer(object):
+    """
+    Run a :class:`StreamServer` (for example, a
+    :class:`~gevent.pywsgi.WSGIServer`) in several forked worker
+    processes so that it can make use of more than one CPU.
+
+    This object is a supervisor. When started, it prepares the
+    listening socket of *server* and then uses
+    :func:`gevent.os.fork_and_watch` to create *workers* child
+    processes, each of which runs ``server.serve_forever()``. Workers
+    that exit unexpectedly are replaced. Sending ``SIGHUP`` to the
+    supervisor performs a rolling restart, replacing the workers one
+    at a time so that the address is always being served; sending
+    ``SIGTERM`` stops the supervisor and all the workers::
+
+        server = WSGIServer(('', 8080), application, spawn=Pool(1000))
+        PreforkServer(server, workers=4).serve_forever()
+
+    Workers are asked to stop with ``SIGTERM``, which calls
+    :meth:`BaseServer.stop` in the worker. As usual, handlers that
+    are still running are only waited for if *server* uses a pool.
+
+    :param server: A :class:`StreamServer` instance that has not been started.
+    :keyword int workers: The number of worker processes. Defaults to
+        the number of CPUs.
+    :keyword bool reuse_port: If true, then instead of all the workers
+        sharing one listening socket created by the supervisor, each
+        worker binds its own socket with ``SO_REUSEPORT`` and the
+        kernel distributes new connections between them. This usually
+        balances load better, but requires platform support and a
+        *server* that was created with an address (not a socket)
+        having an explicit port.
+
+    Availability: POSIX.
+
+    .. versionadded:: 1.2a1
+    """
+
+    #: The number of seconds a worker is given to exit after being sent
+    #: ``SIGTERM`` before it is sent ``SIGKILL``. Used by :meth:`restart`;
+    #: :meth:`stop` uses its *timeout* argument if given.
+    stop_timeout = 30
+
+    #: The number of seconds to wait before replacing a worker that
+    #: exited unexpectedly. This prevents a worker that crashes at startup
+    #: from turning the supervisor into a fork loop.
+    respawn_delay = 0.5
+
+    def __init__(self, server, workers=None, reuse_port=False):
+        try:
+            from gevent.os import fork_and_watch
+        except ImportError:
+            raise NotImplementedError("PreforkServer requires os.fork and os.waitpid")
+        if workers is None:
+            import multiprocessing
+            workers = multiprocessing.cpu_count()
+        if workers < 1:
+            raise ValueError('workers must be positive int: %r' % (workers, ))
+        if reuse_port:
+            if not hasattr(_socket, 'SO_REUSEPORT'):
+                raise ValueError('SO_REUSEPORT is not supported on this platform')
+            if hasattr(server, 'socket'):
+                raise TypeError('reuse_port requires a server created with an address, not a socket')
+            if not server.server_port:
+                raise ValueError('reuse_port requires an explicit port: %r' % (server.address, ))
+        self._fork_and_watch = fork_and_watch
+        self.server = server
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self._stop_event = Event()
+        self._stop_event.set()
+        # {pid -> Event set when the worker exits}
+        self._workers = {}
+        # pids we asked to exit, which must not be replaced
+        self._retiring = set()
+        self._signals = []
+        self._restarting = False
+
+    def __repr__(self):
+        return '<%s at %s workers=%s pids=%s server=%r>' % (
+            type(self).__name__, hex(id(self)), self.workers, self.pids, self.server)
+
+    @property
+    def started(self):
+        return not self._stop_event.is_set()
+
+    @property
+    def pids(self):
+        """The process ids of the running workers."""
+        return list(self._workers)
+
+    def start(self):
+        """
+        Create the listening socket (unless *reuse_port* was given) and
+        fork the workers.
+        """
+        if not self.reuse_port:
+            self.server.init_socket()
+        self._stop_event.clear()
+        self._signals = [_signal_handler(signalmodule.SIGHUP, self.restart),
+                         _signal_handler(signalmodule.SIGTERM, self.stop)]
+        for _ in xrange(self.workers):
+            self._spawn_worker()
+
+    def serve_forever(self, stop_timeout=None):
+        """Start the workers if they haven't been already started and wait until stopped."""
+        if not self.started:
+            self.start()
+        try:
+            self._stop_event.wait()
+        finally:
+            Greenlet.spawn(self.stop, timeout=stop_timeout).join()
+
+    def stop(self, timeout=None):
+        """
+        Stop all workers and close the listening socket.
+
+        Each worker is sent ``SIGTERM`` and given *timeout* seconds
+        (default :attr:`stop_timeout`) to exit, after which it is killed.
+        """
+        self._stop_event.set()
+        for watcher in self._signals:
+            watcher.cancel()
+        self._signals = []
+        if timeout is None:
+            timeout = self.stop_timeout
+        self._stop_workers(list(self._workers), timeout)
+        if not self.reuse_port:
+            self.server.close()
+
+    def restart(self):
+        """
+        Perform a rolling restart: for each current worker, fork a new
+        worker and then stop the old one, waiting for it to exit before
+        moving on to the next.
+
+        This is called when the supervisor receives ``SIGHUP``.
+        """
+        if self._restarting or not self.started:
+            return
+        self._restarting = True
+        try:
+            for pid in list(self._workers):
+                if not self.started:
+                    break
+                if pid not in self._workers:
+                    # Died on its own, and a replacement is on the way.
+                    continue
+                self._spawn_worker()
+                self._stop_workers([pid], self.stop_timeout)
+        finally:
+            self._restarting = False
+
+    def _spawn_worker(self):
+        # This must not be called in the hub: in the child, the
+        # calling greenlet goes on to run the server.
+        pid = self._fork_and_watch(self._on_worker_exit, ref=True)
+        if pid:
+            self._workers[pid] = Event()
+            return pid
+        # In the child. Never return to our caller.
+        try:
+            self._run_worker()
+        except: # pylint:disable=bare-except
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+
+    def _run_worker(self):
+        for watcher in self._signals:
+            watcher.cancel()
+        self._workers.clear()
+        self._retiring.clear()
+        server = self.server
+        # The supervisor decides when workers restart; a SIGHUP sent to the
+        # whole process group must not kill them.
+        signalmodule.signal(signalmodule.SIGHUP, signalmodule.SIG_IGN)
+        self._signals = [_signal_handler(signalmodule.SIGTERM, server.stop)]
+        if self.reuse_port:
+            server.set_listener(_tcp_listener(server.address,
+                                              backlog=server.backlog,
+                                              reuse_addr=server.reuse_addr,
+                                              family=server.family,
+                                              reuse_port=True))
+        environ = getattr(server, 'environ', None)
+        if environ is not None:
+            environ['wsgi.multiprocess'] = True
+            if not self.reuse_port and hasattr(server, 'set_max_accept'):
+                # All the workers wait on the same socket.
+                server.set_max_accept()
+        server.serve_forever()
+
+    def _on_worker_exit(self, watcher):
+        # Called in the hub by the child watcher.
+        pid = watcher.pid
+        exited = self._workers.pop(pid, None)
+        if exited is None:
+            return
+        exited.set()
+        if pid in self._retiring:
+            self._retiring.discard(pid)
+        elif self.started:
+            Greenlet.spawn_later(self.respawn_delay, self._respawn)
+
+    def _respawn(self):
+        if self.started and len(self._workers) < self.workers:
+            self._spawn_worker()
+
+    def _stop_workers(self, pids, timeout):
+        events = []
+        for pid in pids:
+            event = self._workers.get(pid)
+            if event is not None:
+                self._retiring.add(pid)
+                _kill(pid, signalmodule.SIGTERM)
+                events.append(event)
+        if not events:
+            return
+        wait(events, timeout=timeout)
+        for pid in pids:
+            if pid in self._workers:
+                _kill(pid, signalmodule.SIGKILL)
+        wait(events, timeout=1)
+
+
+def _kill(pid, signum):
+    try:
+        os.kill(pid, signum)
+    except OSError:
+        # Already gone
+        pass
+
 
-def _tcp_listener(address, backlog=50, reuse_addr=None, family=_socket.AF_INET):
+def _tcp_listener(address, backlog=50, reuse_addr=None, family=_socket.AF_INET, reuse_port=False):
     """A shortcut to create a TCP socket, bind it and put it into listening state."""
     sock = socket(family=family)
     if reuse_addr is not None:
         sock.setsockopt(_socket.SOL_SOCKET, _socket.SO_REUSEADDR, reuse_addr)
+    if reuse_port:
+        # Let the kernel balance incoming connections between every
+        # process that has its own socket bound to this address.
+        sock.setsockopt(_socket.SOL_SOCKET, _socket.SO_REUSEPORT, 1) # pylint:disable=no-member
     try:
         sock.bind(address)
     except _socket.error as ex:
@@ -122,6 +122,10 @@ class Timeout(BaseException):
        timer that will never be started.
     .. versionchanged:: 1.1
        Add warning about negative *seconds* values.
+    .. versionchanged:: 1.2a1
+       The timer comes from :meth:`gevent.hub.Hub.timer`, so timeouts
+       share one libev timer if :attr:`gevent.hub.Hub.timer_resolution`
+       is set and no *priority* other than -1 is given.
     """
 
     def __init__(self, seconds=None, exception=None, ref=True, priority=-1):
@@ -137,7 +141,7 @@ class Timeout(BaseException):
             # Plus, in general, it should be more efficient
             self.timer = _FakeTimer
         else:
-            self.timer = get_hub().loop.timer(seconds or 0.0, ref=ref, priority=priority)
+            self.timer = get_hub().timer(seconds or 0.0, ref=ref, priority=priority)
 
     def start(self):
         """Schedule the timeout."""
@@ -0,0 +1,314 @@
+# Copyright (c) 2016 gevent contributors. See LICENSE for details.
+"""
+Accounting for the time each greenlet runs.
+
+A :class:`GreenletTracer` uses :func:`greenlet.settrace` to see every
+switch between greenlets in one thread, and charges the time between
+two switches to the greenlet that was running. Totals are kept for
+each greenlet (together with where it was spawned) and for each
+function that greenlets run, so that the handlers using the most time
+stand out even among many thousands of greenlets.
+
+Tracing every switch has a cost. For long running processes, pass a
+*sample_rate* below 1 to only trace for that fraction of the time.
+
+The module-level functions manage one tracer for the current thread,
+which makes them easy to use from a :class:`gevent.backdoor.BackdoorServer`
+prompt::
+
+    >>> from gevent import tracer
+    >>> tracer.start(sample_rate=0.1)
+    >>> tracer.dump()
+
+.. note:: The time charged to the hub includes the time spent waiting
+   for events. The time charged to other greenlets is wall time, which
+   is only their CPU time if they don't block without switching.
+
+.. versionadded:: 1.2a1
+"""
+from __future__ import absolute_import, print_function
+
+import os
+import sys
+import time
+from weakref import WeakKeyDictionary
+
+import greenlet as _greenlet_module
+
+from gevent.greenlet import Greenlet
+from gevent.hub import getcurrent
+from gevent.hub import get_hub
+from gevent.hub import _threadlocal
+
+__all__ = [
+    'GreenletTracer',
+    'start',
+    'stop',
+    'dump',
+]
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+# Frames in these files are skipped when looking for where a greenlet
+# was spawned.
+_GEVENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _funcname(glet):
+    # The name of what *glet* runs. Unlike greenlet.getfuncname, this
+    # never includes an address, so greenlets running the same code
+    # are counted together.
+    if isinstance(glet, Greenlet):
+        func = glet.__dict__.get('_run', None)
+        if func is None:
+            func = glet._run
+    elif glet.parent is None:
+        return 'main'
+    else:
+        func = getattr(glet, 'run', None)
+        if func is None:
+            return type(glet).__name__
+    func = getattr(func, 'func', func) # functools.partial
+    name = getattr(func, '__name__', None)
+    if name is None:
+        return type(func).__name__
+    self = getattr(func, '__self__', None)
+    if self is not None:
+        return '%s.%s' % (type(self).__name__, name)
+    if name == '<lambda>':
+        code = func.__code__
+        return '<lambda at %s:%s>' % (code.co_filename, code.co_firstlineno)
+    return name
+
+
+def _spawn_site():
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename.startswith(_GEVENT_DIR):
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return '%s:%s' % (frame.f_code.co_filename, frame.f_lineno)
+
+
+class GreenletTracer(object):
+    """
+    Records, for the thread it is started in, how long each greenlet
+    runs and how often it is switched out.
+
+    With a *sample_rate* less than 1, tracing is only on for that
+    fraction of every *sample_period* seconds.
+    """
+
+    def __init__(self, sample_rate=1.0, sample_period=1.0):
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample_rate must be in (0, 1]: %r' % (sample_rate, ))
+        self.sample_rate = sample_rate
+        self.sample_period = sample_period
+        #: The seconds during which switches were traced.
+        self.traced_time = 0.0
+        # greenlet -> [runtime, switches, totals for its function,
+        # function name, spawn site]
+        self._greenlets = WeakKeyDictionary()
+        # function name -> [runtime, switches, greenlets]
+        self._functions = {}
+        self._last = None
+        # The running greenlet and its record, so each switch only
+        # has to look up the greenlet switched to. Its name must be
+        # found before it dies, because Greenlet.run forgets it.
+        self._current = None
+        self._current_record = None
+        self._enabled_at = None
+        self._previous = None
+        self._hub = None
+        self._sample_timer = None
+        self._stop_timer = None
+
+    def _record(self, glet, site=None):
+        name = _funcname(glet)
+        totals = self._functions.get(name)
+        if totals is None:
+            totals = self._functions[name] = [0.0, 0, 0]
+        totals[2] += 1
+        record = self._greenlets[glet] = [0.0, 0, totals, name, site]
+        return record
+
+    def _lookup(self, glet):
+        record = self._greenlets.get(glet)
+        if record is None:
+            record = self._record(glet)
+        return record
+
+    def _charge(self, origin, target):
+        now = _clock()
+        if origin is self._current:
+            record = self._current_record
+        else:
+            record = self._lookup(origin)
+        elapsed = now - self._last
+        self._last = now
+        record[0] += elapsed
+        record[1] += 1
+        totals = record[2]
+        totals[0] += elapsed
+        totals[1] += 1
+        if target is None:
+            self._current = self._current_record = None
+        else:
+            self._current = target
+            self._current_record = self._lookup(target)
+
+    def _trace(self, event, args):
+        if event == 'switch' or event == 'throw':
+            self._charge(args[0], args[1])
+        if self._previous is not None:
+            self._previous(event, args)
+
+    def _spawned(self, glet):
+        # Called by Greenlet.__init__ while we're enabled.
+        if glet.parent is self._hub:
+            self._record(glet, _spawn_site())
+
+    def _enable(self):
+        if self._enabled_at is not None:
+            return
+        self._last = self._enabled_at = _clock()
+        self._current = getcurrent()
+        self._current_record = self._lookup(self._current)
+        self._previous = _greenlet_module.settrace(self._trace)
+        Greenlet._tracer = self
+
+    def _disable(self):
+        if self._enabled_at is None:
+            return
+        # Charge the time up to now to whoever is running.
+        self._charge(getcurrent(), None)
+        previous = _greenlet_module.settrace(self._previous)
+        if previous != self._trace:
+            # Someone else started tracing after us; leave them be.
+            _greenlet_module.settrace(previous)
+        self._previous = None
+        if Greenlet._tracer is self:
+            Greenlet._tracer = None
+        self.traced_time += _clock() - self._enabled_at
+        self._enabled_at = None
+
+    def start(self):
+        """
+        Begin tracing switches in the current thread.
+        """
+        if self._hub is not None:
+            return
+        self._hub = get_hub()
+        if self.sample_rate >= 1:
+            self._enable()
+            return
+        loop = self._hub.loop
+        self._sample_timer = loop.timer(0, self.sample_period, ref=False)
+        self._stop_timer = loop.timer(self.sample_period * self.sample_rate, ref=False)
+        self._sample_timer.start(self._sample)
+
+    def _sample(self):
+        self._enable()
+        self._stop_timer.start(self._disable)
+
+    def stop(self):
+        """
+        Stop tracing. The statistics gathered so far are kept.
+        """
+        if self._hub is None:
+            return
+        for timer in (self._sample_timer, self._stop_timer):
+            if timer is not None:
+                timer.stop()
+        self._sample_timer = self._stop_timer = None
+        self._disable()
+        self._hub = None
+
+    def greenlet_stats(self, glet):
+        """
+        Return a dict with the ``runtime``, ``switches``, ``function``
+        and ``spawn_site`` of *glet*, or None if it hasn't been seen.
+        """
+        record = self._greenlets.get(glet)
+        if record is None:
+            return None
+        return {'runtime': record[0],
+                'switches': record[1],
+                'function': record[3],
+                'spawn_site': record[4]}
+
+    def function_stats(self):
+        """
+        Return a dict mapping the name of each function greenlets have
+        run to a dict with the ``runtime`` and ``switches`` of all of
+        them together, and how many ``greenlets`` ran it.
+        """
+        return dict((name, {'runtime': totals[0],
+                            'switches': totals[1],
+                            'greenlets': totals[2]})
+                    for name, totals in self._functions.items())
+
+    def dump(self, file=None, limit=20):
+        """
+        Write the *limit* functions and the *limit* greenlets (of those
+        still referenced) that ran longest to *file* (by default,
+        :data:`sys.stdout`).
+        """
+        # pylint:disable=redefined-builtin
+        if file is None:
+            file = sys.stdout
+        traced = self.traced_time
+        if self._enabled_at is not None:
+            traced += _clock() - self._enabled_at
+        print('Traced for %.3f seconds' % traced, file=file)
+        print('%12s %10s %10s  %s' % ('runtime', 'switches', 'greenlets', 'function'), file=file)
+        functions = sorted(self._functions.items(), key=lambda item: item[1][0], reverse=True)
+        for name, totals in functions[:limit]:
+            print('%12.6f %10d %10d  %s' % (totals[0], totals[1], totals[2], name), file=file)
+        print(file=file)
+        print('%12s %10s  %s' % ('runtime', 'switches', 'greenlet'), file=file)
+        greenlets = sorted(self._greenlets.items(), key=lambda item: item[1][0], reverse=True)
+        for glet, record in greenlets[:limit]:
+            line = '%12.6f %10d  %r' % (record[0], record[1], glet)
+            if record[4] is not None:
+                line += ' spawned at %s' % record[4]
+            print(line, file=file)
+
+
+def start(sample_rate=1.0, sample_period=1.0, reset=False):
+    """
+    Start the :class:`GreenletTracer` of the current thread and return
+    it. A new one is created the first time, or if *reset* is true;
+    otherwise the existing one (and its arguments) is kept and resumed.
+    """
+    tracer = getattr(_threadlocal, 'tracer', None)
+    if tracer is None or reset:
+        if tracer is not None:
+            tracer.stop()
+        tracer = _threadlocal.tracer = GreenletTracer(sample_rate, sample_period)
+    tracer.start()
+    return tracer
+
+
+def stop():
+    """
+    Stop the tracer of the current thread and return it, or None. Its
+    statistics can still be dumped.
+    """
+    tracer = getattr(_threadlocal, 'tracer', None)
+    if tracer is not None:
+        tracer.stop()
+    return tracer
+
+
+def dump(file=None, limit=20):
+    """
+    Write the statistics of the current thread's tracer, which is
+    stopped or running, to *file*.
+    """
+    # pylint:disable=redefined-builtin
+    tracer = getattr(_threadlocal, 'tracer', None)
+    if tracer is None:
+        print('No greenlet tracer has been started', file=file or sys.stdout)
+        return
+    tracer.dump(file, limit)
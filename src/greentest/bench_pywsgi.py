@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+"""Benchmarking pywsgi request handling.
+
+Each benchmark sends small requests over one keep-alive connection
+and prints the time per request. Run with a benchmark name, or
+``all``.
+"""
+from __future__ import print_function
+import sys
+from time import time
+
+from gevent import socket
+from gevent import pywsgi
+
+N = 5000
+
+REQUEST = (b'GET /hello?name=world HTTP/1.1\r\n'
+           b'Host: localhost\r\n'
+           b'User-Agent: bench_pywsgi\r\n'
+           b'Accept: */*\r\n'
+           b'Accept-Encoding: gzip, deflate\r\n'
+           b'Cookie: session=0123456789abcdef\r\n'
+           b'\r\n')
+
+HEADERS = [('Content-Type', 'text/plain'),
+           ('Cache-Control', 'no-cache')]
+
+
+def application(environ, start_response):
+    # Like many applications, look at only a few keys
+    environ['REQUEST_METHOD'] # pylint:disable=pointless-statement
+    environ['QUERY_STRING'] # pylint:disable=pointless-statement
+    start_response('200 OK', HEADERS + [('Content-Length', '5')])
+    return [b'hello']
+
+
+def run(server_kwargs, pipeline=1, environ_class=None):
+    server = pywsgi.WSGIServer(('127.0.0.1', 0), application, log=None,
+                               **server_kwargs)
+    if environ_class is not None:
+        server.environ_class = environ_class
+    server.start()
+    try:
+        conn = socket.create_connection(('127.0.0.1', server.server_port))
+        rfile = conn.makefile('rb')
+        start = time()
+        for _ in range(N // pipeline):
+            conn.sendall(REQUEST * pipeline)
+            for _ in range(pipeline):
+                # The response has a fixed set of headers
+                while rfile.readline() != b'\r\n':
+                    pass
+                rfile.read(5)
+        delta = time() - start
+        conn.close()
+    finally:
+        server.stop()
+    return delta * 1000000.0 / N
+
+
+def bench_default():
+    print('default: %.1f microseconds per request' % run({}))
+
+
+def bench_fast_parser():
+    print("parser='fast': %.1f microseconds per request" % run({'parser': 'fast'}))
+
+
+def bench_lazy_environ():
+    print('LazyEnviron: %.1f microseconds per request'
+          % run({}, environ_class=pywsgi.LazyEnviron))
+
+
+def bench_pipeline():
+    print('pipelined by 10: %.1f microseconds per request' % run({}, pipeline=10))
+
+
+def main():
+    names = [name[6:] for name in globals() if name.startswith('bench_')]
+    names.sort()
+    wanted = sys.argv[1:] or ['all']
+    if 'all' in wanted:
+        wanted = names
+    for name in wanted:
+        globals()['bench_' + name]()
+
+
+if __name__ == '__main__':
+    main()
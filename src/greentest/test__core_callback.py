@@ -25,6 +25,33 @@ def main():
     assert called == [1], called
     assert not x, x
 
+    # Stopping a callback stops counting it right away
+    x = loop.run_callback(f)
+    assert loop.callbacks_pending == 1, loop.callbacks_pending
+    x.stop()
+    x.stop()
+    assert loop.callbacks_pending == 0, loop.callbacks_pending
+    gevent.sleep(0)
+    assert called == [1], called
+
+    # No more than callbacks_per_iteration run between two polls.
+    # (Get out of the current run of callbacks first.)
+    gevent.sleep(0.001)
+    seen = []
+    check = loop.check(ref=False)
+    check.start(lambda: seen.append(len(called)))
+    loop.callbacks_per_iteration = 2
+    try:
+        for _ in range(5):
+            loop.run_callback(f)
+        gevent.sleep(0)
+    finally:
+        loop.callbacks_per_iteration = 1000
+        check.stop()
+    assert called == [1] * 6, called
+    assert seen[:2] == [3, 5], seen
+    assert loop.callbacks_pending == 0, loop.callbacks_pending
+
 
 if __name__ == '__main__':
     called[:] = []
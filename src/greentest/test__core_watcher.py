@@ -51,6 +51,34 @@ class Test(greentest.TestCase):
         loop.run()
         self.assertEqual(lst, [(), 25])
 
+    def test_close(self):
+        loop = core.loop()
+        timer = loop.timer(0.01, ref=False)
+        timer.start(lambda: None)
+        timer.close()
+        self.assertFalse(timer.active)
+        self.assertEqual(timer.callback, None)
+        # closing twice doesn't give it back twice
+        timer.close()
+
+        new = loop.timer(0.001, priority=1)
+        self.assertIsNot(new, timer)
+        if hasattr(loop, 'watcher_pool_size'):
+            # only the cffi loop reuses the native structure, and
+            # the closed watcher can no longer reach it
+            self.assertRaises(ValueError, timer.start, lambda: None)
+        new.start(lambda: None)
+        timer.stop()
+        timer.close()
+        self.assertTrue(new.active)
+        new.stop()
+        self.assertTrue(new.ref)
+        self.assertEqual(new.priority, 1)
+        lst = []
+        new.start(lst.append, 1)
+        loop.run()
+        self.assertEqual(lst, [1])
+
 
 def reset(watcher, lst):
     watcher.args = None
@@ -10,6 +10,7 @@ ignore = ['wsgiserver.py',
           'wsgiserver_ssl.py',
           'webproxy.py',
           'webpy.py',
+          'websocket_echo.py',
           'unixsocket_server.py',
           'unixsocket_client.py',
           'psycopg2_pool.py',
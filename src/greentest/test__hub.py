@@ -22,6 +22,7 @@
 import greentest
 import time
 import re
+import traceback
 import gevent
 from gevent import socket
 from gevent.hub import Waiter, get_hub
@@ -116,5 +117,41 @@ class TestWaiter(greentest.TestCase):
         g.kill()
 
 
+class TestMonitor(greentest.TestCase):
+
+    def setUp(self):
+        super(TestMonitor, self).setUp()
+        self.hub = get_hub()
+        self.monitor = self.hub.start_monitor(threshold=0.05)
+
+    def tearDown(self):
+        self.hub.stop_monitor()
+        super(TestMonitor, self).tearDown()
+
+    def test_blocked(self):
+        reports = []
+        self.monitor.report_blocked = lambda elapsed, frame: reports.append(
+            (elapsed, ''.join(traceback.format_stack(frame))))
+        gevent.sleep(0.01)
+        time.sleep(0.3) # Not cooperative
+        gevent.sleep(0.01)
+        self.assertEqual(len(reports), 1, reports)
+        elapsed, stack = reports[0]
+        self.assertGreaterEqual(elapsed, 0.05)
+        self.assertIn('test_blocked', stack)
+        stats = self.monitor.stats()
+        self.assertEqual(stats['blocked'], 1)
+        self.assertGreaterEqual(stats['max_lag'], 0.3)
+
+    def test_stats(self):
+        for _ in range(5):
+            gevent.sleep(0)
+        stats = self.monitor.stats()
+        self.assertGreater(stats['iterations_per_second'], 0)
+        self.assertGreaterEqual(stats['callbacks_run'], 5)
+        self.assertEqual(stats['blocked'], 0)
+        self.assertIs(self.hub.start_monitor(), self.monitor)
+
+
 if __name__ == '__main__':
     greentest.main()
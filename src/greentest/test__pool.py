@@ -545,5 +545,75 @@ class TestErrorInHandler(greentest.TestCase):
         self.assertRaises(StopIteration, next, it)
 
 
+class TestWorkerPool(greentest.TestCase):
+
+    def test_reuses_greenlets(self):
+        p = pool.WorkerPool(2)
+        seen = []
+
+        def func(i):
+            gevent.sleep(0.001)
+            seen.append((i, gevent.getcurrent()))
+
+        for i in range(6):
+            p.spawn(func, i)
+        self.assertTrue(p.full())
+        self.assertTrue(p.join(timeout=1))
+        self.assertFalse(p)
+        self.assertEqual(sorted(i for i, _ in seen), list(range(6)))
+        self.assertEqual(len(set(glet for _, glet in seen)), 2)
+
+    def test_error_in_function(self):
+        p = pool.WorkerPool(1)
+        done = []
+        self.expect_one_error()
+        p.spawn(self._raise)
+        p.spawn(done.append, 1)
+        p.join()
+        self.assert_error(ExpectedException)
+        self.assertEqual(done, [1])
+
+    def _raise(self):
+        raise ExpectedException('expected')
+
+    def test_kill(self):
+        p = pool.WorkerPool(2)
+        started = Event()
+
+        def func():
+            started.set()
+            gevent.sleep(10)
+
+        p.spawn(func)
+        p.spawn(func)
+        started.wait()
+        p.kill(timeout=1)
+        self.assertFalse(p)
+        self.assertEqual(p.free_count(), 2)
+        done = []
+        p.spawn(done.append, 1)
+        p.join(timeout=1)
+        self.assertEqual(done, [1])
+
+    def test_server(self):
+        from gevent.server import StreamServer
+        from gevent import socket
+
+        def handle(sock, _address):
+            sock.sendall(b'hello')
+
+        server = StreamServer(('127.0.0.1', 0), handle, spawn=pool.WorkerPool(2))
+        server.start()
+        try:
+            for _ in range(3):
+                conn = socket.create_connection(('127.0.0.1', server.server_port))
+                try:
+                    self.assertEqual(conn.recv(5), b'hello')
+                finally:
+                    conn.close()
+        finally:
+            server.stop()
+
+
 if __name__ == '__main__':
     greentest.main()
@@ -27,8 +27,11 @@ try:
 except ImportError:
     # Python 2
     from cgi import parse_qs
+import json
 import os
+import struct
 import sys
+import tempfile
 try:
     # On Python 2, we want the C-optimized version if
     # available; it has different corner-case behaviour than
@@ -38,6 +41,7 @@ try:
 except ImportError:
     from io import BytesIO as StringIO
 import weakref
+import zlib
 
 from wsgiref.validate import validator
 
@@ -46,7 +50,17 @@ import gevent
 from greentest import PY3, PYPY
 from gevent import socket
 from gevent import pywsgi
+from gevent.event import Event
 from gevent.pywsgi import Input
+from gevent import _websocket
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.errors
+    import h2.events
+except ImportError:
+    h2 = None
 
 
 CONTENT_LENGTH = 'Content-Length'
@@ -590,6 +604,13 @@ class TestChunkedPost(TestCase):
             return lines
         elif env['PATH_INFO'] == '/c':
             return [x for x in iter(lambda: env['wsgi.input'].read(1), b'')]
+        elif env['PATH_INFO'] == '/d':
+            assert env['wsgi.input_terminated']
+            buf = bytearray(3)
+            result = []
+            for count in iter(lambda: env['wsgi.input'].readinto(buf), 0):
+                result.append(bytes(buf[:count]))
+            return result
 
     def test_014_chunked_post(self):
         fd = self.makefile()
@@ -608,6 +629,10 @@ class TestChunkedPost(TestCase):
         fd.write(data.replace(b'/a', b'/c'))
         read_http(fd, body='oh hai')
 
+        fd = self.makefile()
+        fd.write(data.replace(b'/a', b'/d'))
+        read_http(fd, body='oh hai')
+
     def test_229_incorrect_chunk_no_newline(self):
         # Giving both a Content-Length and a Transfer-Encoding,
         # TE is preferred. But if the chunking is bad from the client,
@@ -1298,6 +1323,277 @@ class TestLeakInput(TestCase):
         assert d.startswith(b"HTTP/1.1 200 OK"), "bad response: %r" % d
         self._leak_environ.pop('_leak')
 
+class _ShrinkingFile(object):
+    # A file that loses the second half of its contents between the
+    # handler looking at its size and sending it.
+
+    def __init__(self, contents):
+        self._file = tempfile.TemporaryFile()
+        self._file.write(contents)
+        self._file.seek(0)
+        self._size = len(contents) // 2
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def tell(self):
+        self._file.truncate(self._size)
+        return self._file.tell()
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def close(self):
+        self._file.close()
+
+
+class TestFileWrapper(TestCase):
+    # The validator wraps the result, hiding the FileWrapper
+    validator = None
+
+    with open(__file__, 'rb') as _f:
+        contents = _f.read()
+
+    def application(self, environ, start_response):
+        path = environ['PATH_INFO']
+        headers = [('Content-Type', 'text/plain')]
+        if path == '/bytesio':
+            filelike = StringIO(self.contents)
+        elif path == '/shrinks':
+            filelike = _ShrinkingFile(self.contents)
+        else:
+            filelike = open(__file__, 'rb')
+            if path == '/offset':
+                filelike.seek(100)
+            elif path == '/length':
+                headers.append(('Content-Length', '10'))
+        start_response('200 OK', headers)
+        return environ['wsgi.file_wrapper'](filelike)
+
+    def test_regular_file(self):
+        fd = self.makefile()
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response = read_http(fd, body=self.contents, content_length=len(self.contents))
+        self.assertFalse(response.chunks)
+
+    def test_offset(self):
+        fd = self.makefile()
+        fd.write('GET /offset HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        read_http(fd, body=self.contents[100:], content_length=len(self.contents) - 100)
+
+    def test_provided_length(self):
+        fd = self.makefile()
+        fd.write('GET /length HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        read_http(fd, body=self.contents[:10], content_length=10)
+
+    def test_not_a_file(self):
+        fd = self.makefile()
+        fd.write('GET /bytesio HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        response = read_http(fd, body=self.contents)
+        self.assertTrue(response.chunks)
+
+    if PY3:
+        # Only Python 3 sockets have sendfile()
+
+        def test_file_shrinks(self):
+            # The response is shorter than its Content-Length, so the
+            # connection must be closed after it.
+            fd = self.makefile()
+            fd.write('GET /shrinks HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            data = fd.read()
+            half = self.contents[:len(self.contents) // 2]
+            self.assertIn(('Content-Length: %s\r\n' % len(self.contents)).encode('ascii'), data)
+            self.assertTrue(data.endswith(b'\r\n\r\n' + half), data[-100:])
+
+
+class TestOutputBuffer(TestCase):
+    validator = None
+
+    def init_server(self, application):
+        TestCase.init_server(self, application)
+        self.server.output_buffer_size = 16
+        self.server.output_buffer_latency = 60
+
+    def application(self, environ, start_response):
+        path = environ['PATH_INFO']
+        write = start_response('200 OK', [('Content-Type', 'text/plain')])
+        if path == '/small':
+            return (b'a' for _ in range(5))
+        if path == '/block':
+            return self._blocking()
+        if path == '/write':
+            return self._writing(write)
+        return (b'x' * 10 for _ in range(5))
+
+    def _blocking(self):
+        yield b'a'
+        gevent.sleep(0.01)
+        yield b'b'
+
+    def _writing(self, write):
+        yield b'a'
+        write(b'b')
+        yield b'c'
+
+    def test_fits_in_buffer(self):
+        fd = self.makefile()
+        fd.write('GET /small HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        read_http(fd, body=b'aaaaa', content_length=5, chunks=False)
+
+    def test_coalesced_chunks(self):
+        fd = self.makefile()
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        read_http(fd, body=b'x' * 50, chunks=[b'x' * 20, b'x' * 20, b'x' * 10])
+
+    def test_flush_when_blocking(self):
+        fd = self.makefile()
+        fd.write('GET /block HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        read_http(fd, body=b'ab', chunks=[b'a', b'b'])
+
+    def test_flush_before_write(self):
+        fd = self.makefile()
+        fd.write('GET /write HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        read_http(fd, body=b'abc', chunks=[b'a', b'b', b'c'])
+
+
+class TestPipeline(TestCase):
+    validator = None
+
+    def init_server(self, application):
+        TestCase.init_server(self, application)
+        self.server.max_pipeline = 16
+
+    def application(self, environ, start_response):
+        path = environ['PATH_INFO']
+        if path == '/sleep':
+            gevent.sleep(0.01)
+        body = environ['wsgi.input'].read()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [path.encode('ascii') + body]
+
+    def _pipeline(self, paths):
+        fd = self.makefile()
+        fd.write(''.join('GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % path
+                         for path in paths))
+        for path in paths:
+            read_http(fd, body=path)
+
+    def test_in_order(self):
+        self._pipeline(['/%d' % i for i in range(5)])
+
+    def test_application_blocks(self):
+        self._pipeline(['/a', '/sleep', '/b'])
+
+    def test_limit(self):
+        self.server.max_pipeline = 2
+        self._pipeline(['/%d' % i for i in range(5)])
+
+    def test_partial_request(self):
+        # The response to a complete request isn't held while the
+        # next one trickles in.
+        fd = self.makefile()
+        fd.write('GET /a HTTP/1.1\r\nHost: localhost\r\n\r\nGET /b HTTP/1.1\r\n')
+        with gevent.Timeout(1):
+            read_http(fd, body='/a')
+        fd.write('Host: localhost\r\n\r\n')
+        read_http(fd, body='/b')
+
+    def test_request_with_body(self):
+        # The client may wait for the earlier responses before sending
+        # the body.
+        fd = self.makefile()
+        fd.write('GET /a HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                 'POST /b HTTP/1.1\r\nHost: localhost\r\nContent-Length: 2\r\n\r\n')
+        with gevent.Timeout(1):
+            read_http(fd, body='/a')
+        fd.write('ab')
+        read_http(fd, body='/bab')
+
+    def test_disabled_by_default(self):
+        self.assertEqual(pywsgi.WSGIServer.max_pipeline, 0)
+
+
+class FastParserMixin(object):
+
+    def init_server(self, application):
+        logger = self.logger = self.init_logger()
+        self.server = pywsgi.WSGIServer(('', 0), application,
+                                        log=logger, error_log=logger,
+                                        parser='fast')
+
+
+class TestFastParserCommon(FastParserMixin, CommonTests):
+    pass
+
+
+class TestFastParserMultiLineHeader(FastParserMixin, MultiLineHeader):
+    pass
+
+
+class TestFastParserCookies(FastParserMixin, MultipleCookieHeadersTest):
+    pass
+
+
+class TestPooledReadBuffers(CommonTests):
+
+    def init_server(self, application):
+        CommonTests.init_server(self, application)
+        self.server.pool_read_buffers = True
+
+
+class TestFastParserBadRequest(FastParserMixin, BadRequestTests):
+
+    def test_conflicting_content_length(self):
+        self.content_length = '1'
+        fd = self.connect().makefile(bufsize=1)
+        fd.write('POST / HTTP/1.1\r\nHost: localhost\r\n'
+                 'Content-Length: 1\r\nContent-Length: 2\r\n\r\nab')
+        read_http(fd, code=400)
+
+
+class TestDateCache(greentest.TestCase):
+
+    def test_formatted_once_per_second(self):
+        class Loop(object):
+            time = 1000000000.25
+
+            def now(self):
+                return self.time
+
+        loop = Loop()
+        cache = pywsgi._DateCache(loop)
+        first = cache()
+        self.assertEqual(first, pywsgi.format_date_time(1000000000))
+        loop.time += 0.5
+        self.assertIs(cache(), first)
+        loop.time += 1
+        self.assertEqual(cache(), pywsgi.format_date_time(1000000001))
+
+    def test_server_date(self):
+        server = pywsgi.WSGIServer(('127.0.0.1', 0), None)
+        self.assertTrue(server._http_date().endswith(b' GMT'))
+
+
+class TestStartResponseCache(TestCase):
+    validator = None
+
+    def application(self, environ, start_response):
+        value = environ['PATH_INFO'][1:]
+        start_response('200 OK', [('Content-Type', 'text/plain'), ('X-Value', value)])
+        return [b'hello']
+
+    def test_cached_and_uncached(self):
+        for value in ('secret1', 'secret2', 'secret1'):
+            fd = self.makefile()
+            fd.write('GET /%s HTTP/1.1\r\nHost: localhost\r\n\r\n' % value)
+            response = read_http(fd, body='hello')
+            response.assertHeader('X-Value', value)
+        self.assertIn('200 OK', pywsgi._STATUS_CACHE)
+        self.assertIn('X-Value', pywsgi._HEADER_NAME_CACHE)
+        # Values, which may be secrets, aren't kept.
+        self.assertNotIn('secret', repr(pywsgi._HEADER_NAME_CACHE))
+
+
 class TestHTTPResponseSplitting(TestCase):
     # The validator would prevent the app from doing the
     # bad things it needs to do
@@ -1509,6 +1805,30 @@ class TestInputRaw(greentest.BaseTestCase):
         i = self.make_input("2\r\n1", chunked_input=True)
         self.assertRaises(IOError, i.readline)
 
+    def test_readinto(self):
+        i = self.make_input("123", content_length=3)
+        buf = bytearray(5)
+        self.assertEqual(i.readinto(buf), 3)
+        self.assertEqual(bytes(buf[:3]), "123")
+        self.assertEqual(i.readinto(buf), 0)
+
+    def test_short_post_readinto(self):
+        i = self.make_input("1", content_length=2)
+        self.assertRaises(IOError, i.readinto, bytearray(2))
+
+    def test_chunked_readinto(self):
+        i = self.make_input(["12", "345", ""])
+        buf = bytearray(4)
+        self.assertEqual(i.readinto(buf), 4)
+        self.assertEqual(bytes(buf), "1234")
+        self.assertEqual(i.readinto(memoryview(buf)[1:]), 1)
+        self.assertEqual(bytes(buf[1:2]), "5")
+        self.assertEqual(i.readinto(buf), 0)
+
+    def test_chunked_short_chunk_readinto(self):
+        i = self.make_input("2\r\n1", chunked_input=True)
+        self.assertRaises(IOError, i.readinto, bytearray(2))
+
     def test_32bit_overflow(self):
         # https://github.com/gevent/gevent/issues/289
         # Should not raise an OverflowError on Python 2
@@ -1607,6 +1927,126 @@ class TestLogging(TestCase):
         # Issue 756: Make sure we don't throw a newline on the end
         self.assertTrue('\n' not in msg, msg)
 
+
+class TestAccessLog(TestCase):
+
+    class Log(object):
+
+        def __init__(self):
+            self.writes = []
+
+        def write(self, data):
+            self.writes.append(data)
+
+    def init_server(self, application):
+        self.log = self.Log()
+        self.server = pywsgi.WSGIServer(('', 0), application, log=self.log,
+                                        access_log=pywsgi.AccessLog(formatter='json'))
+
+    @staticmethod
+    def application(env, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'hello']
+
+    def test_json(self):
+        self.urlopen()
+        self.urlopen()
+        gevent.sleep(0.01)
+        lines = ''.join(self.log.writes).splitlines()
+        self.assertEqual(len(lines), 2)
+        record = json.loads(lines[0])
+        self.assertEqual(record['request'], 'GET / HTTP/1.1')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['length'], 5)
+
+    def test_drop(self):
+        access_log = pywsgi.AccessLog(self.Log(), max_pending=2)
+        record = ('-', 0, 'GET / HTTP/1.1', '200 OK', 5, None)
+        for _ in range(3):
+            access_log.add(record)
+        self.assertEqual(access_log.dropped, 1)
+        access_log.flush()
+        self.assertEqual(access_log.log.writes,
+                         [pywsgi.format_access_text(record) + '\n'] * 2)
+
+    def test_stop_closes(self):
+        self.urlopen()
+        gevent.sleep(0.01)
+        writer = self.server.access_log._writer
+        self.assertIsNotNone(writer)
+        self.server.stop()
+        gevent.sleep(0)
+        self.assertTrue(writer.dead)
+        self.assertEqual(len(''.join(self.log.writes).splitlines()), 1)
+
+class TestCompression(TestCase):
+
+    validator = None
+    body = b'hello world ' * 200
+
+    def init_server(self, application):
+        TestCase.init_server(self, application)
+        self.server.compression = True
+
+    def application(self, env, start_response):
+        path = env['PATH_INFO']
+        content_type = 'image/png' if path == '/png' else 'text/plain'
+        headers = [('Content-Type', content_type)]
+        if path == '/etag':
+            headers.append(('ETag', '"abc"'))
+        start_response('200 OK', headers)
+        if path == '/small':
+            return [b'hello']
+        if path == '/stream':
+            return iter([self.body, self.body])
+        return [self.body]
+
+    def _get(self, path, accept_encoding='gzip, deflate'):
+        fd = self.makefile()
+        fd.write(('GET %s HTTP/1.1\r\nHost: localhost\r\nAccept-Encoding: %s\r\n\r\n'
+                  % (path, accept_encoding)).encode('ascii'))
+        return read_http(fd)
+
+    def test_list(self):
+        response = self._get('/')
+        response.assertHeader('Content-Encoding', 'gzip')
+        response.assertHeader('Vary', 'Accept-Encoding')
+        self.assertEqual(response.headers['Content-Length'], str(len(response.body)))
+        self.assertEqual(zlib.decompress(response.body, 16 + zlib.MAX_WBITS), self.body)
+
+    def test_stream(self):
+        response = self._get('/stream')
+        response.assertHeader('Content-Encoding', 'gzip')
+        self.assertTrue(response.chunks)
+        self.assertEqual(zlib.decompress(response.body, 16 + zlib.MAX_WBITS), self.body * 2)
+
+    def test_deflate(self):
+        response = self._get('/', 'deflate')
+        response.assertHeader('Content-Encoding', 'deflate')
+        self.assertEqual(zlib.decompress(response.body), self.body)
+
+    def test_not_compressed(self):
+        for path, accept_encoding in (('/', 'identity'),
+                                      ('/', 'gzip;q=0'),
+                                      ('/small', 'gzip'),
+                                      ('/png', 'gzip')):
+            response = self._get(path, accept_encoding)
+            response.assertHeader('Content-Encoding', False)
+            self.assertEqual(response.body, b'hello' if path == '/small' else self.body)
+
+    def test_strong_etag_weakened(self):
+        response = self._get('/etag')
+        response.assertHeader('Content-Encoding', 'gzip')
+        response.assertHeader('ETag', 'W/"abc"')
+        response = self._get('/etag', 'identity')
+        response.assertHeader('ETag', '"abc"')
+
+    def test_threadpool(self):
+        self.server.compression_threadpool_size = 1024
+        response = self._get('/stream')
+        self.assertEqual(zlib.decompress(response.body, 16 + zlib.MAX_WBITS), self.body * 2)
+
+
 class TestEnviron(TestCase):
 
     # The wsgiref validator asserts type(environ) is dict.
@@ -1677,7 +2117,7 @@ class TestEnviron(TestCase):
 
 
     def test_copy_still_secure(self):
-        for cls in (pywsgi.Environ, pywsgi.SecureEnviron):
+        for cls in (pywsgi.Environ, pywsgi.SecureEnviron, pywsgi.LazyEnviron):
             self.assertIsInstance(cls().copy(), cls)
 
     def test_pickle_copy_returns_dict(self):
@@ -1686,7 +2126,7 @@ class TestEnviron(TestCase):
         import pickle
         import json
 
-        for cls in (pywsgi.Environ, pywsgi.SecureEnviron):
+        for cls in (pywsgi.Environ, pywsgi.SecureEnviron, pywsgi.LazyEnviron):
             bltin = {'key': 'value'}
             env = cls(bltin)
             self.assertIsInstance(env, cls)
@@ -1705,5 +2145,456 @@ class TestEnviron(TestCase):
 
 del CommonTests
 
+class TestLazyEnviron(TestCase):
+    validator = None
+
+    def init_server(self, application):
+        super(TestLazyEnviron, self).init_server(application)
+        self.server.environ_class = pywsgi.LazyEnviron
+
+    def application(self, env, start_response):
+        self.assertIsInstance(env, pywsgi.LazyEnviron)
+        path = env['PATH_INFO']
+        if path == '/get':
+            self.assertEqual(env.get('HTTP_X_TEST'), 'a,b')
+            self.assertIsNone(env.get('HTTP_MISSING'))
+        elif path == '/contains':
+            self.assertIn('HTTP_X_TEST', env)
+            self.assertNotIn('HTTP_MISSING', env)
+        elif path == '/copy':
+            env = dict(env.copy())
+            self.assertEqual(env['HTTP_X_TEST'], 'a,b')
+            self.assertEqual(env['CONTENT_TYPE'], 'text/plain')
+        elif path == '/items':
+            self.assertIn(('HTTP_X_TEST', 'a,b'), list(env.items()))
+        elif path == '/set':
+            env['HTTP_X_TEST'] = 'c'
+            self.assertEqual(env['HTTP_X_TEST'], 'c')
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [path.encode('ascii')]
+
+    def _request(self, path):
+        fd = self.makefile()
+        fd.write('GET %s HTTP/1.1\r\nHost: localhost\r\n'
+                 'X-Test: a\r\nX-Test: b\r\nContent-Type: text/plain\r\n\r\n' % path)
+        read_http(fd, body=path)
+
+    def test_get(self):
+        self._request('/get')
+
+    def test_contains(self):
+        self._request('/contains')
+
+    def test_copy(self):
+        self._request('/copy')
+
+    def test_items(self):
+        self._request('/items')
+
+    def test_set(self):
+        self._request('/set')
+
+    def test_fast_parser(self):
+        self.server.parser = pywsgi._fast_parse_headers
+        self._request('/get')
+
+class KeepAliveMixin(object):
+    validator = None
+
+    def application(self, env, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'hello']
+
+    def _get(self, fd):
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        return read_http(fd, body='hello')
+
+
+class TestKeepAlive(KeepAliveMixin, TestCase):
+
+    def test_keepalive_timeout(self):
+        self.server.keepalive_timeout = 0.1
+        fd = self.makefile()
+        self._get(fd)
+        self._get(fd)
+        with gevent.Timeout(3):
+            self.assertEqual(fd.read(), b'')
+
+    def test_max_keepalive_requests(self):
+        self.server.max_keepalive_requests = 2
+        fd = self.makefile()
+        response = self._get(fd)
+        response.assertHeader('Connection', False)
+        response = self._get(fd)
+        response.assertHeader('Connection', 'close')
+        with gevent.Timeout(3):
+            self.assertEqual(fd.read(), b'')
+
+    def test_max_idle_connections(self):
+        self.server.max_idle_connections = 1
+        first = self.makefile()
+        self._get(first)
+        second = self.makefile()
+        self._get(second)
+        # The first was idle longest
+        with gevent.Timeout(3):
+            self.assertEqual(first.read(), b'')
+        self._get(second)
+
+
+class TestKeepAlivePoolFull(KeepAliveMixin, TestCase):
+
+    def init_server(self, application):
+        from gevent.pool import Pool
+        logger = self.logger = self.init_logger()
+        self.server = pywsgi.WSGIServer(('', 0), application,
+                                        log=logger, error_log=logger,
+                                        spawn=Pool(1))
+
+    def test_pool_full(self):
+        first = self.makefile()
+        self._get(first)
+        # The idle connection makes way for a new one
+        with gevent.Timeout(3):
+            self._get(self.makefile())
+            self.assertEqual(first.read(), b'')
+
+    def test_idle_kept_while_none_waiting(self):
+        first = self.makefile()
+        self._get(first)
+        gevent.sleep(0.05)
+        self._get(first)
+
+
+class TestDrain(KeepAliveMixin, TestCase):
+
+    def application(self, env, start_response):
+        if env['PATH_INFO'] == '/slow':
+            self.slow_started.set()
+            self.slow_release.wait()
+        return KeepAliveMixin.application(self, env, start_response)
+
+    def setUp(self):
+        self.slow_started = Event()
+        self.slow_release = Event()
+        TestCase.setUp(self)
+
+    def test_idle_closed(self):
+        fd = self.makefile()
+        self._get(fd)
+        with gevent.Timeout(0.5):
+            self.server.stop(timeout=10)
+            self.assertEqual(fd.read(), b'')
+        self.assertTrue(self.server.draining)
+
+    def test_in_flight(self):
+        fd = self.makefile()
+        fd.write('GET /slow HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        self.slow_started.wait()
+        self.assertEqual(self.server.in_flight, 1)
+        stopping = gevent.spawn(self.server.stop, timeout=10)
+        gevent.sleep(0.01)
+        self.assertFalse(stopping.ready())
+        self.slow_release.set()
+        response = read_http(fd, body='hello')
+        response.assertHeader('Connection', 'close')
+        with gevent.Timeout(0.5):
+            stopping.join()
+        self.assertEqual(self.server.in_flight, 0)
+
+
+class TestOverload(KeepAliveMixin, TestCase):
+
+    def init_server(self, application):
+        from gevent.pool import Pool
+        logger = self.logger = self.init_logger()
+        self.server = pywsgi.WSGIServer(('', 0), application,
+                                        log=logger, error_log=logger,
+                                        spawn=Pool(1))
+        self.server.max_queue_time = 0.2
+        self.server.max_loop_lag = 0.5
+        self.server.overload_interval = 0.02
+
+    def application(self, env, start_response):
+        if env['PATH_INFO'] == '/slow':
+            self.slow_release.wait()
+        return KeepAliveMixin.application(self, env, start_response)
+
+    def setUp(self):
+        self.slow_release = Event()
+        TestCase.setUp(self)
+
+    def _start_slow(self):
+        # Keep the only place in the pool busy
+        fd = self.makefile()
+        fd.write('GET /slow HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        gevent.sleep(0.01)
+        return fd
+
+    def test_queued(self):
+        slow = self._start_slow()
+        fd = self.makefile()
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        fd.flush()
+        gevent.sleep(0.05)
+        self.slow_release.set()
+        with gevent.Timeout(3):
+            read_http(slow, body='hello')
+            read_http(fd, body='hello')
+        self.assertEqual(self.server.shed_count, 0)
+
+    def test_queue_time(self):
+        self._start_slow()
+        with gevent.Timeout(3):
+            read_http(self.makefile(), code=503)
+        self.assertEqual(self.server.shed_count, 1)
+        self.assertEqual(self.server.shed_queue_timeouts, 1)
+        self.slow_release.set()
+
+    def test_loop_lag(self):
+        # Any lag at all is too much
+        self.server.max_loop_lag = -1
+        with gevent.Timeout(3):
+            read_http(self.makefile(), code=503)
+        self.assertEqual(self.server.shed_lagging, 1)
+
+class TestWebSocket(TestCase):
+    validator = None
+
+    def init_server(self, application):
+        TestCase.init_server(self, application)
+        self.server.websocket = True
+
+    def application(self, env, start_response):
+        ws = env.get('wsgi.websocket')
+        if ws is None or env['PATH_INFO'] == '/reject':
+            start_response('403 Forbidden', [('Content-Type', 'text/plain')])
+            return [b'no']
+        ws.accept(protocol=ws.protocols[0] if ws.protocols else None)
+        while True:
+            message = ws.receive()
+            if message is None:
+                break
+            ws.send(message)
+        return []
+
+    def _handshake(self, extra='', path='/'):
+        fd = self.makefile()
+        fd.write('GET %s HTTP/1.1\r\nHost: localhost\r\n'
+                 'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                 'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                 'Sec-WebSocket-Version: 13\r\n%s\r\n' % (path, extra))
+        fd.flush()
+        return fd
+
+    def _accept(self, extra=''):
+        fd = self._handshake(extra)
+        status, headers = read_headers(fd)
+        self.assertTrue(status.startswith('HTTP/1.1 101 '), status)
+        # The example from RFC 6455 1.3
+        self.assertEqual(headers['Sec-WebSocket-Accept'], 's3pPLMBiTxaQ9kYGzzhZRbK+xOo=')
+        return fd, headers
+
+    def _send(self, fd, opcode, payload, fin=True, rsv1=False, mask=b'abcd'):
+        header = bytearray(_websocket.frame_header(opcode, len(payload), fin, rsv1))
+        if mask:
+            header[1] |= 0x80
+            payload = mask + _websocket.apply_mask(payload, mask)
+        fd.write(bytes(header) + payload)
+        fd.flush()
+
+    def _read(self, fd):
+        first, length = bytearray(fd.read(2))
+        if length == 126:
+            length = struct.unpack('!H', fd.read(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', fd.read(8))[0]
+        return first, fd.read(length)
+
+    def test_echo(self):
+        fd, _ = self._accept()
+        self._send(fd, 1, b'hello')
+        self.assertEqual(self._read(fd), (0x81, b'hello'))
+        data = b'x' * 70000
+        self._send(fd, 2, data)
+        self.assertEqual(self._read(fd), (0x82, data))
+
+    def test_protocol(self):
+        _, headers = self._accept('Sec-WebSocket-Protocol: chat, superchat\r\n')
+        self.assertEqual(headers['Sec-WebSocket-Protocol'], 'chat')
+
+    def test_fragmented_with_ping(self):
+        fd, _ = self._accept()
+        self._send(fd, 1, b'hel', fin=False)
+        self._send(fd, 9, b'ping')
+        self._send(fd, 0, b'lo')
+        self.assertEqual(self._read(fd), (0x8A, b'ping'))
+        self.assertEqual(self._read(fd), (0x81, b'hello'))
+
+    def test_close(self):
+        fd, _ = self._accept()
+        self._send(fd, 8, struct.pack('!H', 1001))
+        self.assertEqual(self._read(fd), (0x88, struct.pack('!H', 1001)))
+        self.assertEqual(fd.read(), b'')
+
+    def test_unmasked(self):
+        fd, _ = self._accept()
+        self._send(fd, 1, b'hello', mask=None)
+        self.assertEqual(self._read(fd), (0x88, struct.pack('!H', 1002)))
+
+    def test_deflate(self):
+        fd, headers = self._accept('Sec-WebSocket-Extensions: permessage-deflate; '
+                                   'client_max_window_bits\r\n')
+        self.assertEqual(headers['Sec-WebSocket-Extensions'], 'permessage-deflate')
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        data = compressor.compress(b'hello' * 100) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._send(fd, 1, data[:-4], rsv1=True)
+        first, payload = self._read(fd)
+        self.assertEqual(first, 0xC1)
+        payload = zlib.decompressobj(-15).decompress(payload + b'\x00\x00\xff\xff')
+        self.assertEqual(payload, b'hello' * 100)
+
+    def test_reject(self):
+        fd = self._handshake(path='/reject')
+        read_http(fd, code=403, body='no')
+
+    def test_not_websocket(self):
+        fd = self.makefile()
+        fd.write('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        read_http(fd, code=403, body='no')
+
+
+if h2 is not None:
+
+    class TestHTTP2(TestCase):
+        validator = None
+
+        def init_server(self, application):
+            TestCase.init_server(self, application)
+            self.server.http2 = True
+
+        def application(self, env, start_response):
+            body = env['wsgi.input'].read()
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Connection', 'keep-alive')])
+            return [env['SERVER_PROTOCOL'].encode('ascii'), b' ',
+                    env['PATH_INFO'].encode('ascii'), b' ', body]
+
+        def _client(self):
+            return h2.connection.H2Connection(
+                config=h2.config.H2Configuration(client_side=True, header_encoding=None))
+
+        def _responses(self, sock, client, count):
+            # Return {stream_id: (headers, body)} for *count* responses
+            headers = {}
+            bodies = {}
+            ended = 0
+            while ended < count:
+                data = sock.recv(65536)
+                self.assertTrue(data)
+                for event in client.receive_data(data):
+                    if isinstance(event, h2.events.ResponseReceived):
+                        headers[event.stream_id] = dict(event.headers)
+                    elif isinstance(event, h2.events.DataReceived):
+                        bodies[event.stream_id] = bodies.get(event.stream_id, b'') + event.data
+                        client.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        ended += 1
+                sock.sendall(client.data_to_send())
+            return dict((stream_id, (headers[stream_id], bodies.get(stream_id, b'')))
+                        for stream_id in headers)
+
+        def _request(self, client, stream_id, path, body=b''):
+            client.send_headers(stream_id, [(':method', 'POST'), (':path', path),
+                                            (':scheme', 'http'), (':authority', 'localhost')],
+                                end_stream=not body)
+            if body:
+                client.send_data(stream_id, body, end_stream=True)
+
+        def test_prior_knowledge(self):
+            sock = self.connect()
+            client = self._client()
+            client.initiate_connection()
+            self._request(client, 1, '/a', b'one')
+            self._request(client, 3, '/b', b'two')
+            sock.sendall(client.data_to_send())
+            responses = self._responses(sock, client, 2)
+            headers, body = responses[1]
+            self.assertEqual(headers[b':status'], b'200')
+            self.assertNotIn(b'connection', headers)
+            self.assertEqual(body, b'HTTP/2.0 /a one')
+            self.assertEqual(responses[3][1], b'HTTP/2.0 /b two')
+
+        def test_upgrade(self):
+            client = self._client()
+            settings = client.initiate_upgrade_connection()
+            fd = self.makefile()
+            fd.write(b'GET /up HTTP/1.1\r\nHost: localhost\r\n'
+                     b'Connection: Upgrade, HTTP2-Settings\r\nUpgrade: h2c\r\n'
+                     b'HTTP2-Settings: ' + settings + b'\r\n\r\n')
+            fd.flush()
+            status, _ = read_headers(fd)
+            self.assertTrue(status.startswith('HTTP/1.1 101 '), status)
+            client.initiate_connection()
+            fd.write(client.data_to_send())
+            fd.flush()
+            headers, body = self._responses(FileSock(fd), client, 1)[1]
+            self.assertEqual(headers[b':status'], b'200')
+            self.assertEqual(body, b'HTTP/1.1 /up ')
+
+
+    class TestHTTP2PoolFull(TestCase):
+        validator = None
+
+        def init_server(self, application):
+            from gevent.pool import Pool
+            logger = self.logger = self.init_logger()
+            # The connection takes the only place
+            self.server = pywsgi.WSGIServer(('', 0), application,
+                                            log=logger, error_log=logger,
+                                            spawn=Pool(1), http2=True)
+
+        def application(self, env, start_response):
+            start_response('200 OK', [])
+            return [b'hi']
+
+        def test_stream_refused(self):
+            sock = self.connect()
+            client = h2.connection.H2Connection(
+                config=h2.config.H2Configuration(client_side=True, header_encoding=None))
+            client.initiate_connection()
+            client.send_headers(1, [(':method', 'GET'), (':path', '/'),
+                                    (':scheme', 'http'), (':authority', 'localhost')],
+                                end_stream=True)
+            sock.sendall(client.data_to_send())
+            reset = None
+            while reset is None:
+                data = sock.recv(65536)
+                self.assertTrue(data)
+                for event in client.receive_data(data):
+                    if isinstance(event, h2.events.StreamReset):
+                        reset = event
+                sock.sendall(client.data_to_send())
+            self.assertEqual(reset.error_code, h2.errors.ErrorCodes.REFUSED_STREAM)
+
+
+    class FileSock(object):
+        # Enough of a socket for TestHTTP2._responses, over a file
+        # that may have buffered the start of the data
+
+        def __init__(self, fd):
+            self.fd = fd
+
+        def recv(self, size):
+            return self.fd.read1(size) if hasattr(self.fd, 'read1') else self.fd.read(1)
+
+        def sendall(self, data):
+            self.fd.write(data)
+            self.fd.flush()
+
+
 if __name__ == '__main__':
     greentest.main()
@@ -6,6 +6,7 @@ import gevent
 from gevent.server import StreamServer
 import errno
 import os
+import signal
 
 # Timeouts very flaky on appveyor
 _DEFAULT_SOCKET_TIMEOUT = 0.1 if not greentest.RUNNING_ON_APPVEYOR else 1.0
@@ -338,6 +339,37 @@ class TestDefaultSpawn(TestCase):
         gevent.sleep(0.1)
         assert self.server.started
 
+    def test_accept_counters(self):
+        self.init_server()
+        self.assertRequestSucceeded()
+        self.assertRequestSucceeded()
+        self.assertGreaterEqual(self.server.accept_count, 2)
+        self.assertGreaterEqual(self.server.accept_wakeups, 1)
+        self.assertGreaterEqual(self.server.accept_batch, 1)
+        self.assertLessEqual(self.server.accept_batch, self.server.max_accept)
+
+    def test_accept_batch_adapts(self):
+        self.init_server()
+        server = self.server
+        server.accept_batch = 8
+        # The backlog was deeper than the batch: grow.
+        server._adapt_accept_batch(8, False)
+        self.assertEqual(server.accept_batch, 16)
+        self.assertEqual(server.accept_saturated, 1)
+        # Limited by the pool rather than the backlog: no change.
+        server._adapt_accept_batch(4, False, True)
+        self.assertEqual(server.accept_batch, 16)
+        # The backlog was emptied early: shrink.
+        server._adapt_accept_batch(1, True)
+        self.assertEqual(server.accept_batch, 8)
+        # Never above max_accept or below 1.
+        server.accept_batch = server.max_accept
+        server._adapt_accept_batch(server.max_accept, False)
+        self.assertEqual(server.accept_batch, server.max_accept)
+        for _ in range(10):
+            server._adapt_accept_batch(0, True)
+        self.assertEqual(server.accept_batch, 1)
+
     def test_server_repr_when_handle_is_instancemethod(self):
         # PR 501
         self.init_server()
@@ -421,6 +453,61 @@ class ExpectedError(Exception):
     pass
 
 
+if hasattr(os, 'fork'):
+
+    from gevent.server import PreforkServer
+
+    class TestPreforkServer(TestCase):
+
+        __timeout__ = 10
+
+        def get_spawn(self):
+            return gevent.spawn
+
+        def setUp(self):
+            super(TestPreforkServer, self).setUp()
+            self.server = self.ServerSubClass(('127.0.0.1', 0))
+            self.prefork = PreforkServer(self.server, workers=2)
+
+        def cleanup(self):
+            if self.prefork.started:
+                self.prefork.stop(timeout=1)
+            self.server = None
+
+        def test_workers_serve(self):
+            self.prefork.start()
+            self.assertEqual(len(self.prefork.pids), 2)
+            self.assertRequestSucceeded(timeout=1)
+            self.assertRequestSucceeded(timeout=1)
+            self.prefork.stop(timeout=1)
+            self.assertEqual(self.prefork.pids, [])
+            self.assertFalse(self.prefork.started)
+
+        def test_dead_worker_replaced(self):
+            self.prefork.respawn_delay = 0
+            self.prefork.start()
+            dead = self.prefork.pids[0]
+            os.kill(dead, signal.SIGKILL)
+            with gevent.Timeout(5):
+                while dead in self.prefork.pids or len(self.prefork.pids) < 2:
+                    gevent.sleep(0.05)
+            self.assertRequestSucceeded(timeout=1)
+
+        def test_rolling_restart(self):
+            self.prefork.start()
+            old = set(self.prefork.pids)
+            self.prefork.restart()
+            new = set(self.prefork.pids)
+            self.assertEqual(len(new), 2)
+            self.assertFalse(old & new)
+            self.assertRequestSucceeded(timeout=1)
+
+        def test_reuse_port_needs_port(self):
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                return
+            self.assertRaises(ValueError, PreforkServer, self.server, reuse_port=True)
+
+
 if hasattr(socket, 'ssl'):
 
     class TestSSLSocketNotAllowed(TestCase):
@@ -439,6 +526,43 @@ if hasattr(socket, 'ssl'):
             self.assertRaises(TypeError, self.ServerSubClass, listener)
 
 
+class TestDatagramBatch(greentest.TestCase):
+
+    def _test(self, use_mmsg):
+        from gevent.server import DatagramServer
+        batches = []
+
+        def handle(batch):
+            batches.append(batch)
+            server.sendto_many([(b'reply-' + data, address) for data, address in batch])
+
+        server = DatagramServer(('127.0.0.1', 0), handle)
+        server.batch_size = 4
+        server.start()
+        if not use_mmsg:
+            server._receiver = None
+        client = socket.socket(type=socket.SOCK_DGRAM)
+        try:
+            for i in range(6):
+                client.sendto(('%d' % i).encode('ascii'), ('127.0.0.1', server.server_port))
+            replies = set()
+            with gevent.Timeout(_DEFAULT_TEST_TIMEOUT):
+                while len(replies) < 6:
+                    replies.add(client.recvfrom(100)[0])
+        finally:
+            client.close()
+            server.close()
+        self.assertEqual(replies, set([('reply-%d' % i).encode('ascii') for i in range(6)]))
+        self.assertTrue(all(len(batch) <= 4 for batch in batches), batches)
+        self.assertEqual(sum(len(batch) for batch in batches), 6)
+
+    def test_batch(self):
+        self._test(True)
+
+    def test_batch_fallback(self):
+        self._test(False)
+
+
 # test non-socket.error exception in accept call: fatal
 # test error in spawn(): non-fatal
 # test error in spawned handler: non-fatal
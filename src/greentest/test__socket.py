@@ -2,6 +2,8 @@ from gevent import monkey; monkey.patch_all()
 import sys
 import os
 import array
+import errno
+import io
 import socket
 import traceback
 import time
@@ -120,6 +122,28 @@ class TestTCP(greentest.TestCase):
         data = b''
         self._test_sendall(data, data, client_method='send')
 
+    if hasattr(socket.socket, 'sendall_vectored'):
+        # Python 3 gevent sockets only
+
+        def test_sendall_vectored(self):
+            data = self.long_data
+            buffers = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+            self._test_sendall(buffers, client_method='sendall_vectored')
+
+        def test_sendall_vectored_mixed(self):
+            buffers = [b'', bytearray(b'abc'), memoryview(b'def'), array.array('B', b'ghi'), b'']
+            self._test_sendall(buffers, b'abcdefghi', client_method='sendall_vectored')
+
+        def test_sendall_vectored_many(self):
+            # More buffers than one sendmsg call accepts
+            buffers = [b'x'] * 5000
+            self._test_sendall(buffers, b'x' * 5000, client_method='sendall_vectored')
+
+        def test_sendall_vectored_with_timeout(self):
+            data = self.long_data
+            buffers = [data[:10], data[10:]]
+            self._test_sendall(buffers, client_method='sendall_vectored', timeout=10)
+
     def test_fullduplex(self):
 
         N = 100000
@@ -230,6 +254,55 @@ class TestTCP(greentest.TestCase):
         fd.close()
         acceptor.join()
 
+    if six.PY3:
+        # Python 2 uses the standard file object
+        def test_pooled_reader_buffer_released_when_empty(self):
+            done = []
+
+            def accept_once():
+                conn, addr = self.listener.accept()
+                conn.sendall(b'hello\nworld\n' + b'x' * 10000)
+                while not done:
+                    time.sleep(0.01)
+                conn.close()
+
+            acceptor = Thread(target=accept_once)
+            client = self.create_connection()
+            # The standard reader by default; the pooled one on request
+            fd = client.makefile(mode='rb')
+            self.assertIsInstance(fd, io.BufferedReader)
+            fd.close()
+            from gevent._socket3 import _BufferPool
+            fd = _BufferPool().makefile(client)
+            self.assertEqual(fd.readline(), b'hello\n')
+            self.assertIsNotNone(fd._buf)
+            self.assertEqual(fd.readline(), b'world\n')
+            self.assertEqual(fd.read(10000), b'x' * 10000)
+            # Nothing buffered while waiting for more
+            self.assertIsNone(fd._buf)
+            done.append(1)
+            self.assertEqual(fd.read(), b'')
+            fd.detach().close()
+            self.assertRaises(ValueError, getattr, fd, 'closed')
+            client.close()
+            acceptor.join()
+
+        def test_read_after_close(self):
+            client_sock = []
+            acceptor = Thread(target=lambda: client_sock.append(self.listener.accept()))
+            client = self.create_connection()
+            acceptor.join()
+            client_sock[0][0].close()
+            client.close()
+            # Give the loop a chance to take the watchers back
+            time.sleep(0.01)
+            with self.assertRaises(socket.error) as exc:
+                client.recv(1)
+            self.assertEqual(exc.exception.errno, errno.EBADF)
+            with self.assertRaises(socket.error) as exc:
+                client._wait(client._read_event)
+            self.assertEqual(exc.exception.errno, errno.EBADF)
+
     def test_attributes(self):
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, 0)
         self.assertEqual(socket.AF_INET, s.type)
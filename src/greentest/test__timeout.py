@@ -147,5 +147,52 @@ class Test(greentest.TestCase):
         assert r is None, r
 
 
+class TestTimerWheel(greentest.TestCase):
+
+    def setUp(self):
+        super(TestTimerWheel, self).setUp()
+        get_hub().timer_resolution = 0.001
+
+    def tearDown(self):
+        get_hub().__dict__.pop('timer_resolution', None)
+        super(TestTimerWheel, self).tearDown()
+
+    def test_many(self):
+        hub = get_hub()
+        wheel = hub.timer_wheel
+        timeouts = [gevent.Timeout(SHOULD_EXPIRE * (i % 5 + 1)) for i in range(1000)]
+        for timeout in timeouts:
+            timeout.start()
+        self.assertEqual(len(wheel), 1000)
+        for timeout in timeouts[::2]:
+            timeout.cancel()
+        self.assertEqual(len(wheel), 500)
+        for timeout in timeouts:
+            timeout.cancel()
+        self.assertEqual(len(wheel), 0)
+        gevent.sleep(SHOULD_NOT_EXPIRE * 3)
+
+    def test_order(self):
+        fired = []
+        hub = get_hub()
+        timers = [hub.timer(SHOULD_EXPIRE * i) for i in (3, 1, 2)]
+        for timer in timers:
+            timer.start(fired.append, timer.seconds)
+        gevent.sleep(SHOULD_EXPIRE * 4)
+        self.assertEqual(fired, [SHOULD_EXPIRE, SHOULD_EXPIRE * 2, SHOULD_EXPIRE * 3])
+        self.assertFalse(any(timer.active for timer in timers))
+
+    def test_off_by_default(self):
+        del get_hub().timer_resolution
+        # Unless asked for, sleep and Timeout keep libev timers.
+        timer = gevent.Timeout(SHOULD_EXPIRE).timer
+        self.assertTrue(hasattr(timer, 'again'))
+
+    def test_priority(self):
+        # Other priorities still get a libev timer
+        timer = get_hub().timer(SHOULD_EXPIRE, priority=1)
+        self.assertEqual(timer.priority, 1)
+
+
 if __name__ == '__main__':
     greentest.main()
@@ -0,0 +1,60 @@
+import time
+import greentest
+import gevent
+from gevent import tracer
+from gevent.tracer import GreenletTracer
+from six import StringIO
+
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+    gevent.sleep(0)
+    while time.time() < end + seconds:
+        pass
+
+
+class Test(greentest.TestCase):
+
+    def tearDown(self):
+        tracer.stop()
+        super(Test, self).tearDown()
+
+    def test_accounting(self):
+        t = tracer.start(reset=True)
+        greenlets = [gevent.spawn(busy, 0.02) for _ in range(3)]
+        gevent.joinall(greenlets)
+        self.assertIs(tracer.stop(), t)
+
+        stats = t.function_stats()['busy']
+        self.assertEqual(stats['greenlets'], 3)
+        self.assertGreaterEqual(stats['switches'], 6)
+        self.assertGreaterEqual(stats['runtime'], 0.1)
+
+        glet_stats = t.greenlet_stats(greenlets[0])
+        self.assertEqual(glet_stats['function'], 'busy')
+        self.assertEqual(glet_stats['switches'], 2)
+        self.assertIn('test__tracer.py', glet_stats['spawn_site'])
+
+        out = StringIO()
+        tracer.dump(out)
+        self.assertIn('busy', out.getvalue())
+        self.assertIn('spawned at', out.getvalue())
+
+    def test_sampling(self):
+        t = GreenletTracer(sample_rate=0.5, sample_period=0.1)
+        t.start()
+        try:
+            gevent.sleep(0.35)
+        finally:
+            t.stop()
+        self.assertGreaterEqual(t.traced_time, 0.1)
+        self.assertLess(t.traced_time, 0.3)
+
+    def test_bad_sample_rate(self):
+        self.assertRaises(ValueError, GreenletTracer, sample_rate=0)
+
+
+if __name__ == '__main__':
+    greentest.main()